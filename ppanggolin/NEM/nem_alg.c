@@ -59,6 +59,9 @@ Vers-mod  Date         Who Description
 1.06-r    03-NOV-1998  MD  Process case 0 < cumnum < EPSILON
 1.06-t    01-DEV-1998  MD  pkfki and cinumv now double (was float)
 1.08-a    20-JUI-2017  GG   Add param input by file rather than by arguments
+1.08-c    19-OCT-2026  GG   Pack binary data and call DensBernoulliBits
+1.08-d    19-OCT-2026  GG   OpenMP parallel site update (UPDATE_PARA) and densities
+1.08-e    19-OCT-2026  GG   Criteria weighted by the weights of the points
 \*/
 
 #include "nem_typ.h"    /* DataT, ... */
@@ -109,6 +112,7 @@ typedef struct
     float*      ColdM ;     /* clas. of previous XEM iteration [npt,nk] */
     double*     CiNumV;     /* numerator of cik's for one i [nk] */ /*V1.06-t*/
     PtNeighsT   Neighs;     /* neigh. ind/wei, NeighsV [SpatialP->MaxNeighs] */
+    const float* WeightV ;  /* weight of each point [npt] or NULL */ /*V1.08-e*/
 }
 WorkingT ;
 
@@ -450,6 +454,21 @@ EstimBeta
      ) ;
 
 
+    static void UpdateSitesParallel                            /*V1.08-d*/
+      (
+          const int           Nk,         /* I */
+          const ModelParaT*   ParaP,      /* I */
+          const DataT*        DataP,      /* I */
+          const SpatialT*     SpatialP,   /* I */
+          const NemParaT*     NemParaP,   /* I */
+          GetNeighFT*         FGetNeigh,  /* I */
+          const double*       PkfkiM,     /* I */
+          const float*        CtmpM,      /* I : previous classification */
+          float*              CM,         /* O */
+          WorkingT*           WorkP       /* T : KmaxesV */
+      ) ;
+
+
 /* Called by ComputePartitionGEM */
 
     static int Multinomial(int km, const float *tk) ;
@@ -723,6 +742,30 @@ static void ModelPreprocess
     default:
       DataP->SortPos_ND = NULL ;
     }
+
+  /* Pack binary data in 64 bits words for DensBernoulliBits */ /*V1.08-c*/
+  DataP->Bits_NW = NULL ;
+  DataP->NbWords = ( nd + 63 ) / 64 ;
+  if ( SpecP->ClassFamily == FAMILY_BERNOULLI )
+    {
+      int binary = TRUE ;
+
+      for ( ipt = 0 ; ( ipt < npt * nd ) && binary ; ipt ++ )
+	if ( ( DataP->PointsM[ ipt ] != 0.0 ) && ( DataP->PointsM[ ipt ] != 1.0 ) )
+	  binary = FALSE ;  /* also FALSE for missing data (NaN) */
+
+      if ( binary )
+	{
+	  DataP->Bits_NW = GenAlloc( npt * DataP->NbWords, 
+				     sizeof( unsigned long long ), 
+				     1, func, "Bits_NW" ) ;
+	  for ( ipt = 0 ; ipt < npt ; ipt ++ )
+	    for ( d = 0 ; d < nd ; d ++ )
+	      if ( DataP->PointsM[ ( ipt * nd ) + d ] == 1.0 )
+		DataP->Bits_NW[ ( ipt * DataP->NbWords ) + ( d >> 6 ) ] |= 
+		  1ULL << ( d & 63 ) ;
+	}
+    }
 }
 
 
@@ -1027,6 +1070,7 @@ static int ClassifyByNemOneBeta                             /*V1.04-a*/
         working.Neighs.NbNeigh  = SpatialP->MaxNeighs ;
         working.Neighs.NeighsV  = GenAlloc( SpatialP->MaxNeighs, sizeof( NeighT ), 
 					    0, func, "NeighsV" ) ;
+        working.WeightV         = DataP->Weight_N ;  /*V1.08-e*/
     }
 
 #ifdef __TURBOC__
@@ -2270,6 +2314,21 @@ static StatusET ComputePkFkiM
 	    err = STS_W_EMPTYCLASS ;
 	  }
 
+        /* Binary data and center : XOR/popcount on packed words */ /*V1.08-c*/
+        if ( ( DataP->Bits_NW != NULL ) &&
+             ( SpecP->ClassFamily == FAMILY_BERNOULLI ) &&
+             ( DensBernoulliBits( DataP, k, ParaP, nk, 
+                                  & PkFkiM[ k ], & LogPkFkiM[ k ] ) == 0 ) )
+        {
+            for ( i = 0 ; i < npt ; i ++ )
+            {
+                PkFkiM   [ ( i * nk ) + k ] = pk * PkFkiM[ ( i * nk ) + k ] ;
+                LogPkFkiM[ ( i * nk ) + k ] = logpk + LogPkFkiM[ ( i * nk ) + k ] ;
+            }
+            continue ;
+        }
+
+#pragma omp parallel for schedule( static )  /*V1.08-d*/
         for ( i = 0 ; i < npt ; i ++ )
         {
             double fki ;
@@ -2366,6 +2425,18 @@ static int ComputePartitionNEM
         /* Save last computed value of partition in temporary buffer */
         memcpy( ctmpM, CM, npt * nk * sizeof( float ) ) ;
 
+        /* Several threads : parallel update of the sites */ /*V1.08-d*/
+        if ( ( NemParaP->NbThreads > 1 ) && 
+             ( NemParaP->SiteUpdate == UPDATE_PARA ) ) {
+
+          UpdateSitesParallel( nk, ParaP, DataP, SpatialP, NemParaP, 
+                               fGetNeigh, pkfkiM, ctmpM, CM, WorkP ) ;
+
+	  WriteLogCrit( Flog, npt, nk, ParaP->Beta, CM, SpatialP, 
+			WorkP, CriterP ) ;
+          continue ;
+        }
+
         /* For each point xi */
         for ( ivis = 0 ; ivis < npt ; ivis ++ ) {
 
@@ -2407,6 +2478,77 @@ static int ComputePartitionNEM
 
 
 
+/* ------------------------------------------------------------------- */
+static void UpdateSitesParallel                                /*V1.08-d*/
+      (
+          const int           Nk,         /* I */
+          const ModelParaT*   ParaP,      /* I */
+          const DataT*        DataP,      /* I */
+          const SpatialT*     SpatialP,   /* I */
+          const NemParaT*     NemParaP,   /* I */
+          GetNeighFT*         FGetNeigh,  /* I */
+          const double*       PkfkiM,     /* I */
+          const float*        CtmpM,      /* I : previous classification */
+          float*              CM,         /* O */
+          WorkingT*           WorkP       /* T : KmaxesV */
+      )
+/* ------------------------------------------------------------------- */
+{
+  const char* func = "UpdateSitesParallel" ;
+
+  int   npt = DataP->NbPts ;
+  int   ivis ;
+
+  /* Each site only reads the previous classification of its neighbors :
+     the sites are shared between the threads, which have their own 
+     working buffers (the result does not depend on the number of threads) */
+#pragma omp parallel
+  {
+    PtNeighsT   neighs ;
+    double*     cinumV ;
+
+    neighs.NbNeigh = SpatialP->MaxNeighs ;
+    neighs.NeighsV = GenAlloc( SpatialP->MaxNeighs + 1, sizeof( NeighT ), 
+			       1, func, "NeighsV" ) ;
+    cinumV         = GenAlloc( Nk, sizeof( double ), 1, func, "cinumV" ) ;
+
+#pragma omp for schedule( static )
+    for ( ivis = 0 ; ivis < npt ; ivis ++ ) {
+
+      int ipt = DataP->SiteVisitV[ ivis ] ;
+
+      if ( ( NemParaP->InitMode   != INIT_LABEL ) || 
+	   ( DataP->LabelV[ ipt ] == 0 ) ) 
+	ComputeLocalProba( ipt, Nk, ParaP, &(SpatialP->NeighData), 
+			   FGetNeigh, PkfkiM, CtmpM, &CM[ ipt * Nk ], 
+			   &neighs, cinumV ) ;
+    }
+
+    GenFree( neighs.NeighsV ) ;
+    GenFree( cinumV ) ;
+  }
+
+  /* Eventual C-step, in the order of visit (ties drawn at random) */
+  if ( NemParaP->Algo == ALGO_NCEM ) {
+
+    for ( ivis = 0 ; ivis < npt ; ivis ++ ) {
+
+      int ipt = DataP->SiteVisitV[ ivis ] ;
+
+      if ( ( NemParaP->InitMode   != INIT_LABEL ) || 
+	   ( DataP->LabelV[ ipt ] == 0 ) ) {
+	int kmap = ComputeMAP( CM , ipt , Nk , NemParaP->TieRule, 
+			       WorkP->KmaxesV ) ;
+
+	LabelToClassVector( Nk, kmap, &CM[ ipt * Nk ] ) ;
+      }
+    }
+  }
+
+}   /* end of UpdateSitesParallel() */
+
+
+
 /* ------------------------------------------------------------------- */
 /* Compute fuzzy (or hard) partition with fixed parameters, using
    Monte-Carlo simulations */ /*1.04-h*/
@@ -2606,6 +2748,7 @@ static int ComputeLocalProba
     for ( k = 0 ; k < Nk ; k ++ )
       Cout_K[ k ] = invZ ;
 
+#pragma omp critical  /*V1.08-d*/
     if ( first ) {
       first = FALSE ;
       fprintf( out_stderr, "Warning : pt %d density = 0\n", Ipt ) ;
@@ -2706,11 +2849,12 @@ static StatusET ComputeCrit
     CriterP->L = 0.0 ; /* L = sum[i] log( sum[k] pkfki ) = sum[i] log fi */
     CriterP->Z = 0.0 ; /* Z =-sum[i] log(sum[k] exp(bta * sum[j~i] wij cjk)) */
 
-    /* For each point i */
+    /* For each point i (counted as many times as its weight) */
     for ( i = 0 ; i < Npt ; i ++ )
     {
         double fi ;  /* fi = sum[k] pkfki */
 	float zi ;  /* zi = sum[k] exp(bta * sum[j~i] wij cjk) */
+	float wi = ( WorkP->WeightV != NULL ) ? WorkP->WeightV[ i ] : 1.0 ; /*V1.08-e*/
 
         /* Get point i's neighbors */
         int nbn = fGetNeigh( i, & SpatialP->NeighData, &(WorkP->Neighs) ) ;
@@ -2731,8 +2875,8 @@ static StatusET ComputeCrit
                 float dik = cik * ( logpkfki - log( cik ) ) ;
                 float gik = cik * pik ;
 
-                CriterP->D = CriterP->D + dik ;
-                CriterP->G = CriterP->G + gik ;
+                CriterP->D = CriterP->D + wi * dik ;
+                CriterP->G = CriterP->G + wi * gik ;
             }
             /* Else point i for class k has no contribution to criteria D/G*/
 
@@ -2741,8 +2885,8 @@ static StatusET ComputeCrit
 
         } /* end   For each class k */
 
-	CriterP->L = CriterP->L + log( fi ) ;
-	CriterP->Z = CriterP->Z - log( zi ) ;
+	CriterP->L = CriterP->L + wi * log( fi ) ;
+	CriterP->Z = CriterP->Z - wi * log( zi ) ;
 
     } /* end   For each point i */
 
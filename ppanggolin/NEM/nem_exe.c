@@ -85,9 +85,17 @@ Vers-mod  Date         Who  Description
 1.07-a    26-FEB-1999  MD   Add Bernoulli family
 1.07-b    26-FEB-1999  MD   Add "\n" at end of final classification file
 1.08-a    20-JUI-2017  GG   Add param input by file rather than by arguments
+1.08-b    19-OCT-2026  GG   Random seed given as argument of nem() (time if < 0)
+1.08-c    19-OCT-2026  GG   Free the bit-packed binary data
+1.08-d    19-OCT-2026  GG   Number of threads given as argument of nem() (> 1 :
+                            parallel site update with OpenMP)
+1.08-e    19-OCT-2026  GG   Read optional point weights (.wei file)
 \*/
 
 #include "nem_exe.h"   /* Prototype of exported mainfunc() */
+#ifdef _OPENMP
+#include <omp.h>       /* omp_set_num_threads */ /*V1.08-d*/
+#endif
 
 /* ==================== LOCAL FUNCTION PROTOTYPING =================== */
 
@@ -230,7 +238,7 @@ void my_strupr( char *s ) ;
 
 
 //VERSION
-const char *NemVersionStrC = "1.08-a";
+const char *NemVersionStrC = "1.08-e";
 
 /* ==================== GLOBAL FUNCTION DEFINITION =================== */
 
@@ -248,7 +256,9 @@ int nem(const char* Fname,
         const char* model_family,
         const char* proportion,
         const char* dispersion,
-        const int init_mode)
+        const int init_mode,
+        const long seed,
+        const int nb_threads)
 /*\
     NEM function.
 \*/
@@ -358,6 +368,7 @@ int nem(const char* Fname,
     NemPara.NeighSpec     = DEFAULT_NEIGHSPEC ;
     NemPara.VisitOrder    = DEFAULT_ORDER ;         /*V1.04-f*/
     NemPara.SiteUpdate    = DEFAULT_UPDATE ;        /*V1.06-d*/
+    NemPara.NbThreads     = 1 ;                     /*V1.08-d*/
     NemPara.TieRule       = DEFAULT_TIE ;           /*V1.06-e*/
     NemPara.Debug         = FALSE ;                 /*V1.04-g*/
     strncpy( NemPara.OutBaseName, Fname, LEN_FILENAME ) ;
@@ -433,6 +444,19 @@ int nem(const char* Fname,
     NemPara.NeighSpec = NEIGH_FILE;
     //-----
     NemPara.InitMode = init_mode;
+    //-----
+    if ( seed >= 0 )                                 /*V1.08-b*/
+        NemPara.Seed = seed ;
+    //-----
+    if ( nb_threads > 1 )                            /*V1.08-d*/
+      {
+        /* Jacobi update : each site only reads the previous classification */
+        NemPara.NbThreads  = nb_threads ;
+        NemPara.SiteUpdate = UPDATE_PARA ;
+      }
+#ifdef _OPENMP
+    omp_set_num_threads( NemPara.NbThreads ) ;
+#endif
 
     strncpy( NemPara.OutName, NemPara.OutBaseName, LEN_FILENAME ) ;
     strncat( NemPara.OutName, 
@@ -489,6 +513,31 @@ int nem(const char* Fname,
         }
     }
 
+    /* Eventually read weights of points (each point then stands for
+       several identical observations) */ /*V1.08-e*/
+    {
+          char  namewei[ LEN_FILENAME + 1 ] ;
+          FILE* fwei ;
+          int   i ;
+
+          strncpy( namewei , Fname , LEN_FILENAME ) ;
+          strncat( namewei , EXT_WEIGHTS, LEN_FILENAME ) ;
+          Data.Weight_N   = NULL ;
+          Data.SumWeights = Data.NbPts ;
+          if ( ( fwei = fopen( namewei, "r" ) ) != NULL )
+          {
+              fclose( fwei ) ;
+              fprintf( out_stderr, "Reading weights of points ...\n" ) ;
+              if ( ( err = ReadMatrixFile( namewei,
+                                           Data.NbPts,
+                                           1,
+                                           &Data.Weight_N ) ) != STS_OK )
+                 return err ;
+              for ( i = 0, Data.SumWeights = 0.0 ; i < Data.NbPts ; i ++ )
+                  Data.SumWeights += Data.Weight_N[ i ] ;
+          }
+    }
+
     /* Allocate and set sites visit order */
     if ( ( err = SetVisitOrder( Data.NbPts,   /*V1.04-e*/
                 NemPara.VisitOrder,
@@ -1843,6 +1892,8 @@ static void FreeAllocatedData
   GenFree( DataP->LabelV ) ;      DataP->LabelV     = NULL ;
   GenFree( DataP->SiteVisitV ) ;  DataP->SiteVisitV = NULL ;
   GenFree( DataP->SortPos_ND ) ;  DataP->SortPos_ND = NULL ;
+  GenFree( DataP->Bits_NW ) ;     DataP->Bits_NW    = NULL ;  /*V1.08-c*/
+  GenFree( DataP->Weight_N ) ;    DataP->Weight_N   = NULL ;  /*V1.08-e*/
 
   /* Free components of SpatialP */
   switch( SpatialP->Type )
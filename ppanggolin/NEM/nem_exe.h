@@ -32,5 +32,7 @@ extern int nem(const char* Fname,
         const char* model_family,
         const char* proportion,
         const char* dispersion,
-        const int init_mode);
+        const int init_mode,
+        const long seed,
+        const int nb_threads);
 #endif
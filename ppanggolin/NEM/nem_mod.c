@@ -27,6 +27,11 @@
     1.07-a    26-FEB-1999  Add FAMILY_BERNOULLI in GetDensityFunc and EstimPara
     1.07-b    26-FEB-1999  Add DensBernoulli
     1.07-c    03-MAR-1999  Fix bug DensBernoulli: disp==0 may give nonzero dens
+    1.08-c    19-OCT-2026  Add DensBernoulliBits (XOR/popcount on bit-packed data)
+    1.08-d    19-OCT-2026  OpenMP loops over points (densities) and over classes/
+                           variables (Laplace/Bernoulli M-step), same results
+                           whatever the number of threads
+    1.08-e    19-OCT-2026  Weighted points in EstimPara (cik * weight of i)
 \*/
 
 #include "genmemo.h"    /* GenAlloc */
@@ -47,6 +52,17 @@
 #define _IH       ( ( i * K ) + h )    /* access a (.,K) matrix by (i,h) */
 #define sqr(x)    ((x)*(x))            /* macro for x^2 */
 
+/*V1.08-c*/
+#if defined( __GNUC__ ) || defined( __clang__ )
+  #define POPCOUNT64( x )  __builtin_popcountll( x )
+  #define CTZ64( x )       __builtin_ctzll( x )
+#else
+  static int POPCOUNT64( unsigned long long x )
+  { int n ; for ( n = 0 ; x ; n ++ ) x &= x - 1 ; return n ; }
+  static int CTZ64( unsigned long long x )
+  { int n ; for ( n = 0 ; ! ( x & 1ULL ) ; n ++ ) x >>= 1 ; return n ; }
+#endif
+
 #ifndef MAXFLOAT
  #ifdef FLT_MAX
    #define MAXFLOAT FLT_MAX
@@ -411,6 +427,123 @@ int GetDensityFunc  /* STS_OK or STS_E_FUNCARG */
 
 
 
+/* ------------------------------------------------------------------- */
+int DensBernoulliBits  /* ret : 0 if OK, -1 if the class center is not binary */
+        (                                                         /*V1.08-c*/
+            const DataT*       DataP,      /* I : points packed in Bits_NW */
+            int                Ik,         /* I : class number : 0..Nk-1 */
+            const ModelParaT*  ParaP ,     /* I : model parameters */
+            int                Stride,     /* I : offset between two points */
+            double*            FkV,        /* O : density of each point */
+            float*             LogFkV      /* O : log of density */
+        )
+/* ------------------------------------------------------------------- */
+{
+  const char* func = "DensBernoulliBits" ;
+
+  int                 nd  = DataP->NbVars ;
+  int                 nw  = DataP->NbWords ;
+  const float*        centerV = & ParaP->Center_KD[ Ik * nd ] ;
+  const float*        dispV   = & ParaP->Disp_KD[ Ik * nd ] ;
+  unsigned long long* cbitsV ; /* packed center of the class */
+  unsigned long long* nulV ;   /* packed variables of null dispersion */
+  double*             weightV ;/* log{(1-vkd)/vkd} of each variable */
+  double              base ;   /* sum_d -log(1-vkd) */
+  int                 samedisp ;
+  int                 d ;
+  int                 w ;
+  int                 ipt ;
+
+  /* Same density as DensBernoulli when x and the center are 0/1 :
+
+     log fk(x) = - sum_d [ -log(1-vkd) ] - sum_{d : xd != mkd} log((1-vkd)/vkd)
+
+     With the same dispersion vk in all the variables (models s__ and sk_)
+     the second sum is vk times the number of mismatches, obtained by
+     popcount( x XOR mk ) on the packed words. Otherwise (s_d, skd) the
+     weights are summed over the set bits of x XOR mk only.
+  */
+
+  for ( d = 0 ; d < nd ; d ++ )
+    {
+      if ( ( centerV[ d ] != 0.0 ) && ( centerV[ d ] != 1.0 ) )
+	return -1 ;
+    }
+
+  cbitsV  = GenAlloc( nw, sizeof( unsigned long long ), 1, func, "cbitsV" ) ;
+  nulV    = GenAlloc( nw, sizeof( unsigned long long ), 1, func, "nulV" ) ;
+  weightV = GenAlloc( nd, sizeof( double ), 1, func, "weightV" ) ;
+
+  for ( d = 0, base = 0.0, samedisp = TRUE ; d < nd ; d ++ )
+    {
+      if ( centerV[ d ] == 1.0 )
+	cbitsV[ d >> 6 ] |= 1ULL << ( d & 63 ) ;
+      if ( dispV[ d ] > EPSILON )
+	{
+	  weightV[ d ] = log( ( 1 - dispV[ d ] ) / dispV[ d ] ) ;
+	  base = base - log( 1 - dispV[ d ] ) ;
+	}
+      else  /* null dispersion : prob(xid != center) = 0 */
+	nulV[ d >> 6 ] |= 1ULL << ( d & 63 ) ;
+      if ( dispV[ d ] != dispV[ 0 ] )
+	samedisp = FALSE ;
+    }
+
+#pragma omp parallel for private( w ) schedule( static )  /*V1.08-d*/
+  for ( ipt = 0 ; ipt < DataP->NbPts ; ipt ++ )
+    {
+      const unsigned long long* xV = & DataP->Bits_NW[ ipt * nw ] ;
+      double dk      = base ;
+      int    nuldens = 0 ;
+
+      if ( samedisp )
+	{
+	  int nbdif ;
+
+	  for ( w = 0, nbdif = 0 ; w < nw ; w ++ )
+	    nbdif += POPCOUNT64( xV[ w ] ^ cbitsV[ w ] ) ;
+
+	  if ( dispV[ 0 ] > EPSILON )
+	    dk = dk + nbdif * weightV[ 0 ] ;
+	  else
+	    nuldens = ( nbdif != 0 ) ;
+	}
+      else
+	{
+	  for ( w = 0 ; ( w < nw ) && ! nuldens ; w ++ )
+	    {
+	      unsigned long long dif = xV[ w ] ^ cbitsV[ w ] ;
+
+	      if ( dif & nulV[ w ] )
+		nuldens = 1 ;
+	      for ( ; dif ; dif &= dif - 1 )
+		dk = dk + weightV[ ( w << 6 ) + CTZ64( dif ) ] ;
+	    }
+	}
+
+      if ( ! nuldens )
+	{
+	  LogFkV[ ipt * Stride ] = - dk ;
+	  FkV[ ipt * Stride ]    = exp( - dk ) ;
+	}
+      else
+	{
+	  LogFkV[ ipt * Stride ] = - MAXFLOAT ;
+	  FkV[ ipt * Stride ]    = 0.0 ;
+	}
+    }
+
+  GenFree( cbitsV ) ;
+  GenFree( nulV ) ;
+  GenFree( weightV ) ;
+
+  return 0 ;
+
+}   /* end of DensBernoulliBits() */
+
+
+
+
 /* ------------------------------------------------------------------- */
 StatusET            /* ret : OK, W_EMPTYCLASS or E_MEMORY */ /*V1.06-b*/
 EstimPara 
@@ -426,9 +559,24 @@ EstimPara
 )
 /* ------------------------------------------------------------------- */
 {
+  const char* func = "EstimPara" ;
+
   StatusET    sts ;  /* return status */
 
   int         k ;
+  float*      cwei_NK = NULL ;  /* cik * weight of i if weighted points */
+
+  /* A point of weight w counts as w identical points : the estimation
+     uses the classification matrix multiplied by the weights */ /*V1.08-e*/
+  if ( DataP->Weight_N != NULL ) {
+    int i ;
+
+    cwei_NK = GenAlloc( DataP->NbPts * Nk, sizeof( float ), 1, func, "cwei_NK" ) ;
+    for ( i = 0 ; i < DataP->NbPts ; i ++ )
+      for ( k = 0 ; k < Nk ; k ++ )
+	cwei_NK[ i * Nk + k ] = C_NK[ i * Nk + k ] * DataP->Weight_N[ i ] ;
+    C_NK = cwei_NK ;
+  }
 
   /* Family dependent estimation method 
    */
@@ -456,7 +604,8 @@ EstimPara
   if ( SpecP->ClassPropor == PROPOR_K ) {
 
     for ( k = 0; k < Nk ; k ++ )
-      ParaP->Prop_K[ k ] = ParaP->NbObs_K[ k ] / DataP->NbPts ;
+      ParaP->Prop_K[ k ] = ParaP->NbObs_K[ k ] / 
+	( DataP->Weight_N != NULL ? DataP->SumWeights : DataP->NbPts ) ;
   }
   else {
     
@@ -464,6 +613,8 @@ EstimPara
       ParaP->Prop_K[ k ] = 1.0 / Nk ;
   }
 
+  GenFree( cwei_NK ) ;
+
   return sts ;
   /*???*/
 }   /* end of EstimPara() */
@@ -1289,24 +1440,29 @@ static void EstimSizes
   int      i ;             /* current object   0..N-1 */
 
   
-  /* For each class h and variable j */
+  /* For each class h, class size */ /*V1.08-d*/
+  for ( h = 0 ; h < K ; h ++ ) {
+
+      N_K[ h ] = 0.0 ;
+      for ( i = 0 ; i < N ; i ++ )
+	  N_K[ h ] += C_NK[ _IH ] ;
+  }
+
+  /* For each class h and variable j (each sum computed by one thread) */
+#pragma omp parallel for collapse( 2 ) private( i ) schedule( static )
   for ( h = 0 ; h < K ; h ++ ) {
 
       for ( j = 0 ; j < D ; j ++ ) {
 
 	  /* Initialize the sum[i] quantities to 0 */
-	  N_K[ h ]             = 0.0 ;
 	  N_KD[ _HJ ]          = 0.0 ;
 
-	  /* For each object i, increment class size and
-	     eventually observed data size if xij not nan */
+	  /* For each object i, increment observed data size if xij not nan */
 	  for ( i = 0 ; i < N ; i ++ ) {
 
 	      float cih = C_NK[ _IH ] ;
 	      float xij = X_ND[ _IJ ] ;
 
-	      N_K[ h ] += cih ;
-
 	      if ( ! isnan( xij ) ) {
 		  N_KD[ _HJ ]          += cih ;
 	      }
@@ -1344,21 +1500,30 @@ EstimLaplaceCenters
   int      h ;             /* current class    0..K-1 */
   int      j ;             /* current variable 0..D-1 */
 
-  int      imed ;          /* index of median of observed values */
-  float    medval ;        /* median value (eventually midway) */
-  float    cumwei ;        /* cumulated weights until median observation */
-
 
   /* Set no empty class by default */
   (*EmptyK_P) = 0 ;
   sts         = STS_OK ;
 
+  /* Signal empty classes and the last one */ /*V1.08-d*/
+  for ( h = 0 ; h < K ; h ++ ) {
 
-  /* For each class h and variable j */
+    if ( N_K[ h ] <= EPSILON ) {
+      sts = STS_W_EMPTYCLASS ;
+      (*EmptyK_P) = h + 1 ;
+    }
+  }
+
+  /* For each class h and variable j (each center computed by one thread) */
+#pragma omp parallel for collapse( 2 ) schedule( dynamic )
   for ( h = 0 ; h < K ; h ++ ) {
 
     for ( j = 0 ; j < D ; j ++ ) {
 
+      int      imed ;          /* index of median of observed values */
+      float    medval ;        /* median value (eventually midway) */
+      float    cumwei ;        /* cumulated weights until median observation */
+
       /* If this class size > 0 */
       if ( N_K[ h ] > EPSILON ) {
 	
@@ -1401,11 +1566,8 @@ EstimLaplaceCenters
 	}
 
       }
-      else /* then this class size == 0 */ {
+      else /* then this class size == 0 (signaled above) */ {
 	NewCen_KD[ h * D + j ] = OldCen_KD[ h * D + j ] ;
-	/* signal empty class and which one */
-	sts = STS_W_EMPTYCLASS ;
-	(*EmptyK_P) = h + 1 ;
       }
 
     }
@@ -1665,7 +1827,8 @@ static void EstimLaplaceIner
   int      i ;             /* current object   0..N-1 */
 
   
-  /* For each class h and variable j */
+  /* For each class h and variable j (each sum computed by one thread) */
+#pragma omp parallel for collapse( 2 ) private( i ) schedule( static )  /*V1.08-d*/
   for ( h = 0 ; h < K ; h ++ ) {
 
       for ( j = 0 ; j < D ; j ++ ) {
@@ -5,6 +5,7 @@
     1.05-b    17-JAN-1997  EmptyK_P and StatusET return in ParaP*V*I
     1.06-a    28-JUN-1998  GetDensityFunc <- nem_alg.c and del DensPkVkI
     1.06-b    28-JUN-1998  New EstimPara and del ParaP*V*I
+    1.08-c    19-OCT-2026  Add DensBernoulliBits
 \*/
 
 #include "nem_typ.h"    /* NoiseParaT, ... */
@@ -17,6 +18,18 @@ int GetDensityFunc  /* STS_OK or STS_E_FUNCARG */
         ) ;
 
 
+/*V1.08-c*/
+int DensBernoulliBits  /* ret : 0 if OK, -1 if the class center is not binary */
+        (
+            const DataT*       DataP,      /* I : points packed in Bits_NW */
+            int                Ik,         /* I : class number : 0..Nk-1 */
+            const ModelParaT*  ParaP ,     /* I : model parameters */
+            int                Stride,     /* I : offset between two points */
+            double*            FkV,        /* O : density of each point */
+            float*             LogFkV      /* O : log of density */
+        ) ;
+
+
 StatusET            /* ret : OK, W_EMPTYCLASS or E_MEMORY */ /*V1.06-b*/
 EstimPara 
 (
@@ -37,6 +37,9 @@
     V1.06-k   01-DEC-1998  FkP double* instead of *float in compudensft
     V1.07-a   26-FEB-1999  FAMILY_BERNOULLI added
     1.08-a    20-JUI-2017  GG   Add param input by file rather than by arguments 
+    1.08-c    19-OCT-2026  GG   Bits_NW and NbWords in DataT (bit-packed binary data)
+    1.08-d    19-OCT-2026  GG   Add NbThreads in NemParaT
+    1.08-e    19-OCT-2026  GG   Weight_N and SumWeights in DataT (weighted points)
 \*/
 
 /*
@@ -61,6 +64,7 @@
 #define    EXT_MFNAME       ".mf"
 #define    EXT_LOGNAME      ".log"
 #define    EXT_INITPARAM    ".m"
+#define    EXT_WEIGHTS      ".wei"   /*V1.08-e*/
 
 #define    EPSILON          1e-20  /* to check for FP zero or equality */
 #define    EPSILON_INV      1e20   /* multiply by this for small floats */
@@ -293,6 +297,10 @@ typedef struct
     int         *LabelV ;     /* fixed labels (NbPts) to allocate: 0..k */
     int         *SiteVisitV ; /* site to visit (NbPts) to allocate: 0..Npts-1*/
     int         *SortPos_ND ; /* PointsM[ SortPos_ND[i*D+d]*D+d ] : +++*/
+    unsigned long long *Bits_NW ; /* binary points packed in 64 bits words (NbPts,NbWords) or NULL */ /*V1.08-c*/
+    int         NbWords ;     /* number of words of each packed point */
+    float       *Weight_N ;   /* weight of each point (NbPts) or NULL if all 1 */ /*V1.08-e*/
+    float       SumWeights ;  /* sum of the weights (NbPts if Weight_N NULL) */
 }
 DataT ;         /* Matrix of observed data (each line = 1 point) */
 
@@ -338,6 +346,7 @@ typedef struct
     NeighET NeighSpec ; /* neighborhood specification */
     OrderET VisitOrder ;/* order of visit at E-step */ /*V1.04-e*/
     UpdET   SiteUpdate ;/* site update scheme at E-step */
+    int     NbThreads ; /* nb of OpenMP threads (1 = sequential) */ /*V1.08-d*/
     TieET   TieRule ;   /* rule for equal probabilities when computing MAP */
     int     Debug ;     /* TRUE if in debug mode */    /*V1.04-f*/
     char    OutBaseName[ LEN_FILENAME + 1 ] ; /* base name of output file */
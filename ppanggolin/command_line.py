@@ -3,22 +3,22 @@
 
 from collections import defaultdict, OrderedDict
 from ordered_set import OrderedSet
-import networkx as nx
 import logging
 import sys
 import os
 import argparse
-from random import shuffle, sample
+from random import shuffle, sample, seed as seed_random
 from tqdm import tqdm
 tqdm.monitor_interval = 0
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from time import gmtime, strftime, time
 import subprocess
-import pkg_resources
 import traceback
 import shutil
+import pickle
 from .ppanggolin import *
 from .utils import *
+nx = lazy_import("networkx")
 
 ### PATH AND FILE NAME
 OUTPUTDIR                   = None 
@@ -34,7 +34,15 @@ USHAPE_PLOT_PREFIX          = "/Ushaped_plot"
 MATRIX_PLOT_PREFIX          = "/presence_absence_matrix_plot"
 EVOLUTION_CURVE_PREFIX      = "/evolution_curve"
 EVOLUTION_STATS_FILE_PREFIX = "/evol_stats"
+EVOLUTION_ANALYTIC_FILE_PREFIX = "/evol_analytic"
 SUMMARY_STATS_FILE_PREFIX   = "/summary_stats"
+BETA_SWEEP_FILE_PREFIX      = "/beta_sweep"
+PARTITION_MODEL_FILE        = "/partition_model.pkl"
+EVOLUTION_CHECKPOINT_FILE   = "/evolution_checkpoint.txt"
+EVOLUTION_COMBINATIONS_FILE = "/evolution_combinations.pkl"
+ANNOTATIONS_STORE_FILE      = "/annotations.pkl"
+GFF_CACHE_DIR               = "PPanGGOLiN_gff_cache"
+CHECKPOINT_INTERVAL         = 60 # minimal number of seconds between two checkpoints of the partitioning by chunks
 SCRIPT_R_FIGURE             = "/generate_plots.R"
 
 def plot_Rscript(script_outfile, verbose=True):
@@ -112,6 +120,7 @@ if (file.exists('"""+OUTPUTDIR+EVOLUTION_DIR+EVOLUTION_STATS_FILE_PREFIX+""".txt
     data <- read.csv('"""+OUTPUTDIR+EVOLUTION_DIR+EVOLUTION_STATS_FILE_PREFIX+""".txt', header = TRUE)
     data <- melt(data, id = "nb_org")
     colnames(data) <- c("nb_org","partition","value")
+    data <- data[!is.na(data$value),]
 
     final_state = data[data$nb_org == max(data$nb_org,na.rm=T),]
     final_state = final_state[!duplicated(final_state[,c("nb_org","partition")]), ]
@@ -162,8 +171,8 @@ if (file.exists('"""+OUTPUTDIR+EVOLUTION_DIR+EVOLUTION_STATS_FILE_PREFIX+""".txt
 
 ########################### START PROJECTION #################################
 
-for (org_csv in list.files(path = '"""+OUTPUTDIR+PROJECTION_DIR+"""', pattern = "*.csv$", full.names = T)){
-    org_name <- tools::file_path_sans_ext(basename(org_csv))
+for (org_csv in list.files(path = '"""+OUTPUTDIR+PROJECTION_DIR+"""', pattern = "*.csv(.gz)?$", full.names = T)){
+    org_name <- sub("\\\\.csv(\\\\.gz)?$", "", basename(org_csv))
     data <- read.csv(org_csv, header = T)
     if(org_name=="nb_genes"){
         data.melted = melt(data,id.var="org")
@@ -269,16 +278,20 @@ def resample(index):
                           chunck_size     = options.chunck_size[0],
                           inplace         = False,
                           just_stats      = True,
-                          nb_threads      = 1)
+                          nb_threads      = 1,
+                          seed            = None if options.seed is None else derive_seed(options.seed[0], "evolution", index),
+                          init_from_profiles = options.init_from_profiles,
+                          queue           = queue)
     shutil.rmtree(nem_dir_path)
-    evol.write(",".join([str(len(shuffled_comb[index])),
-                          str(stats["persistent"]) if stats["undefined"] == 0 else "NA",
-                          str(stats["shell"]) if stats["undefined"] == 0 else "NA",
-                          str(stats["cloud"]) if stats["undefined"] == 0 else "NA",
-                          str(stats["core_exact"]),
-                          str(stats["accessory"]),
-                          str(stats["core_exact"]+stats["accessory"])])+"\n")
-    evol.flush()
+    if stats["undefined"] != 0 and options.evolution_analytic:
+        return(None)# no value to write in the evol_stats file
+    return(",".join([str(len(shuffled_comb[index])),
+                     str(stats["persistent"]) if stats["undefined"] == 0 else "NA",
+                     str(stats["shell"]) if stats["undefined"] == 0 else "NA",
+                     str(stats["cloud"]) if stats["undefined"] == 0 else "NA",
+                     str(stats["core_exact"]) if not options.evolution_analytic else "NA",# computed analytically
+                     str(stats["accessory"]) if not options.evolution_analytic else "NA",
+                     str(stats["core_exact"]+stats["accessory"]) if not options.evolution_analytic else "NA"])+"\n")
 
 # def replication(index):
 #     subset = random.sample(pan.organisms, 2)
@@ -306,11 +319,44 @@ def resample(index):
 
 #### END - NEED TO BE AT THE HIGHEST LEVEL OF THE MODULE TO ALLOW MULTIPROCESSING
 
+def ppanggolin_version():
+    """ return the version of the installed ppanggolin package (importlib.metadata is much faster to import than pkg_resources) """
+    try:
+        from importlib.metadata import version
+    except ImportError:# python < 3.8
+        import pkg_resources
+        return(pkg_resources.get_distribution("ppanggolin").version)
+    return(version("ppanggolin"))
+
+def worker(args):
+    """ ppanggolin worker: run the NEM tasks of a queue directory written by a ppanggolin run using -q (several workers can be started on each machine sharing the directory) """
+    parser = argparse.ArgumentParser(prog = "ppanggolin worker",
+                                     description='Run the partitioning of the chunks submitted in a queue directory by a ppanggolin run using -q until this run ends',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-q", "--queue", type=str, nargs=1, metavar=('QUEUE_DIR'), required=True, help="""
+    Dir: the queue directory (shared by all the machines)""")
+    parser.add_argument("-pi", "--poll_interval", type=float, nargs=1, default=[1], metavar=('SECONDS'), help="""
+    Number: number of seconds between two scans of the queue when it is empty""")
+    parser.add_argument("-it", "--idle_timeout", type=float, nargs=1, metavar=('SECONDS'), help="""
+    Number: exit if no task was found during this number of seconds (by default, wait until the end of the ppanggolin run)""")
+    parser.add_argument("-v", "--verbose", default=False, action="store_true", help="""
+    Flag: verbose""")
+    worker_options = parser.parse_args(args)
+
+    logging.basicConfig(stream=sys.stdout, level = logging.DEBUG if worker_options.verbose else logging.INFO, format = '\n%(asctime)s %(filename)s:l%(lineno)d %(levelname)s\t%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    queue = WorkQueue(worker_options.queue[0], poll_interval = worker_options.poll_interval[0])
+    logging.getLogger().info("Waiting for the tasks of "+queue.directory)
+    nb_done = queue.work(idle_timeout = worker_options.idle_timeout[0] if worker_options.idle_timeout else None)
+    logging.getLogger().info(str(nb_done)+" tasks done")
+    exit(0)
+
 def __main__():
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        worker(sys.argv[2:])
     parser = argparse.ArgumentParser(prog = "ppanggolin",
                                      description='Build a partitioned pangenome graph from annotated genomes (GFF files) and gene families (TSV files). Reserved words are: '+' '.join(RESERVED_WORDS), 
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('-?', '--version', action='version', version=pkg_resources.get_distribution("ppanggolin").version)
+    parser.add_argument('-?', '--version', action='version', version=ppanggolin_version())
     parser.add_argument('-o', '--organisms', type=argparse.FileType('r'), nargs=1, metavar=('ORGANISMS_FILE'), help="""
     File: A tab-delimited file containing at least 2 mandatory fields by row and as many optional fields as the number of well assembled circular contigs. 
     Each row corresponds to an organism to be added to the pangenome.
@@ -322,17 +368,21 @@ def __main__():
     The contig ID and gene ID can be any string but must be unique and can't contain any space, quote, double quote, pipe and reserved words.
     (optional). The next fields contain the name of perfectly assembled circular contigs. 
     In this case, it is mandatory to provide the contig size in the gff files either by adding a "region" feature having the correct contig ID attribute or using a '##sequence-region' pragma.
-    """, required=True)
+    (required except with -ms)""")
     parser.add_argument('-gf', '--gene_families', type=argparse.FileType('r'), nargs=1, metavar=('FAMILIES_FILE'), help="""
     File: A tab-delimited file containing the gene families. Each row contains at least 2 fields.
     The first field is the family ID. The further fields are the gene IDs associated with this family.
     The family ID can be any string but must be unique and can't contain any space, quote, double quote and reserved word.
     Gene IDs can be any string corresponding to the ID features in the gff files. They must be uniques and can't contain any spaces, quote, double quote and reserved words.
-    """,  required=True)
+    (required except with -ms)""")
     parser.add_argument('-od', '--output_directory', type=str, nargs=1, default=["PPanGGOLiN_outputdir_"+strftime("%Y-%m-%d_%H.%M.%S", gmtime())], metavar=('OUTPUT_DIR'), help="""
     Dir: The output directory""")
     parser.add_argument('-td', '--temporary_directory', type=str, nargs=1, default=["/tmp/PPanGGOLiN_outputdir_"+strftime("%Y-%m-%d_%H.%M.%S", gmtime())], metavar=('TMP_DIR'), help="""
     Dir: Temporary directory to store nem intermediate files""")
+    parser.add_argument('-sd', '--seed', type=int, nargs=1, metavar=('SEED'), help="""
+    Number: seed all the random generators (sampling of the chunks and of the evolution, NEM runs, layout) so that the results are the same from one run to another whatever the number of cpu""")
+    parser.add_argument('-rs', '--resume', action="store_true", help="""
+    Flag: resume a killed run using the checkpoints of the partitioning by chunks and of the evolution stored in the temporary directory (use the same temporary directory, output directory and parameters than the killed run)""")
     parser.add_argument('-f', '--force', action="store_true", help="""
     Flag: Force overwriting existing output directory""")
     parser.add_argument('-r', '--remove_high_copy_number_families', type=int, nargs=1, default=[0], metavar=('REPETITION_THRESHOLD'), help="""
@@ -343,13 +393,16 @@ def __main__():
     if this argument is not set, the program will raise KeyError exception if a gene id found in a gff file is absent of the gene families file.""")
     #    parser.add_argument("-up", "--update", default = None, type=argparse.FileType('r'), nargs=1, help="""
     # Pangenome Graph to be updated (in gexf format)""")
-    parser.add_argument("-u", "--untangle", type=int, default = 0, nargs=1, help="""
+    parser.add_argument("-u", "--untangle", type=int, default = [0], nargs=1, metavar=('K'), help="""
     Flag: (in test) max size of the untangled paths to be untangled""")
-    parser.add_argument("-b", "--beta_smoothing", default = [float("0.5")], type=float, nargs=1, metavar=('BETA_VALUE'), help = """
+    parser.add_argument("-b", "--beta_smoothing", default = [float("0.5")], type=float, nargs="+", metavar=('BETA_VALUE'), help = """
     Positive Number: This option determines the strength of the smoothing (:math:beta) of the partitions based on the graph topology (using a Markov Random Field). 
     b must be a positive float, b = 0.0 means to discard spatial smoothing and 1.00 means strong smoothing (can be more but it is not advised).
     0.5 is generally advised as a good trade off.
+    If several values are provided, the first one is used to partition the pangenome and all of them are compared in the file beta_sweep.txt (the fits are executed in parallel using the -c option)
     """)
+    parser.add_argument("-bc", "--beta_cold_start", default = False, action="store_true", help = """
+    Flag: (in test) When several values of beta are provided, do not initialize each fit using the parameters fitted for the nearest value of beta already tested""")
     parser.add_argument("-fd", "--free_dispersion", default = False, action="store_true", help = """
     Flag: Specify if the dispersion around the centroid vector of each partition is the same for all the organisms or if the dispersion is free
     """)
@@ -359,12 +412,35 @@ def __main__():
     Flag: Compress (using gzip) the files containing the partionned pangenome graph""")
     parser.add_argument("-c", "--cpu", default=[1],  type=int, nargs=1, metavar=('NB_CPU'), help="""
     Positive Number: Number of cpu to use (several cpu will be used only if the option -e is set or/and if the -ck option is below the number of organisms provided)""")
+    parser.add_argument("-pn", "--parallel_nem", default=False, action="store_true", help="""
+    Flag: When the pangenome is partitioned without chunks (or using -cl), NEM uses NB_CPU threads and updates the families in parallel (if it is compiled with OpenMP) instead of the default sequential update. 
+    The partitions may differ from the ones of the sequential update but do not depend on the number of cpu""")
+    parser.add_argument("-q", "--queue", type=str, nargs=1, metavar=('QUEUE_DIR'), help="""
+    Dir: submit the chunks of the partitioning (including the ones of the evolution) in this directory shared by several machines instead of running them locally. 
+    They are run by workers started on any machine using 'ppanggolin worker -q QUEUE_DIR', the workers exit at the end of the run. 
+    -c then gives the number of chunks submitted at the same time""")
+    parser.add_argument("-qt", "--queue_timeout", type=float, nargs=1, default=[3600], metavar=('SECONDS'), help="""
+    Number: a chunk submitted using -q and claimed by a worker without result after this number of seconds is given to another worker (must be higher than the time required to partition a chunk)""")
+    parser.add_argument("-ip", "--init_from_profiles", default=False, action="store_true", help="""
+    Flag: Initialize the partitioning with smoothing (beta > 0) using a first partitioning without smoothing computed on the unique presence/absence profiles of the families (only if the pangenome is partitioned without chunks, the partitioning with beta = 0 always uses the unique profiles)""")
     parser.add_argument("-v", "--verbose", default=False, action="store_true", help="""
     Flag: Show all messages including debugging ones""")
+    parser.add_argument("-gc", "--gff_cache", type=str, nargs="?", const="", metavar=('CACHE_DIR'), help="""
+    Directory: keep the parsed gff files in a cache directory so that the next runs using the same gff and families files do not parse them again (without value, the directory PPanGGOLiN_gff_cache next to the temporary directory is used)""")
+    parser.add_argument("-gcs", "--gff_cache_max_size", type=int, nargs=1, default=[1024], metavar=('SIZE_MB'), help="""
+    Number: maximum size of the gff cache in MB (the least recently used files are removed)""")
+    parser.add_argument("-st", "--streaming", default=False, action="store_true", help="""
+    Flag: build the graph organism by organism while reading the gff files and store the annotations of each organism in the temporary directory instead of keeping them in memory (to build large pangenomes, the annotations are read again from the disk for the projection or untangling)""")
     # parser.add_argument("-as", "--already_sorted", default=False, action="store_true", help="""
     # Accelerate loading of gff files if there are sorted by the coordinate of gene annotations (starting point) for each contig""")
     #parser.add_argument("-l", "--freemem", default=False, action="store_true", help="""
     #Free the memory elements which are no longer used""")
+    parser.add_argument("-ws", "--write_shard", type=str, nargs=1, metavar=('SHARD_FILE'), help="""
+    File: only build the graph of the organisms listed in the organisms file and write it with their annotations in this shard file, then exit (no partitioning and no output directory). 
+    The shards built by several processes or machines (e.g. each one reading a part of the organisms file and writing its shard in a shared directory) are then merged using -ms""")
+    parser.add_argument("-ms", "--merge_shards", type=str, nargs="+", metavar=('SHARD_FILE'), help="""
+    Files: build the pangenome by merging the shard files written using -ws instead of reading the gff files (-o and -gf are then not required). 
+    Each organism must be in a single shard and the shards must have been built using the same gene families file and the same -r and -s options""")
     parser.add_argument("-p", "--plots", default=False, action="store_true", help="""
     Flag: Run the Rscript generating the plots (required: R in the path and the packages ggplot2, ggrepel, data.table, minpack.lm and reshape2 to be installed).""")
     # parser.add_argument("-di", "--directed", default=False, action="store_true", help="""
@@ -373,6 +449,9 @@ def __main__():
     parser.add_argument("-e", "--evolution", default=False, action="store_true", help="""
     Flag: Partition the pangenome using multiple subsamples of a croissant number of organisms in order to obtain a curve of the evolution of the pangenome metrics
     """)
+    parser.add_argument("-ea", "--evolution_analytic", default=False, action="store_true", help="""
+    Flag: Compute the curves of the evolution of the core_exact, accessory and pangenome sizes from the frequency of each family using hypergeometric probabilities (expected values and variances written in the evolutions directory) instead of resampling. Combined with --evolution, the resampling is only used for the persistent, shell and cloud partitions: the file evol_stats.txt then holds separate rows, the analytic rows (with NA for the persistent, shell and cloud partitions) and the resampled rows (with NA for the core_exact, accessory and pangenome sizes)
+    """)
     parser.add_argument("-ep", "--evolution_resampling_param", nargs=5, default=[0.1,10,30,1,float("Inf")], metavar=('RESAMPLING_RATIO','MINIMUM_RESAMPLING','MAXIMUM_RESAMPLING','STEP','LIMIT'), help="""
     5 Positive Numbers (or Inf for the last one):
     1st argument is the resampling ratio (FLOAT)
@@ -387,6 +466,8 @@ def __main__():
     It provides a circular plot (well-assembled representative organisms must be prefered).
     0 means all organisms (it is discouraged to use -p and -pr 0 in the same time because the projection of the graph on all the organisms can take a long time).
     """)
+    parser.add_argument("-cp", "--compress_projection", default=False, action="store_true", help="""
+    Flag: Compress (using gzip) the projection file of each organism""")
     parser.add_argument("-ck", "--chunck_size", type = int, nargs = 1, default = [500], metavar=('SIZE'), help="""
     Positive Number: Size of the chunks to perform the partioning by chunks.
     If the number of organisms used is higher than SIZE, the partioning will be performed by chunks of size SIZE
@@ -398,11 +479,31 @@ def __main__():
     """)
     parser.add_argument("-ss", "--subpartition_shell", default = 0, type=int, nargs=1, help = """
     Number: (in test) Subpartition the shell genome in k subpartitions, k can be detected automatically using k = -1, if k = 0 the partioning will used the first column of metadata to subpartition the shell""")
+    parser.add_argument("-sc", "--subpartition_shell_criterion", default = ["BIC"], type=str, nargs=1, choices=["BIC","ICL"], help = """
+    (in test) Criterion used to select the number of subpartitions of the shell when -ss is negative (all the numbers of subpartitions are fitted in parallel using the -c option)""")
+    parser.add_argument("-ns", "--nb_starts", default = [1], type=int, nargs=1, metavar=('NB_STARTS'), help = """
+    Positive Number: (in test) Number of seeded NEM runs used to subpartition the shell when the initialisation is random (runs are executed in parallel using the -c option and the best one according to the BIC is kept)""")
+    parser.add_argument("-sb", "--syntenic_blocks", default = False, action="store_true", help = """
+    Flag: (in test) also export a compact graph where each maximal unbranched path of families (syntenic block) is merged in a single node (graph_blocks.gexf), the families of each block are listed in its 'families' attribute""")
     parser.add_argument("-l", "--compute_layout", default = False, action="store_true", help = """
     Flag: (in test) precalculated the ForceAtlas2 layout""")
+    parser.add_argument("-lm", "--layout_multilevel", default = False, action="store_true", help = """
+    Flag: (in test) compute the layout on coarsened graphs (chains of families collapsed) and refine it level by level (faster on large graphs, need -l)""")
+    parser.add_argument("-lps", "--layout_persistent_shell", default = False, action="store_true", help = """
+    Flag: (in test) lay out only the persistent and shell families, the cloud families are then placed near their neighbors (need -l)""")
+    parser.add_argument("-cl", "--classify", type=str, nargs=1, metavar=('MODEL_FILE'), help = """
+    File: partition the families using the model (partition_model.pkl) written in the output directory by a previous run partitioned without chunks, the parameters are not estimated again (only the posterior probabilities of the partitions are computed, smoothed using the beta of the model). 
+    The organisms must be included in the ones of the model""")
+    parser.add_argument("-lp", "--layout_positions", type=str, nargs=1, metavar=('POSITIONS_FILE'), help = """
+    File: (in test) file caching the positions of the layout: the positions found in this file are reused (only the missing families are laid out) and the new positions are written in it (need -l)""")
 
     global options
     options = parser.parse_args()
+    if options.merge_shards:
+        if options.write_shard:
+            parser.error("the arguments -ws/--write_shard and -ms/--merge_shards are exclusive")
+    elif options.organisms is None or options.gene_families is None:
+        parser.error("the arguments -o/--organisms and -gf/--gene_families are required (except with -ms/--merge_shards)")
 
     level = logging.INFO
     if options.verbose:
@@ -411,7 +512,7 @@ def __main__():
     logging.basicConfig(stream=sys.stdout, level = level, format = '\n%(asctime)s %(filename)s:l%(lineno)d %(levelname)s\t%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
     logging.getLogger().info("Command: "+" ".join([arg for arg in sys.argv]))
-    logging.getLogger().info("PPanGGOLiN version: "+pkg_resources.get_distribution("ppanggolin").version)
+    logging.getLogger().info("PPanGGOLiN version: "+ppanggolin_version())
     logging.getLogger().info("Python version: "+sys.version)
     logging.getLogger().info("Networkx version: "+nx.__version__)
     global OUTPUTDIR
@@ -419,17 +520,17 @@ def __main__():
     OUTPUTDIR       = options.output_directory[0]
     TMP_DIR         = options.temporary_directory[0]
 
-    list_dir        = ["",FIGURE_DIR,PARTITION_DIR]
+    list_dir        = ["",FIGURE_DIR,PARTITION_DIR] if not options.write_shard else []
     if options.projection:
         list_dir.append(PROJECTION_DIR)
-    if options.evolution:
+    if options.evolution or options.evolution_analytic:
         list_dir.append(EVOLUTION_DIR)
         (RESAMPLING_RATIO, RESAMPLING_MIN, RESAMPLING_MAX, STEP, LIMIT) = options.evolution_resampling_param
         (RESAMPLING_RATIO, RESAMPLING_MIN, RESAMPLING_MAX, STEP, LIMIT) = (float(RESAMPLING_RATIO), int(RESAMPLING_MIN), int(RESAMPLING_MAX) if str(RESAMPLING_MAX).upper() != "Inf" else sys.maxsize, int(STEP), int(LIMIT) if str(LIMIT).upper() != "INF" else sys.maxsize)
     for directory in list_dir:
         if not os.path.exists(OUTPUTDIR+directory):
             os.makedirs(OUTPUTDIR+directory)
-        elif not options.force:
+        elif not options.force and not options.resume:
             logging.getLogger().error(OUTPUTDIR+directory+" already exist")
             exit(1)
 
@@ -446,15 +547,40 @@ def __main__():
             else:
                 metadata.append(dict(zip(attribute_names,elements)))
 
+    if options.seed is not None:
+        seed_random(options.seed[0])
+    global queue
+    queue = None
+    if options.queue:
+        queue = WorkQueue(options.queue[0], timeout = options.queue_timeout[0])
+        queue.start()
+    if options.streaming and not os.path.exists(TMP_DIR):
+        os.makedirs(TMP_DIR)
+    gff_cache = None
+    if options.gff_cache is not None and not options.merge_shards:
+        gff_cache = GffCache(options.gff_cache if options.gff_cache else os.path.join(os.path.dirname(os.path.abspath(TMP_DIR)), GFF_CACHE_DIR),
+                             options.gene_families[0].name,
+                             options.gff_cache_max_size[0]*2**20)
     start_loading = time()
     global pan
-    pan = PPanGGOLiN("file",
-                     options.organisms[0],
-                     options.gene_families[0],
-                     options.remove_high_copy_number_families[0],
-                     options.infer_singletons,
-                     #options.directed)
-                     False)
+    if options.merge_shards:
+        pan = PPanGGOLiN("shards",
+                         options.merge_shards,
+                         TMP_DIR+ANNOTATIONS_STORE_FILE if options.streaming else None)
+    else:
+        pan = PPanGGOLiN("file",
+                         options.organisms[0],
+                         options.gene_families[0],
+                         options.remove_high_copy_number_families[0],
+                         options.infer_singletons,
+                         #options.directed)
+                         False,
+                         TMP_DIR+ANNOTATIONS_STORE_FILE if options.streaming else None,
+                         gff_cache)
+    if options.write_shard:
+        pan.write_shard(options.write_shard[0])
+        logging.getLogger().info("Shard of "+str(pan.nb_organisms)+" organisms and "+str(pan.pan_size)+" gene families written in "+options.write_shard[0])
+        exit(0)
 
     
 
@@ -468,27 +594,58 @@ def __main__():
     # start_neighborhood_computation = time.time()
     end_loading = time()
     #-------------
+    if options.cpu[0] > 1 and (options.evolution or pan.nb_organisms > options.chunck_size[0]):
+        pan.share_memory()# the worker processes read the graph from shared memory instead of duplicating it
+    #-------------
 
     #-------------
     logging.getLogger().info("Partitioning...")
 
     start_partitioning = time()
-    pan.partition(nem_dir_path    = TMP_DIR+NEM_DIR,
-                  organisms       = None,
-                  beta            = options.beta_smoothing[0],
-                  free_dispersion = options.free_dispersion,
-                  chunck_size     = options.chunck_size[0],
-                  inplace         = True,
-                  just_stats      = False,
-                  nb_threads      = options.cpu[0])
+    if options.classify:
+        logging.getLogger().info("Using the partition model "+options.classify[0]+" (the parameters are not estimated again)")
+        pan.classify(model        = read_partition_model(options.classify[0]),
+                     nem_dir_path = TMP_DIR+NEM_DIR,
+                     inplace      = True,
+                     nb_threads   = options.cpu[0] if options.parallel_nem else 1)
+    else:
+        pan.partition(nem_dir_path    = TMP_DIR+NEM_DIR,
+                      organisms       = None,
+                      beta            = options.beta_smoothing[0],
+                      free_dispersion = options.free_dispersion,
+                      chunck_size     = options.chunck_size[0],
+                      inplace         = True,
+                      just_stats      = False,
+                      nb_threads      = options.cpu[0],
+                      checkpoint_interval = CHECKPOINT_INTERVAL,
+                      resume          = options.resume,
+                      seed            = None if options.seed is None else options.seed[0],
+                      parallel_nem    = options.parallel_nem,
+                      init_from_profiles = options.init_from_profiles,
+                      queue           = queue)
+    if pan.partition_model is not None:
+        write_partition_model(OUTPUTDIR+PARTITION_MODEL_FILE, pan.partition_model)
     end_partitioning = time()
     #-------------
+    if len(options.beta_smoothing)>1:
+        logging.getLogger().info("Comparing the partitions obtained using several values of beta...")
+        sweep = pan.partition_beta_sweep(betas           = options.beta_smoothing,
+                                         nem_dir_path    = TMP_DIR+"/beta_sweep/",
+                                         free_dispersion = options.free_dispersion,
+                                         warm_start      = not options.beta_cold_start,
+                                         nb_threads      = options.cpu[0],
+                                         seed            = None if options.seed is None else options.seed[0])
+        with open(OUTPUTDIR+BETA_SWEEP_FILE_PREFIX+".txt","w") as beta_sweep_file:
+            beta_sweep_file.write("\t".join(sweep[0].keys())+"\n")
+            for row in sweep:
+                beta_sweep_file.write("\t".join(["NA" if value is None else str(value) for value in row.values()])+"\n")
+    #-------------
     if options.metadata[0]:
         metadata = OrderedDict(zip(list(pan.organisms),metadata))
 
     if options.subpartition_shell:
         if options.subpartition_shell[0] <0:
-            Q = pan.partition_shell(Q = "auto")
+            Q = pan.partition_shell(Q = "auto", nb_starts = options.nb_starts[0], nb_threads = options.cpu[0], criterion = options.subpartition_shell_criterion[0], seed = None if options.seed is None else options.seed[0])
             logging.getLogger().info(str(Q)+" subpartitions has been used to subpartition the shell genome...")
         elif options.subpartition_shell[0]==0:
             init=defaultdict(set)
@@ -496,7 +653,7 @@ def __main__():
                 init[metad].add(orgs)
             pan.partition_shell(init_using_qual=init)
         else:
-            pan.partition_shell(options.subpartition_shell[0])
+            pan.partition_shell(Q = options.subpartition_shell[0], nb_starts = options.nb_starts[0], nb_threads = options.cpu[0], seed = None if options.seed is None else options.seed[0])
 
     
 
@@ -536,8 +693,15 @@ def __main__():
     #-------------
     start_writing_output_file = time()
 
+    if options.syntenic_blocks:
+        pan.compress_neighbors_graph()
+
     if options.compute_layout:
-        pan.compute_layout(multiThreaded=options.cpu[0])
+        pan.compute_layout(multilevel            = options.layout_multilevel,
+                           persistent_shell_only = options.layout_persistent_shell,
+                           positions_file        = options.layout_positions[0] if options.layout_positions else None)
+        if options.syntenic_blocks:
+            pan.compute_layout(graph_type = "compressed_neighbors_graph", multilevel = options.layout_multilevel)
 
     #pan.tile_plot(OUTPUTDIR+FIGURE_DIR)
     logging.getLogger().info("Writing GEXF file")
@@ -546,6 +710,9 @@ def __main__():
     pan.export_to_GEXF(OUTPUTDIR+GRAPH_FILE_PREFIX+(".gz" if options.compress_graph else ""), options.compress_graph, metadata)
     logging.getLogger().info("Writing GEXF light file")
     pan.export_to_GEXF(OUTPUTDIR+GRAPH_FILE_PREFIX+"_light"+(".gz" if options.compress_graph else ""), options.compress_graph, metadata, False,False)
+    if options.syntenic_blocks:
+        logging.getLogger().info("Writing GEXF syntenic blocks file")
+        pan.export_to_GEXF(OUTPUTDIR+GRAPH_FILE_PREFIX+"_blocks"+(".gz" if options.compress_graph else ""), options.compress_graph, metadata, graph_type = "compressed_neighbors_graph")
     with open(OUTPUTDIR+"/pangenome.txt","w") as pan_text:
         for partition, families in pan.partitions.items(): 
             file = open(OUTPUTDIR+PARTITION_DIR+"/"+partition+".txt","w")
@@ -557,12 +724,13 @@ def __main__():
     if options.projection:
         logging.getLogger().info("Projection...")
         start_projection = time()
-        pan.projection(OUTPUTDIR+PROJECTION_DIR, [pan.organisms.__getitem__(index-1) for index in options.projection] if options.projection[0] > 0 else list(pan.organisms))
+        pan.projection(OUTPUTDIR+PROJECTION_DIR, [pan.organisms.__getitem__(index-1) for index in options.projection] if options.projection[0] > 0 else list(pan.organisms), nb_threads = options.cpu[0], compressed = options.compress_projection)
         end_projection = time()
     end_writing_output_file = time()
 
     pan.ushaped_plot(OUTPUTDIR+FIGURE_DIR)
-    del pan.annotations # no more required for the following process
+    if options.untangle[0] == 0:
+        del pan.annotations # no more required for the following process (except to untangle the graph)
 
     # print(pan.partitions_by_organisms)
     # partitions_by_organisms_file = open(OUTPUTDIR+"/partitions_by_organisms.txt","w")
@@ -582,13 +750,13 @@ def __main__():
         file_stats.write(str(pan))
     #-------------
 
-    if options.untangle>0:
+    if options.untangle[0]>0:
         pan.untangle_neighbors_graph(options.untangle[0])
-        pan.export_to_GEXF(OUTPUTDIR+GRAPH_FILE_PREFIX+(".gz" if options.compress_graph else ""), options.compress_graph, metadata,"untangled_neighbors_graph" )
+        pan.export_to_GEXF(OUTPUTDIR+GRAPH_FILE_PREFIX+"_untangled"+(".gz" if options.compress_graph else ""), options.compress_graph, metadata, graph_type = "untangled_neighbors_graph")
 
     plot_Rscript(script_outfile = OUTPUTDIR+"/"+SCRIPT_R_FIGURE, verbose=options.verbose)
 
-    if options.evolution:
+    if options.evolution or options.evolution_analytic:
 
         logging.getLogger().info("Evolution...")
 
@@ -596,12 +764,29 @@ def __main__():
         if not options.verbose:
             logging.disable(logging.INFO)# disable INFO message to not disturb the progess bar
             logging.disable(logging.WARNING)# disable WARNING message to not disturb the progess bar
-        combinations = samplingCombinations(list(pan.organisms), sample_ratio=RESAMPLING_RATIO, sample_min=RESAMPLING_MIN, sample_max=RESAMPLING_MAX)
-        
         global shuffled_comb
-        shuffled_comb = combinations
-        shuffled_comb = [OrderedSet(comb) for nb_org, combs in combinations.items() for comb in combs if nb_org%STEP == 0 and nb_org<=LIMIT]
-        shuffle(shuffled_comb)
+        shuffled_comb = []
+        completed = OrderedDict()# the indices of the resampled pangenomes already computed and their line in the evol_stats file
+        combinations_path = TMP_DIR+EVOLUTION_DIR+EVOLUTION_COMBINATIONS_FILE
+        checkpoint_path   = TMP_DIR+EVOLUTION_DIR+EVOLUTION_CHECKPOINT_FILE
+        if options.evolution and options.resume and os.path.isfile(combinations_path):
+            with open(combinations_path,"rb") as combinations_file:
+                shuffled_comb = [OrderedSet(comb) for comb in pickle.load(combinations_file)]
+            if os.path.isfile(checkpoint_path):
+                with open(checkpoint_path) as checkpoint_file:
+                    for line in checkpoint_file:
+                        if line.endswith("\n"):# a truncated last line is ignored
+                            (index, evol_line) = line.split("\t")
+                            completed[int(index)] = evol_line if evol_line != "\n" else None
+            logging.getLogger().info("Resuming the evolution: "+str(len(completed))+"/"+str(len(shuffled_comb))+" resampled pangenomes already computed")
+        elif options.evolution:
+            combinations = samplingCombinations(list(pan.organisms), sample_ratio=RESAMPLING_RATIO, sample_min=RESAMPLING_MIN, sample_max=RESAMPLING_MAX)
+            shuffled_comb = [OrderedSet(comb) for nb_org, combs in combinations.items() for comb in combs if nb_org%STEP == 0 and nb_org<=LIMIT]
+            shuffle(shuffled_comb)
+            if not os.path.exists(TMP_DIR+EVOLUTION_DIR):
+                os.makedirs(TMP_DIR+EVOLUTION_DIR)
+            with open(combinations_path,"wb") as combinations_file:
+                pickle.dump([list(comb) for comb in shuffled_comb], combinations_file)
 
         global evol
         evol =  open(OUTPUTDIR+EVOLUTION_DIR+EVOLUTION_STATS_FILE_PREFIX+".txt","w")
@@ -614,19 +799,48 @@ def __main__():
                               str(len(pan.partitions["core_exact"])),
                               str(len(pan.partitions["accessory"])),
                               str(len(pan.partitions["accessory"])+len(pan.partitions["core_exact"]))])+"\n")
-        evol.flush()
-        with ProcessPoolExecutor(options.cpu[0]) as executor:
-            futures = [executor.submit(resample,i) for i in range(len(shuffled_comb))]
-            for f in tqdm(as_completed(futures), total = len(shuffled_comb), unit = 'pangenome resampled'):
-                ex = f.exception()
-                if ex:
-                    executor.shutdown(wait=False)
-                    raise ex
+        if options.evolution_analytic:
+            curves = pan.rarefaction_curves([nb_org for nb_org in range(1, pan.nb_organisms) if nb_org%STEP == 0 and nb_org<=LIMIT])
+            with open(OUTPUTDIR+EVOLUTION_DIR+EVOLUTION_ANALYTIC_FILE_PREFIX+".txt","w") as analytic:
+                analytic.write(",".join(["nb_org"]+[part+suffix for part in ("core_exact","accessory","pangenome") for suffix in ("","_variance")])+"\n")
+                for nb_org, curve in curves.items():
+                    analytic.write(",".join([str(nb_org)]+[str(round(value, 4)) for part in ("core_exact","accessory","pangenome") for value in curve[part]])+"\n")
+                    evol.write(",".join([str(nb_org),"NA","NA","NA"]+[str(round(curve[part][0], 4)) for part in ("core_exact","accessory","pangenome")])+"\n")
+        # the lines are written in the order of the subsamples (whatever the order of completion) to obtain the same file whatever the number of cpu
+        pending    = dict(completed)
+        next_index = 0
+        def write_pending():
+            nonlocal next_index
+            while next_index in pending:
+                evol_line = pending.pop(next_index)
+                if evol_line is not None:
+                    evol.write(evol_line)
+                next_index += 1
+            evol.flush()
+        write_pending()
+        if options.evolution:
+            with ProcessPoolExecutor(options.cpu[0]) as executor, open(checkpoint_path,"w") as checkpoint_file:
+                for index, evol_line in completed.items():
+                    checkpoint_file.write(str(index)+"\t"+(evol_line if evol_line is not None else "\n"))
+                futures = dict([(executor.submit(resample,i), i) for i in range(len(shuffled_comb)) if i not in completed])
+                for f in tqdm(as_completed(futures), total = len(shuffled_comb), initial = len(completed), unit = 'pangenome resampled'):
+                    ex = f.exception()
+                    if ex:
+                        executor.shutdown(wait=False)
+                        raise ex
+                    checkpoint_file.write(str(futures[f])+"\t"+(f.result() if f.result() is not None else "\n"))
+                    checkpoint_file.flush()
+                    pending[futures[f]] = f.result()
+                    write_pending()
         evol.close()
 
         end_evolution = time()
         logging.disable(logging.NOTSET)#restaure info and warning messages 
 
+    pan.release_shared_memory()
+    if queue is not None:
+        queue.stop()
+
     # if options.new_genes_evolution:
     #     logging.getLogger().info("New genes evolution...")
     #     start_evolution = time()
@@ -655,7 +869,7 @@ def __main__():
     "Execution time of partitioning: " +str(round(end_partitioning-start_partitioning, 2))+" s\n"+
     #"Execution time of community identification: " +str(round(end_identify_communities-start_identify_communities, 2))+" s\n"+
     "Execution time of writing output files: " +str(round(end_writing_output_file-start_writing_output_file, 2))+" s\n"+
-    (("Execution time of evolution: " +str(round(end_evolution-start_evolution, 2))+" s\n") if options.evolution else "")+
+    (("Execution time of evolution: " +str(round(end_evolution-start_evolution, 2))+" s\n") if options.evolution or options.evolution_analytic else "")+
 
     "Total execution time: " +str(round(time()-start_loading, 2))+" s\n")
 
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: iso-8859-1 -*-
+
+""" Benchmark of the startup of the command line: python -m ppanggolin.import_benchmark [--repeat N] [--max_ms MS]
+    Each measure is done in a new python process. The heavy modules (LAZY_MODULES) must only be imported when they are used, the exit status is 1 if one of them is imported at startup or if the median time exceeds --max_ms """
+
+import sys
+import subprocess
+import argparse
+from time import perf_counter
+
+LAZY_MODULES = ["networkx", "highcharts", "fa2", "pkg_resources", "scipy", "numpy"]
+COMMANDS = [("import", "import ppanggolin.command_line"),
+             ("--version", "import sys; sys.argv = ['ppanggolin', '--version']\nfrom ppanggolin.command_line import __main__\ntry:\n    __main__()\nexcept SystemExit:\n    pass")]
+
+def imported_modules(code):
+    """ return the set of the top level modules imported by a python process running code (using -X importtime) """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, universal_newlines = True)
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            modules.add(line.split("|")[2].strip().split(".")[0])
+    return(modules)
+
+def startup_time(code, repeat = 5):
+    """ return the median wall time in ms of a python process running code """
+    times = []
+    for i in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable, "-c", code], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = True)
+        times.append((perf_counter()-start)*1000)
+    return(sorted(times)[len(times)//2])
+
+def __main__():
+    parser = argparse.ArgumentParser(prog = "python -m ppanggolin.import_benchmark", description = "Measure the startup time of ppanggolin")
+    parser.add_argument("--repeat", type = int, default = 5, help = "number of measures of each command (the median is reported)")
+    parser.add_argument("--max_ms", type = float, default = None, help = "fail if the median time of a command exceeds this number of milliseconds")
+    options = parser.parse_args()
+
+    baseline = startup_time("pass", options.repeat)
+    print("python startup: "+str(round(baseline))+" ms")
+    failed = False
+    for name, code in COMMANDS:
+        median = startup_time(code, options.repeat)
+        eager  = sorted(set(LAZY_MODULES) & imported_modules(code))
+        print(name+": "+str(round(median))+" ms ("+str(round(median-baseline))+" ms more than python)"+(", imported at startup: "+" ".join(eager) if eager else ""))
+        if len(eager) > 0 or (options.max_ms is not None and median > options.max_ms):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    __main__()
@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: iso-8859-1 -*-
 from collections import defaultdict, OrderedDict, Counter, deque
-from bidict import bidict
+from collections.abc import Mapping
 from ordered_set import OrderedSet
-import networkx as nx
 import logging
 import sys
 import math
@@ -13,22 +12,36 @@ import shutil
 import gzip
 import tempfile
 from tqdm import tqdm
-from random import sample
+from random import sample, randrange, uniform, getstate, setstate, Random
 from multiprocessing import Pool, Semaphore
-from highcharts import Highchart
 import contextlib
+import mmap
+import pickle
+import copy
+import hashlib
+import socket
+import uuid
+from array import array
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:# python < 3.8, anonymous mmap are used instead (only shared by forked processes)
+    shared_memory = None
 from nem import *
 from .utils import *
-import pdb
-from fa2 import ForceAtlas2
+nx = lazy_import("networkx")# highcharts and fa2 are imported by the methods using them
 
 (TYPE, FAMILY, START, END, STRAND, NAME, PRODUCT) = range(0, 7)#data index in annotation
 (ORGANISM_INDEX,CONTIG_INDEX,POSITION_INDEX) = range(0, 3)#index
 (ORGANISM_ID, ORGANISM_GFF_FILE) = range(0, 2)#data index in the file listing organisms 
 (GFF_seqname, GFF_source, GFF_feature, GFF_start, GFF_end, GFF_score, GFF_strand, GFF_frame, GFF_attribute) = range(0,9) 
 (MU,EPSILON,PROPORTION) = range(0, 3)
-(FAMILIES_PARTITION,PARTITION_PARAMETERS) = range(0, 2)
-RESERVED_WORDS = set(["id", "label", "name", "weight", "partition", "partition_exact", "length", "length_min", "length_max", "length_avg", "length_med", "product", 'nb_genes','subpartition_shell',"viz"])
+(FAMILIES_PARTITION,PARTITION_PARAMETERS,PARTITION_CRITERIA,FAMILIES_POSTERIORS) = range(0, 4)
+PARTITION_CHECKPOINT_FILE = "partition_checkpoint.pkl"
+SHARD_FORMAT = 1# version of the format of the shard files (see PPanGGOLiN.write_shard)
+NEM_INPUT_FILES = ["nem_file.str","nem_file.index","nem_file.dat","nem_file.nei","nem_file.m","nem_file.wei","column_org_file"]
+RESERVED_WORDS = set(["id", "label", "name", "weight", "partition", "partition_exact", "posterior_persistent", "posterior_shell", "posterior_cloud", "length", "length_min", "length_max", "length_avg", "length_med", "product", 'nb_genes','subpartition_shell',"viz","families","nb_families"])
+BLOCK_SEPARATOR = "~"#separates the first and the last families in the name of a block of the compressed graph
+POSTERIOR_CLASSES = ("P","S","C")# order of the classes in the posterior probabilities returned by run_partitioning (initialized with param_file_default)
 SHORT_TO_LONG = {'A':'accessory','CE':'core_exact','P':'persistent','S':'shell','C':'cloud','U':'undefined'}
 COLORS = {"pangenome":"black", "accessory":"#EB37ED", "core_exact" :"#FF2828", "shell": "#00D860", "persistent":"#F7A507", "cloud":"#79DEFF", "undefined":"#828282"}
 COLORS_RGB = {"pangenome":{'r': 0, 'g': 0, 'b': 0, 'a': 0}, "accessory":{'r': 235, 'g': 55, 'b': 237, 'a': 0}, "core_exact" :{'r': 255, 'g': 40, 'b': 40, 'a': 0}, "shell": {'r': 0, 'g': 216, 'b': 96, 'a': 0}, "persistent":{'r': 247, 'g': 165, 'b': 7, 'a': 0}, "cloud":{'r': 121, 'g': 222, 'b': 255, 'a': 0}, "undefined":{'r': 130, 'g': 130, 'b': 130, 'a': 0}}
@@ -67,7 +80,8 @@ class PPanGGOLiN:
 
             .. attribute:: annotations
 
-                multilevel dictionnaries containing a dictionary of contig for each organism, and a dictionary of lists containing annotations for each contig
+                multilevel dictionnaries containing a dictionary of contig for each organism, and a dictionary of lists containing annotations for each contig 
+                (an AnnotationStore reading the annotations of each organism from the disk if the pangenome was built in streaming mode)
 
             .. attribute:: neighbors_graph
 
@@ -78,6 +92,10 @@ class PPanGGOLiN:
 
                 an ordored-set contains the imported organisms 
 
+            .. attribute:: index
+
+                a GeneIndex giving the position of each gene in its contig (None until the method gene_index() builds it)
+
             .. attribute:: nb_organisms
 
                 a int giving the number of imported organisms 
@@ -117,6 +135,22 @@ class PPanGGOLiN:
                     * partitions["cloud"] contains the list of cloud families
                     * partitions["undefined"] contains the list of families unable to be classified (probably because the number of organisms is too small)
 
+            .. attribute:: shared
+
+                a SharedPangenome object storing a read-only copy of the presence/absence matrix and of the neighborhood graph in shared memory (None if share_memory() was not called)
+
+            .. attribute:: neighbors_partitions
+
+                a dict having the families as keys and as value a tuple giving the number of neighbors of the family in the persistent, shell and cloud partitions (computed after the partitioning)
+
+            .. attribute:: compressed_neighbors_graph
+
+                a networkx graph where each maximal unbranched path of the neighbors_graph (syntenic block) is merged in a single node (None if compress_neighbors_graph() was not called)
+
+            .. attribute:: blocks
+
+                a dict having the nodes of the compressed_neighbors_graph as keys and the ordered list of the families they merge as value
+
             .. attribute:: BIC
 
                 a float providing the Bayesian Information Criterion. This Criterion give an estimation of the quality of the partionning (a low value means a good one)
@@ -124,7 +158,7 @@ class PPanGGOLiN:
     """ 
     def __init__(self, init_from = "args", *args):
         """ 
-            :param init_from: specified the excepted input (can be "file", "args", "database")
+            :param init_from: specified the excepted input (can be "file", "args", "shards", "database")
             :param *args: depending on the previous paramter, args can take multiple forms
             :type init_from: str
             :type *args: list
@@ -133,12 +167,13 @@ class PPanGGOLiN:
 
             >>>pan = PPanGGOLiN("file", organisms, gene_families, remove_high_copy_number_families)
             >>>pan = PPanGGOLiN("args", annotations, organisms, circular_contig_size, families_repeted)# load direclty the main attributes
+            >>>pan = PPanGGOLiN("shards", shard_file_paths)# merge the partial pangenomes written by write_shard
         """ 
         self.directed                      = False
         self.annotations                   = dict()
         self.neighbors_graph               = None
         self.untangled_neighbors_graph     = None
-        self.index                         = bidict()
+        self.index                         = None
         self.organisms                     = OrderedSet()
         self.nb_organisms                  = 0
         self.circular_contig_size          = dict()
@@ -155,9 +190,18 @@ class PPanGGOLiN:
         self.partitions["core_exact"]      = list()
         self.partitions["accessory"]       = list()
         self.BIC                           = None # Bayesian Index Criterion
+        self.partition_model               = None # parameters fitted by the last partitioning (see classify)
+        self.partition_posteriors          = array("f") # posterior probabilities of the persistent, shell and cloud classes (3 float32 by family, see posterior)
+        self.posteriors_index              = dict() # family -> row in partition_posteriors
         self.partitions_by_organism        = dict()
         self.subpartitions_shell_parameters = {}
         self.subpartition_shell            = {}
+        self.subpartitions_shell_starts    = {}
+        self.subpartitions_shell_criteria  = OrderedDict()
+        self.shared                        = None
+        self.neighbors_partitions          = {}
+        self.compressed_neighbors_graph    = None
+        self.blocks                        = {}
 
         if init_from == "file":
             self.__initialize_from_files(*args)
@@ -167,6 +211,8 @@ class PPanGGOLiN:
              self.circular_contig_size,
              self.families_repeted,
              self.directed) = args 
+        elif init_from == "shards":
+            self.__initialize_from_shards(*args)
         elif init_from == "database":
             logging.getLogger().error("database is not yet implemented")
             pass
@@ -174,21 +220,26 @@ class PPanGGOLiN:
             raise ValueError("init_from parameter is required")
         self.nb_organisms = len(self.organisms)
 
-        logging.getLogger().info("Computing gene neighborhood ...")
-        self.__neighborhood_computation(directed = self.directed)
+        if self.neighbors_graph is None:# in streaming mode or from shards, the graph is already built
+            logging.getLogger().info("Computing gene neighborhood ...")
+            self.__neighborhood_computation(directed = self.directed)
 
-    def __initialize_from_files(self, organisms_file, families_tsv_file, lim_occurence = 0, infer_singletons = False, directed = False):
+    def __initialize_from_files(self, organisms_file, families_tsv_file, lim_occurence = 0, infer_singletons = False, directed = False, annotations_store = None, gff_cache = None):
         """ 
             :param organisms_file: a file listing organims by compute, first column is organism name, second is path to gff file and optionnally other other to provide the name of circular contig
             :param families_tsv_file: a file listing families. The first element is the family identifier (by convention, we advice to use the identifier of the average gene of the family) and then the next elements are the identifiers of the genes belonging to this family.
             :param lim_occurence: a int containing the threshold of the maximum number copy of each families. Families exceeding this threshold are removed and are listed in the families_repeted attribute.
             :param infer_singletons: a bool specifying if singleton must be explicitely present in the families_tsv_file (False) or if single gene in gff files must be automatically infered as a singleton family (True)
             :param directed: a bool specifying if the pangenome graph is directed or undirected
+            :param annotations_store: a str containing the path of a file used to store the annotations (streaming mode: the graph is built organism by organism while reading the gff files and only the annotations of the organism being read are kept in memory) or None to keep all the annotations in memory
+            :param gff_cache: a GffCache storing the parsed gff files of the previous runs or None to parse all the gff files
             :type file: 
             :type file: 
             :type int: 
             :type bool: 
             :type bool: 
+            :type str: 
+            :type GffCache: 
         """ 
         self.directed = directed
         logging.getLogger().info("Reading "+families_tsv_file.name+" the gene families file ...")
@@ -206,6 +257,16 @@ class PPanGGOLiN:
 
         logging.getLogger().info("Reading "+organisms_file.name+" the list of organism files ...")
 
+        if annotations_store is not None:
+            self.annotations = AnnotationStore(annotations_store)
+            self.neighbors_graph = nx.DiGraph() if directed else nx.Graph()
+            if lim_occurence > 0:# the highly repeated families must be known before adding the first organism to the graph
+                organisms_file_lines = organisms_file.readlines()
+                organisms_file.seek(0)
+                for line in tqdm(organisms_file_lines, unit = "gff file", desc = "Counting the copies of each family"):
+                    gff_file_path = line.split("\t")[ORGANISM_GFF_FILE].strip()
+                    self.families_repeted.update([fam for fam, occ in count_families_occurences(gff_file_path, families).items() if occ > lim_occurence])
+
         bar = tqdm(organisms_file,total=get_num_lines(organisms_file), unit = "gff file")
 
         for line in bar:
@@ -214,14 +275,69 @@ class PPanGGOLiN:
             bar.refresh()
             if len(elements)>2:
                 self.circular_contig_size.update({contig_id: None for contig_id in elements[2:len(elements)]})  # size of the circular contig is initialized to None (waiting to read the gff files to fill the dictionnaries with the correct values)
-            self.annotations[elements[0]] = self.__load_gff(elements[ORGANISM_GFF_FILE], families, elements[ORGANISM_ID], lim_occurence, infer_singletons)
+            annotations = self.__load_gff(elements[ORGANISM_GFF_FILE], families, elements[ORGANISM_ID], lim_occurence, infer_singletons, gff_cache)
+            if annotations_store is not None:
+                self.__add_organism_to_graph(elements[ORGANISM_ID], annotations)
+                self.annotations.add(elements[ORGANISM_ID], annotations)
+            else:
+                self.annotations[elements[ORGANISM_ID]] = annotations
+        if annotations_store is not None:
+            self.pan_size = nx.number_of_nodes(self.neighbors_graph)
+        if gff_cache is not None:
+            gff_cache.close()
         check_circular_contigs = {contig: size for contig, size in self.circular_contig_size.items() if size == None }
         if len(check_circular_contigs) > 0:
             logging.getLogger().error("""
                 The following identifiers of circular contigs in the file listing organisms have not been found in any region feature of the gff files: '"""+"'\t'".join(check_circular_contigs.keys())+"'")
             exit()
 
-    def __load_gff(self, gff_file_path, families, organism, lim_occurence = 0, infer_singletons = False):
+    def __initialize_from_shards(self, shard_file_paths, annotations_store = None):
+        """ 
+            Merge the partial pangenomes written by write_shard without reading the gff files again. The graphs of the shards are unioned in the order of the shard files.
+            The families removed because they are highly repeated in the organisms of a shard are removed from the whole pangenome: the graph of a shard which kept some of them is built again from its annotations.
+            :param shard_file_paths: a list of str containing the paths of the shard files (each organism must be in a single shard)
+            :param annotations_store: a str containing the path of a file used to store the annotations (see __initialize_from_files) or None to keep all the annotations in memory
+            :type list: 
+            :type str: 
+        """ 
+        headers = [read_shard_header(shard_file_path) for shard_file_path in shard_file_paths]
+        if len(set([header["directed"] for header in headers])) > 1:
+            raise ValueError("The shards mix directed and undirected graphs")
+        self.directed = headers[0]["directed"] if len(headers) > 0 else False
+        for header in headers:
+            self.families_repeted.update(header["families_repeted"])
+        self.annotations     = AnnotationStore(annotations_store) if annotations_store is not None else dict()
+        self.neighbors_graph = nx.DiGraph() if self.directed else nx.Graph()
+
+        bar = tqdm(list(zip(shard_file_paths, headers)), unit = "shard")
+        for shard_file_path, header in bar:
+            bar.set_description("Merging "+shard_file_path)
+            bar.refresh()
+            duplicated = [organism for organism in header["organisms"] if organism in self.organisms]
+            if len(duplicated) > 0:
+                raise KeyError("Redondant organism names was found ("+" ".join(duplicated)+") in the shard "+shard_file_path)
+            self.organisms.update(header["organisms"])
+            self.circular_contig_size.update(header["circular_contig_size"])
+            rebuild = not self.families_repeted.issubset(header["families_repeted"])# the graph of the shard contains families repeated in other shards
+            with open(shard_file_path,"rb") as shard_file:
+                pickle.load(shard_file)# header
+                shard_graph = pickle.load(shard_file)
+                if not rebuild:
+                    merge_graphs(self.neighbors_graph, shard_graph, header["organisms"])
+                del shard_graph
+                for organism in header["organisms"]:
+                    annotations = pickle.load(shard_file)
+                    if rebuild:
+                        self.__add_organism_to_graph(organism, annotations)
+                    if annotations_store is not None:
+                        self.annotations.add(organism, annotations)
+                    else:
+                        self.annotations[organism] = annotations
+            if rebuild:
+                logging.getLogger().debug("The graph of the shard "+shard_file_path+" was built again from its annotations to remove the families repeated in other shards")
+        self.pan_size = nx.number_of_nodes(self.neighbors_graph)
+
+    def __load_gff(self, gff_file_path, families, organism, lim_occurence = 0, infer_singletons = False, gff_cache = None):
         """
             Load the content of a gff file
             :param gff_file_path: a valid gff file path where only feature of the type 'CDS' will be imported as genes. Each 'CDS' feature must have a uniq ID as attribute (afterall called gene id).
@@ -229,11 +345,13 @@ class PPanGGOLiN:
             :param organism: a str containing the organim name
             :param lim_occurence: a int containing the threshold of the maximum number copy of each families. Families exceeding this threshold are removed and are listed in the next attribute.
             :param infer_singletons: a bool specifying if singleton must be explicitely present in the families parameter (False) or if single gene automatically infered as a singleton family (True)
+            :param gff_cache: a GffCache used to read the annotations already parsed (and to store the new ones) or None to always parse the gff file
             :type str: 
             :type dict: 
             :type str: 
             :type int: 
             :type bool: 
+            :type GffCache: 
             :return: annot: 
             :rtype: dict 
         """ 
@@ -243,70 +361,82 @@ class PPanGGOLiN:
             self.organisms.add(organism)
             annot = defaultdict(OrderedDict)
 
-            ctp_prev = 1
-            cpt_fam_occ = defaultdict(int)
-
-            gene_id_auto = False
-
-            with read_compressed_or_not(gff_file_path) as gff_file:
-                for line in gff_file:
-                    if line.startswith('##',0,2):
-                        if line.startswith('FASTA',2,7):
-                            break
-                        elif line.startswith('sequence-region',2,17):
-                            fields = [el.strip() for el in line.split()]
-                            if fields[1] in self.circular_contig_size:
-                                self.circular_contig_size[fields[1]] = int(fields[3])
-                            else:
-                                logging.getLogger().debug(fields[1]+" is not circular")
-                        continue
-                    gff_fields = [el.strip() for el in line.split('\t')]
-                    if GFF_feature == 'region':
-                        if GFF_seqname in self.circular_contig_size:
-                            self.circular_contig_size = int(GFF_end)
+            cached = gff_cache.get(gff_file_path, infer_singletons) if gff_cache is not None else None
+            if cached is not None:
+                (annot, sequence_regions, cpt_fam_occ) = cached
+                for contig, size in sequence_regions.items():
+                    if contig in self.circular_contig_size:
+                        self.circular_contig_size[contig] = size
+            else:
+                ctp_prev = 1
+                cpt_fam_occ = defaultdict(int)
+                sequence_regions = {}
+
+                gene_id_auto = False
+
+                with read_compressed_or_not(gff_file_path) as gff_file:
+                    for line in gff_file:
+                        if line.startswith('##',0,2):
+                            if line.startswith('FASTA',2,7):
+                                break
+                            elif line.startswith('sequence-region',2,17):
+                                fields = [el.strip() for el in line.split()]
+                                sequence_regions[fields[1]] = int(fields[3])
+                                if fields[1] in self.circular_contig_size:
+                                    self.circular_contig_size[fields[1]] = int(fields[3])
+                                else:
+                                    logging.getLogger().debug(fields[1]+" is not circular")
                             continue
+                        gff_fields = [el.strip() for el in line.split('\t')]
+                        if GFF_feature == 'region':
+                            if GFF_seqname in self.circular_contig_size:
+                                self.circular_contig_size = int(GFF_end)
+                                continue
 
-                    elif gff_fields[GFF_feature] == 'CDS':
-                        attributes_field = [f for f in gff_fields[GFF_attribute].strip().split(';') if len(f)>0]
-                        attributes = {}
-                        for att in attributes_field:
-                            (key, value) = att.strip().split('=')
-                            attributes[key.upper()]=value
-                        try:
-                            protein = attributes["ID"]
-                        except:
-                            logging.getLogger().error("Each CDS feature of the gff files must own a unique ID attribute. Not the case for file: "+gff_file_path)
-                            exit(1)
-                        try:
-                            family = families[protein]
-                        except KeyError:
-                            if infer_singletons:
-                                families[protein] = protein
-                                family            = families[protein]
-                                logging.getLogger().info("infered singleton: "+protein)
-                            else:
-                                raise KeyError("Unknown families:"+protein, ", check your families file or run again the program using the option to infer singleton")
+                        elif gff_fields[GFF_feature] == 'CDS':
+                            attributes_field = [f for f in gff_fields[GFF_attribute].strip().split(';') if len(f)>0]
+                            attributes = {}
+                            for att in attributes_field:
+                                (key, value) = att.strip().split('=')
+                                attributes[key.upper()]=value
+                            try:
+                                protein = attributes["ID"]
+                            except:
+                                logging.getLogger().error("Each CDS feature of the gff files must own a unique ID attribute. Not the case for file: "+gff_file_path)
+                                exit(1)
+                            try:
+                                family = families[protein]
+                            except KeyError:
+                                if infer_singletons:
+                                    families[protein] = protein
+                                    family            = families[protein]
+                                    logging.getLogger().info("infered singleton: "+protein)
+                                else:
+                                    raise KeyError("Unknown families:"+protein, ", check your families file or run again the program using the option to infer singleton")
 
-                        cpt_fam_occ[family]+=1
-                        prev = families[protein]
+                            cpt_fam_occ[family]+=1
+                            prev = families[protein]
 
-                        try:
-                            name = attributes.pop('NAME')
-                        except KeyError:
                             try:
-                                name = attributes.pop('GENE')
+                                name = attributes.pop('NAME')
                             except KeyError:
-                                name = ""
+                                try:
+                                    name = attributes.pop('GENE')
+                                except KeyError:
+                                    name = ""
 
-                        try:
-                            product = attributes.pop('PRODUCT')
-                        except KeyError:
-                            product = ""
+                            try:
+                                product = attributes.pop('PRODUCT')
+                            except KeyError:
+                                product = ""
+
+                            annot[gff_fields[GFF_seqname]][protein] = ["CDS",family,int(gff_fields[GFF_start]),int(gff_fields[GFF_end]),gff_fields[GFF_strand], name, product]
 
-                        annot[gff_fields[GFF_seqname]][protein] = ["CDS",family,int(gff_fields[GFF_start]),int(gff_fields[GFF_end]),gff_fields[GFF_strand], name, product]
+                for seq_id in list(annot):#sort genes by annotation start coordinate
+                    annot[seq_id] = OrderedDict(sorted(annot[seq_id].items(), key = lambda item: item[1][START]))
+                if gff_cache is not None:
+                    gff_cache.put(gff_file_path, infer_singletons, annot, sequence_regions, cpt_fam_occ)
 
-            for seq_id in list(annot):#sort genes by annotation start coordinate
-                annot[seq_id] = OrderedDict(sorted(annot[seq_id].items(), key = lambda item: item[1][START]))
             if (lim_occurence > 0):
                 fam_to_remove =[fam for fam, occ in cpt_fam_occ.items() if occ > lim_occurence]
                 logging.getLogger().debug("highly repeted families found (>"+str(lim_occurence)+" in "+organism+"): "+" ".join(fam_to_remove))
@@ -341,7 +471,7 @@ class PPanGGOLiN:
 
     def add_organism(self, new_orgs, new_annotations, new_circular_contig_size, new_families_repeted):
         self.annotations.update(new_annotations)
-        self.index                     = bidict()
+        self.index                     = None
         self.organisms = self.organisms + new_orgs
         self.nb_organisms = len(self.organisms)
         self.circular_contig_size.update(new_circular_contig_size)
@@ -366,13 +496,20 @@ class PPanGGOLiN:
 
 
     def __iadd__(self, another_pan):
-        """ add a pangenome to this pangenome (reset the partionning) """
+        """ add a pangenome to this pangenome (reset the partionning). The graphs are merged if the organisms of the pangenomes are distinct and the same families were removed, otherwise the graph is built again from the annotations """
 
+        mergeable = (self.neighbors_graph is not None and another_pan.neighbors_graph is not None and
+                     self.families_repeted == another_pan.families_repeted and
+                     self.directed == another_pan.directed and
+                     len(self.organisms & another_pan.organisms) == 0)
         self.annotations.update(another_pan.annotations)
-        self.neighbors_graph          = None
+        if mergeable:
+            merge_graphs(self.neighbors_graph, another_pan.neighbors_graph, another_pan.organisms)
+        else:
+            self.neighbors_graph      = None
         self.organisms                = self.organisms.union(another_pan.organisms)
         self.nb_organisms             = len(self.organisms)
-        self.circular_contig_size     = self.circular_contig_size.update(another_pan.circular_contig_size)
+        self.circular_contig_size.update(another_pan.circular_contig_size)
         self.families_repeted         = self.families_repeted.union(another_pan.families_repeted)
         self.pan_size                 = 0
         self.is_partitionned          = False
@@ -385,11 +522,34 @@ class PPanGGOLiN:
         self.partitions["core_exact"] = list()
         self.partitions["accessory"]  = list()
         self.BIC                      = None
+        self.index                    = None
 
-        self.__neighborhood_computation()
+        if mergeable:
+            self.pan_size = nx.number_of_nodes(self.neighbors_graph)
+        else:
+            self.__neighborhood_computation(directed = self.directed)
 
         return(self)
 
+    def write_shard(self, shard_file_path):
+        """
+            Write the partial pangenome of the organisms of this instance in a shard file so that the pangenome of a large number of organisms can be built by several processes or machines, each one building the graph of a subset of the organisms (see __initialize_from_shards).
+            The file contains a header (organisms, contigs sizes, removed families), the graph (nodes, edges, presence and coverage) and the annotations of each organism, pickled in this order (the file is replaced atomically).
+            :param shard_file_path: a str containing the path of the shard file
+            :type str: 
+        """
+        header = {"format"               : SHARD_FORMAT,
+                  "organisms"            : list(self.organisms),
+                  "circular_contig_size" : dict(self.circular_contig_size),
+                  "families_repeted"     : set(self.families_repeted),
+                  "directed"             : self.directed}
+        with open(shard_file_path+".tmp","wb") as shard_file:
+            pickle.dump(header, shard_file, protocol = pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.neighbors_graph, shard_file, protocol = pickle.HIGHEST_PROTOCOL)
+            for organism in self.organisms:
+                pickle.dump(self.annotations[organism], shard_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(shard_file_path+".tmp", shard_file_path)
+
     def __add_gene(self, fam_id, org, gene, name, length, product, graph_type = "neighbors_graph"):
         """
             Add gene to the pangenome graph
@@ -408,26 +568,8 @@ class PPanGGOLiN:
             :type str: 
             :type str: 
         """ 
-        graph = self.neighbors_graph
-        if graph_type == "untangled_neighbors_graph":
-            graph = self.untangled_neighbors_graph
-
-        graph.add_node(fam_id)
-
-        try: 
-            graph.node[fam_id]["nb_genes"]+=1
-        except KeyError:
-            graph.node[fam_id]["nb_genes"]=1
-        try:
-            graph.node[fam_id][org].add(gene)
-        except KeyError:
-            graph.node[fam_id][org] = set([gene])
-
-        for attribute in ["name","length","product"]:
-            try:
-                graph.node[fam_id][attribute].add(locals()[attribute])
-            except KeyError:
-                graph.node[fam_id][attribute]=set([locals()[attribute]])
+        graph = self.untangled_neighbors_graph if graph_type == "untangled_neighbors_graph" else self.neighbors_graph
+        add_gene_to_node(graph, fam_id, org, gene, name, length, product)
 
     def __add_link(self, fam_id, fam_id_nei, org, length, graph_type = "neighbors_graph"):
         """
@@ -440,25 +582,46 @@ class PPanGGOLiN:
             :type str:
             :type str: 
         """ 
-        graph = self.neighbors_graph
-        if graph_type == "untangled_neighbors_graph":
-            graph = self.untangled_neighbors_graph
+        graph = self.untangled_neighbors_graph if graph_type == "untangled_neighbors_graph" else self.neighbors_graph
+        add_link_to_edge(graph, fam_id, fam_id_nei, org, length)
 
-        if not self.neighbors_graph.has_edge(fam_id,fam_id_nei):
-            graph.add_edge(fam_id, fam_id_nei)
-            # logging.getLogger().debug([str(i) for i in [fam_id, fam_id_nei, org]])
-        try:
-            graph[fam_id][fam_id_nei][org]+=1
-        except KeyError:
-            graph[fam_id][fam_id_nei][org]=1
-            try:
-                graph[fam_id][fam_id_nei]["weight"]+=1.0
-            except KeyError:
-                graph[fam_id][fam_id_nei]["weight"]=1.0
-        try:
-            graph[fam_id][fam_id_nei]["length"].add(length)
-        except KeyError:
-            graph[fam_id][fam_id_nei]["length"]=set([length])
+    def add_contig(self, organism, genes, circular_size = None, graph_type = "neighbors_graph"):
+        """
+            Add all the genes of a contig and the links between consecutive genes to the pangenome graph at once
+            :param organism: The organism name
+            :param genes: a list of tuples (gene identifier, annotation of the gene as stored in the annotations attribute) sorted by position on the contig (the genes of the removed families must already be filtered)
+            :param circular_size: the size of the contig if it is circular (the last gene is then linked to the first one) or None
+            :param graph_type: the graph to update ("neighbors_graph" or "untangled_neighbors_graph")
+            :type str: 
+            :type list: 
+            :type int: 
+            :type str: 
+        """
+        if len(genes) == 0:
+            return
+        graph = self.untangled_neighbors_graph if graph_type == "untangled_neighbors_graph" else self.neighbors_graph
+        (prev_family, prev_end) = (None, None)
+        for gene, gene_info in genes:
+            family = gene_info[FAMILY]
+            add_gene_to_node(graph, family, organism, gene, gene_info[NAME], gene_info[END]-gene_info[START], gene_info[PRODUCT])
+            if prev_family is not None:
+                add_link_to_edge(graph, family, prev_family, organism, gene_info[START] - prev_end)
+            (prev_family, prev_end) = (family, gene_info[END])
+        if circular_size is not None:#circularization
+            first_info = genes[0][1]
+            add_link_to_edge(graph, first_info[FAMILY], prev_family, organism, (circular_size - prev_end) + first_info[START])
+
+    def __add_organism_to_graph(self, organism, annotations):
+        """ Add the genes of an organism and the links between them to the pangenome graph 
+            :param organism: a str containing the organism name
+            :param annotations: a dict having the contigs of the organism as keys and the OrderedDict of its genes as value
+            :type str: 
+            :type dict:
+        """ 
+        families_repeted = self.families_repeted
+        for contig, contig_annot in annotations.items():
+            genes = [(gene, gene_info) for gene, gene_info in contig_annot.items() if gene_info[FAMILY] not in families_repeted]
+            self.add_contig(organism, genes, self.circular_contig_size[contig] if contig in self.circular_contig_size else None)
 
     def __neighborhood_computation(self, directed = False, update=False):#,light = False, 
         """ Use the information already loaded (annotation) to build the pangenome graph
@@ -482,57 +645,91 @@ class PPanGGOLiN:
             if not update:
                 orgs.set_description("Processing "+organism)
                 orgs.refresh()
-            for contig, contig_annot in self.annotations[organism].items():
-                try:
-                    (gene_start, gene_info_start) = contig_annot.popitem(last=False)
-                    while (gene_info_start[FAMILY] in self.families_repeted):
-                            (gene_start, gene_info_start) = contig_annot.popitem(last=False)
-                except KeyError:
-                    continue
-                    
-                self.__add_gene(gene_info_start[FAMILY],
-                                organism,
-                                gene_start,
-                                gene_info_start[NAME],
-                                gene_info_start[END]-gene_info_start[START],
-                                gene_info_start[PRODUCT])
-                self.index[gene_start]=(organism,contig,0)
-
-                family_id_nei, end_family_nei  = gene_info_start[FAMILY], gene_info_start[END]
-                logging.getLogger().debug(gene_info_start)
-                for pos, (gene, gene_info) in enumerate(contig_annot.items()):
-                    logging.getLogger().debug(gene_info)
-                    logging.getLogger().debug(gene)
-                    if gene_info[FAMILY] not in self.families_repeted:
-                        self.__add_gene(gene_info[FAMILY],
-                                        organism,
-                                        gene,
-                                        gene_info[NAME],
-                                        gene_info[END]-gene_info[START],
-                                        gene_info[PRODUCT])
-                        self.index[gene]=(organism,contig,pos+1)
-                        self.neighbors_graph.add_node(family_id_nei)
-                        self.__add_link(gene_info[FAMILY],family_id_nei,organism, gene_info[START] - end_family_nei)
-                        family_id_nei  = gene_info[FAMILY]
-                        end_family_nei = gene_info[END]
-                
-                if contig in self.circular_contig_size:#circularization
-                    self.__add_link(gene_info_start[FAMILY],family_id_nei,organism, (self.circular_contig_size[contig] - end_family_nei) + gene_info_start[START])
-
-                if sys.version_info < (3,):
-                    ordered_dict_prepend(contig_annot,gene_start,gene_info_start)#insert at the top
-                else:
-                    contig_annot[gene_start]=gene_info_start
-                    contig_annot.move_to_end(gene_start, last=False)#move to the beginning
+            self.__add_organism_to_graph(organism, self.annotations[organism])
             # if light:
             #     del self.annotations[organism]
 
         self.pan_size = nx.number_of_nodes(self.neighbors_graph)
 
+    def compress_neighbors_graph(self):
+        """
+            Merge each maximal unbranched path of the neighbors_graph (chain of families having exactly two neighbors, i.e. a syntenic block) in a single node to obtain a compact view of the graph stored in compressed_neighbors_graph.
+            A block node aggregates the attributes of its families (genes of each organism, names, products, lengths and number of genes), gets the most frequent partition of its families and lists them in order in its "families" attribute.
+            The families outside the blocks keep their name. The edges between blocks aggregate the edges between their families.
+            The mapping between the blocks and the families is stored in the blocks attribute.
+            :return: the compressed graph
+            :rtype: nx.Graph
+        """
+        graph = self.neighbors_graph
+        undirected = graph.to_undirected(as_view=True) if graph.is_directed() else graph
+        compressed = nx.DiGraph() if graph.is_directed() else nx.Graph()
+
+        block_of = {}
+        self.blocks = {}
+        for chain in degree_two_chains(undirected):
+            if len(chain) > 1:
+                block = chain[0]+BLOCK_SEPARATOR+chain[-1]
+                self.blocks[block] = chain
+                for fam in chain:
+                    block_of[fam] = block
+        for fam in graph.nodes():
+            if fam not in block_of:
+                block_of[fam] = fam
+                self.blocks[fam] = [fam]
+
+        for block, families in self.blocks.items():
+            if len(families) == 1:
+                compressed.add_node(block, **copy.deepcopy(graph.nodes[block]))# the layout of the compressed graph must not move the family in neighbors_graph
+                continue
+            data = {"families":list(families), "nb_families":len(families), "nb_genes":0}
+            for fam in families:
+                for key, value in graph.nodes[fam].items():
+                    if key == "nb_genes":
+                        data["nb_genes"] += value
+                    elif key == "length":
+                        data.setdefault(key, LengthStats()).merge(value)
+                    elif key in self.organisms or key in ("name", "product"):
+                        data.setdefault(key, set()).update(value)
+            for key in ("partition", "partition_exact"):
+                if key in graph.nodes[families[0]]:
+                    data[key] = Counter([graph.nodes[fam][key] for fam in families]).most_common(1)[0][0]
+            if "partition" in data:
+                data["viz"] = {"color":COLORS_RGB[data["partition"]], "size":len([org for org in self.organisms if org in data])}
+            compressed.add_node(block, **data)
+
+        for fam, fam_nei, data in graph.edges(data=True):
+            (block, block_nei) = (block_of[fam], block_of[fam_nei])
+            if block == block_nei:
+                continue
+            if not compressed.has_edge(block, block_nei):
+                compressed.add_edge(block, block_nei, length = LengthStats())
+            edge = compressed[block][block_nei]
+            for key, value in data.items():
+                if key in self.organisms:
+                    edge[key] = edge.get(key, 0)+value
+                elif key == "length":
+                    edge["length"].merge(value)
+            edge["weight"] = float(len([org for org in self.organisms if org in edge]))
+
+        logging.getLogger().info("Compressed graph: "+str(compressed.number_of_nodes())+" nodes ("+str(graph.number_of_nodes())+" families) and "+str(compressed.number_of_edges())+" edges ("+str(graph.number_of_edges())+")")
+        self.compressed_neighbors_graph = compressed
+        return(compressed)
+
     def untangle_neighbors_graph(self, K = 3):
-        
+        """
+            Split the families whose flanking families are not consistent among the organisms (paths of up to K families are tested, from k=1 to K)
+            Each contig is encoded once as an array of integer family identifiers and the occurrences of the seed paths are found using an index of the windows of families (see FamilyWindowIndex), 
+            the flanking families of each occurrence are then directly read in the contig arrays. The result is stored in the untangled_neighbors_graph attribute.
+            :param K: the maximum size of the paths to untangle
+            :type int:
+        """
         self.untangled_neighbors_graph = self.neighbors_graph.copy()
-        
+        if isinstance(self.annotations, AnnotationStore):
+            logging.getLogger().warning("Untangling the graph requires to load all the annotations in memory")
+            self.annotations = OrderedDict(self.annotations.items())
+            self.index       = None
+        windows = FamilyWindowIndex(self.gene_index(), self.annotations, self.families_repeted, self.circular_contig_size)
+
         separation_tree = defaultdict(set)
 
         def absolute_orientation(a_list):
@@ -545,17 +742,12 @@ class PPanGGOLiN:
 
         def update_seed_path(seed_path):
             new_seed_paths = set()
-            try:
-                for i, element in enumerate(seed_path):
-                    
-                        if element in separation_tree:
-                            print(element)
-                            for child in separation_tree[element]:
-                                new_seed_path = list(seed_path)
-                                new_seed_path[i]=child
-                                new_seed_paths.add(tuple(new_seed_path))
-            except TypeError as e:
-                pdb.set_trace()
+            for i, element in enumerate(seed_path):
+                if element in separation_tree:
+                    for child in separation_tree[element]:
+                        new_seed_path = list(seed_path)
+                        new_seed_path[i]=child
+                        new_seed_paths.add(tuple(new_seed_path))
             return(new_seed_paths)
 
         def extends_seeds(all_path_k):
@@ -567,11 +759,8 @@ class PPanGGOLiN:
                     try:
                         for nei in self.untangled_neighbors_graph.neighbors(p[0]):
                             path = (nei,)+p
-                            
-                            #absolute_orientation(path)# give an absolute orientation
-                            all_path_k_p_1.add(absolute_orientation(path))
+                            all_path_k_p_1.add(absolute_orientation(path))# give an absolute orientation
                     except nx.exception.NetworkXError as e:
-                        print(path)
                         all_path_k.extendleft(update_seed_path(p))
                         continue
             return(all_path_k_p_1)
@@ -597,105 +786,20 @@ class PPanGGOLiN:
             except StopIteration:
                 return {}
 
-        # def filter_seed_paths(validated_seed_paths):
-        #     print("validated_seed_paths: "+str(len(validated_seed_paths)))
-        #     filtered_validated_seed_paths = set()
-        #     for validated_seed_path in validated_seed_paths:
-        #         for fam in validated_seed_path:
-        #             if fam in self.untangled_neighbors_graph:
-        #                 filtered_validated_seed_paths.add(validated_seed_path)
-
-        #     print("filtered_validated_seed_paths: "+str(len(filtered_validated_seed_paths)))
-        #     return(filtered_validated_seed_paths)
-
-        def align_on_graph(path):
+        def flanked_occurrences(seed_path):
+            """ group the occurrences of the seed path flanked by two distinct families by pair of flanking families """
             extremities_seed_path = defaultdict(lambda: defaultdict(set))
-
-            
-            path_complete=defaultdict(lambda : False)
-
-            #print(path)
-            #pdb.set_trace()
-            for org in [o for o in self.untangled_neighbors_graph.nodes[path[0]] if o not in RESERVED_WORDS]:
-                for gene in self.untangled_neighbors_graph.nodes[path[0]][org]:
-                    logging.getLogger().debug("here"+gene)
-                    (pos,contig)   = (self.index[gene][POSITION_INDEX],self.index[gene][CONTIG_INDEX])
-                    orientation    = None
-                    path_exist     = True
-                    tmp_path       = list()                                
-                    tmp_path.append(self.index.inv[(org,contig,pos)])
-                    circular = sys.maxsize if contig not in self.circular_contig_size else len(self.annotations[org][contig])
-                    for i, fam in enumerate(path[1:]):
-                        try:
-                            if orientation is None:
-                                if fam == self.annotations[org][contig][self.index.inv[(org,contig,(pos+(i+1))%circular)]][FAMILY]:
-                                    orientation = 1
-                                elif fam == self.annotations[org][contig][self.index.inv[(org,contig,(pos-(i+1))%circular)]][FAMILY]:
-                                    orientation = -1
-                                else:
-                                    path_exist = False
-                                    break
-                            gene_i = self.index.inv[(org,contig,(pos+((i+1)*orientation))%circular)]
-                            
-                            #logging.getLogger().debug("fam="+fam+"  gene_i="+gene_i+"    self.annotations[org][contig][gene_i][FAMILY]="+self.annotations[org][contig][gene_i][FAMILY])
-                            if fam == self.annotations[org][contig][gene_i][FAMILY]:
-                                tmp_path.append(gene_i)
-                            else:
-                                path_exist = False
-                                break
-                        except KeyError:
-                            break
-                    if path_exist:
-                        if len(tmp_path) == len(path):
-                            path_complete[frozenset([path[0],path[len(path)-1]])] = True
-                            extremities_seed_path[frozenset([path[0],path[len(path)-1]])][org].add(absolute_orientation(tuple(tmp_path)))
-                        else:
-                            path_complete[frozenset([path[0],path[len(path)-1]])] = path_complete[frozenset([path[0],path[len(path)-1]])]
-                            extremities_seed_path[frozenset([path[0],path[len(path)-1]])][org].add(tuple(tmp_path))
-                        logging.getLogger().debug(tmp_path)
-            for org in [o for o in self.untangled_neighbors_graph.nodes[path[len(path)-1]] if o not in RESERVED_WORDS]:
-                # if org == "org1" and path == ('fam1', 'fam2_5', 'fam2_5_bis', 'fam3',):
-                #     pdb.set_trace()
-                for gene in self.untangled_neighbors_graph.nodes[path[len(path)-1]][org]:
-                    logging.getLogger().debug("here"+gene)
-                    (pos,contig)   = (self.index[gene][POSITION_INDEX],self.index[gene][CONTIG_INDEX])
-                    orientation    = None
-                    path_exist     = True
-                    tmp_path       = list()
-                    tmp_path.append(self.index.inv[(org,contig,pos)])
-                    circular = sys.maxsize if contig not in self.circular_contig_size else len(self.annotations[org][contig])
-                    for i, fam in enumerate(reversed(path[:len(path)-1])):
-                        try:
-                            if orientation is None:
-                                if fam == self.annotations[org][contig][self.index.inv[(org,contig,(pos+(i+1))%circular)]][FAMILY]:
-                                    orientation = 1
-                                elif fam == self.annotations[org][contig][self.index.inv[(org,contig,(pos-(i+1))%circular)]][FAMILY]:
-                                    orientation = -1
-                                else:
-                                    path_exist = False
-                                    break
-                            gene_i = self.index.inv[(org,contig,(pos+((i+1)*orientation))%circular)]
-                            logging.getLogger().debug("fam="+fam+"  gene_i="+gene_i+"    self.annotations[org][contig][gene_i][FAMILY]="+self.annotations[org][contig][gene_i][FAMILY])
-                            if fam == self.annotations[org][contig][gene_i][FAMILY]:
-                                tmp_path.append(gene_i)
-                            else:
-                                path_exist = False
-                                break
-                        except KeyError:
-                            break
-                    if path_exist:
-                        if len(tmp_path) == len(path):
-                            path_complete[frozenset([path[0],path[len(path)-1]])] = True
-                            extremities_seed_path[frozenset([path[0],path[len(path)-1]])][org].add(absolute_orientation(tuple(tmp_path)))
-                        else:
-                            path_complete[frozenset([path[0],path[len(path)-1]])] = path_complete[frozenset([path[0],path[len(path)-1]])]
-                            extremities_seed_path[frozenset([path[0],path[len(path)-1]])][org].add(tuple(tmp_path))
-                        
-                        logging.getLogger().debug(tmp_path)
-            #print(path_complete)
-            for ext,complete in path_complete.items():
-                if not complete:
-                    del extremities_seed_path[ext]
+            set_seed_path = set(seed_path)
+            for (nei_left, nei_right, org, genes) in windows.flanked_occurrences(seed_path):
+                if nei_left not in self.untangled_neighbors_graph or nei_right not in self.untangled_neighbors_graph:
+                    continue
+                if nei_left in set_seed_path and nei_left != seed_path[0] and nei_left != seed_path[-1]:
+                    continue
+                if nei_right in set_seed_path and nei_right != seed_path[0] and nei_right != seed_path[-1]:
+                    continue
+                extremities = frozenset([nei_left,nei_right])
+                if len(extremities)>1:
+                    extremities_seed_path[extremities][org].add(absolute_orientation(genes))
             return(extremities_seed_path)
 
         validated_seed_paths = set()
@@ -705,68 +809,28 @@ class PPanGGOLiN:
             if k == 1:
                 LILO_seed_paths = deque([(p,) for p in self.untangled_neighbors_graph.nodes()])
             else:
-                logging.getLogger().debug(validated_seed_paths)
                 LILO_seed_paths = deque(extends_seeds(validated_seed_paths))
                 validated_seed_paths = set()
-            #pdb.set_trace()
-            inc= 0
             with tqdm(total=len(LILO_seed_paths)) as pbar:
                 while LILO_seed_paths:
-                    inc+=1
-                    
-
                     seed_path = LILO_seed_paths.popleft()
                     pbar.update(1)
-                    
-                    neighbors=set()
-                    all_extremities_seed_path = defaultdict(lambda: defaultdict(set))
-                    extremity_groups=None
-                    #print(seed_path)
-                    if seed_path is not None:
-                        new_seed_paths = update_seed_path(seed_path)
-                        if len(new_seed_paths)>0:
-                            LILO_seed_paths.extendleft(new_seed_paths)
-                            continue
-                    else:
-                            continue
-                    #print(separation_tree)
-                    tested_extremities=set()
-                    neighbors = set()
-                    set_seed_path = set(seed_path)
-                    
-                    try :
-                        #if nx.degree(self.untangled_neighbors_graph,seed_path[0])>2 and nx.degree(self.untangled_neighbors_graph,seed_path[k-1])>2:
-                        for nei_left in self.untangled_neighbors_graph.neighbors(seed_path[0]):
-                            if nei_left in set_seed_path and nei_left != seed_path[0] and nei_left != seed_path[k-1]:
-                                continue
-                            for nei_right in self.untangled_neighbors_graph.neighbors(seed_path[k-1]):
-                                if nei_right in set_seed_path and nei_left != seed_path[0] and nei_left != seed_path[k-1]:
-                                    continue
-                                extremities = frozenset([nei_right,nei_left])
-                                if len(extremities)>1 and extremities not in tested_extremities:
-                                    flanked_seed_path = (nei_left,)+seed_path+(nei_right,)
-                                    logging.getLogger().debug(flanked_seed_path)
-                                    res = align_on_graph(flanked_seed_path)
-                                    all_extremities_seed_path.update(res)
-                                    # pdb.set_trace()
-                                    if len(res)>0:
-                                        # validated_neighbors.add(nei_left)
-                                        # validated_neighbors.add(nei_rigth)
-                                        validated_seed_paths.add(seed_path)# way to extends seeds in a optimized way
-                                        logging.getLogger().debug("validated: "+str(seed_path))
-                                    tested_extremities.add(extremities)
-                    except:
-                        logging.getLogger().debug(seed_path[0]+"not in graph")
-                        pass
+                    if seed_path is None:
+                        continue
+                    new_seed_paths = update_seed_path(seed_path)
+                    if len(new_seed_paths)>0:
+                        LILO_seed_paths.extendleft(new_seed_paths)
+                        continue
+                    if seed_path[0] not in self.untangled_neighbors_graph or seed_path[-1] not in self.untangled_neighbors_graph:
+                        logging.getLogger().debug(str(seed_path)+" not in graph")
+                        continue
 
+                    all_extremities_seed_path = flanked_occurrences(seed_path)
+                    if len(all_extremities_seed_path)>0:
+                        validated_seed_paths.add(seed_path)# way to extends seeds in a optimized way
+                        logging.getLogger().debug("validated: "+str(seed_path))
 
-                    #not_validated_neighbors = neighbors - validated_seed_paths
-                    #logging.getLogger().debug(all_extremities_seed_path)
                     extremity_groups = merge_overlapping_extremities(all_extremities_seed_path)
-                    #print(extremity_groups)
-                    #pdb.set_trace()
-                    # if inc>10000:
-                    #     pdb.set_trace()
                     if len(extremity_groups) > 1:
                         #separation
                         for nb, extremitiy_group in enumerate(extremity_groups):
@@ -776,49 +840,102 @@ class PPanGGOLiN:
                                 if extremity & extremitiy_group:
                                     gene_info_prec = None
                                     for org, gene_series in org_genes.items():
-                                        # if org == "org1":
-                                        #     pdb.set_trace()
                                         for genes in gene_series:
-                                            gene_info_prec = self.annotations[org][self.index[genes[0]][CONTIG_INDEX]][genes[0]]
+                                            gene_info_prec = self.annotations[org][windows.contig(genes[0])][genes[0]]
                                             new_seed_path[0]= gene_info_prec[FAMILY]
                                             for i, gene in enumerate(genes[1:]):
-                                                gene_info = self.annotations[org][self.index[gene][CONTIG_INDEX]][gene]
-                                                logging.getLogger().debug(gene_info[FAMILY])
-                                                new_family_name = gene_info[FAMILY]+suffix
-                                                new_seed_path[i+1]=new_family_name
-                                                if i < k:                                                   
+                                                contig    = windows.contig(gene)
+                                                gene_info = self.annotations[org][contig][gene]
+                                                if i < k:
+                                                    new_family_name = gene_info[FAMILY]+suffix
                                                     if gene_info[FAMILY] in self.untangled_neighbors_graph:
-                                                        #some things to do                                                        
                                                         self.untangled_neighbors_graph.remove_node(gene_info[FAMILY])
                                                     separation_tree[gene_info[FAMILY]].add(new_family_name)
                                                     
                                                     self.__add_gene(new_family_name,org,gene,gene_info[NAME],gene_info[END]-gene_info[START],gene_info[PRODUCT],"untangled_neighbors_graph")
-                                                    self.annotations[org][self.index[gene][CONTIG_INDEX]][gene][FAMILY]=new_family_name
+                                                    self.annotations[org][contig][gene][FAMILY]=new_family_name
+                                                    windows.rename(gene, new_family_name)
                                                     if self.is_partitionned:
                                                         self.untangled_neighbors_graph.nodes[new_family_name]["partition"]="undefined"
-
-                                                    #self.untangled_neighbors_graph.nodes[new_family_name]["untangled"]=k
+                                                new_seed_path[i+1]=gene_info[FAMILY]
                                                 # circular cases
-                                                
                                                 length = (gene_info[START] - gene_info_prec[END]) if (gene_info_prec[START] < gene_info[START]) else (gene_info_prec[START] - gene_info[END])
-                                                self.__add_link(self.annotations[org][self.index[gene][CONTIG_INDEX]][gene][FAMILY], gene_info_prec[FAMILY], org, length,"untangled_neighbors_graph")
+                                                self.__add_link(gene_info[FAMILY], gene_info_prec[FAMILY], org, length,"untangled_neighbors_graph")
                                                 
                                                 gene_info_prec = gene_info
 
-                                            LILO_seed_paths.extend(tuple(new_seed_path[1:len(new_seed_path)-1]))
-                                            #pdb.set_trace()
+                                            LILO_seed_paths.append(tuple(new_seed_path[1:len(new_seed_path)-1]))
                                             validated_seed_paths.add(tuple(new_seed_path[1:len(new_seed_path)-1]))
                                             validated_seed_paths.add(tuple(new_seed_path[0:len(new_seed_path)-2]))
                                             validated_seed_paths.add(tuple(new_seed_path[2:len(new_seed_path)]))
-                        
+
+    def gene_index(self):
+        """
+            Build (the first time it is required) and return the positional index of the genes
+            :return: the index of the genes
+            :rtype: GeneIndex
+        """
+        if self.index is None:
+            logging.getLogger().debug("Indexing the position of the genes...")
+            self.index = GeneIndex(self.annotations)
+        return(self.index)
+
+    def __write_nem_matrix_from_graph(self, organisms, index_file, dat_file, nei_file, filter_by_partition = None):
+        """
+            Write the .index, .dat and .nei NEM files by walking the neighbors graph and return the index of the written families 
+        """
+        index_fam = OrderedDict()
+        for node_name, node_organisms in self.neighbors_graph.nodes(data=True):
+            if filter_by_partition is not None and "partition" in node_organisms and node_organisms["partition"] != filter_by_partition:
+                continue
+            logging.getLogger().debug(node_organisms)
+            logging.getLogger().debug(organisms)
+
+            if not organisms.isdisjoint(node_organisms): # if at least one commun organism
+                dat_file.write("\t".join(["1" if org in node_organisms else "0" for org in organisms])+"\n")
+                index_fam[node_name] = len(index_fam)+1
+                index_file.write(str(len(index_fam))+"\t"+str(node_name)+"\n")
+        for node_name, index in index_fam.items():
+            row_fam         = []
+            row_dist_score  = []
+            neighbor_number = 0
+            try:
+                for neighbor in set(nx.all_neighbors(self.neighbors_graph, node_name)):
+                    if neighbor not in index_fam:# neighbor filtered out (by partition or absent of the selected organisms)
+                        continue
+                    coverage = 0
+                    if self.neighbors_graph.is_directed():
+                        cov_sens, cov_antisens = (0,0)
+                        try:
+                            cov_sens = sum([pre_abs for org, pre_abs in self.neighbors_graph[node_name][neighbor].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
+                        except KeyError:
+                            pass
+                        try:
+                            cov_antisens = sum([pre_abs for org, pre_abs in self.neighbors_graph[neighbor][node_name].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
+                        except KeyError:
+                            pass
+                        coverage = cov_sens + cov_antisens
                     else:
-                        pass#validated_seed_paths
-                                                #add new seed to LILO queue 
-                                                # think to non_valided_neibors
-                                                #refine validated_seed_paths
-                    all_extremities_seed_path = None
+                        coverage = sum([pre_abs for org, pre_abs in self.neighbors_graph[node_name][neighbor].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
 
-    def __write_nem_input_files(self, nem_dir_path, organisms, init = "default", low_disp=0.1, filter_by_partition = None):
+                    if coverage==0:
+                        continue
+                    distance_score = coverage#/len(organisms)
+                    row_fam.append(str(index_fam[neighbor]))
+                    row_dist_score.append(str(round(distance_score,4)))
+                    neighbor_number += 1
+                if neighbor_number>0:
+                    nei_file.write("\t".join([str(item) for sublist in [[index_fam[node_name]],[neighbor_number],row_fam,row_dist_score] for item in sublist])+"\n")
+                else:
+                    nei_file.write(str(index_fam[node_name])+"\t0\n")
+                    logging.getLogger().debug("The family: "+node_name+" is an isolated family in the selected organisms")
+            except nx.exception.NetworkXError as nxe:
+                print(nxe)
+                logging.getLogger().debug("The family: "+node_name+" is an isolated family")
+                nei_file.write(str(index_fam[node_name])+"\t0\n")
+        return(index_fam)
+
+    def __write_nem_input_files(self, nem_dir_path, organisms, init = "default", low_disp=0.1, filter_by_partition = None, collapse = False):
         if len(organisms)<=10:# below 10 organisms a statistical computation do not make any sence
             logging.getLogger().warning("The number of organisms is too low ("+str(len(organisms))+" organisms used) to partition the pangenome graph in persistent, shell and cloud genome. Add new organisms to obtain more robust metrics.")
 
@@ -839,55 +956,11 @@ class PPanGGOLiN:
             org_file.write(" ".join(["\""+org+"\"" for org in organisms])+"\n")
             org_file.close()
 
-            index_fam = OrderedDict()
-            for node_name, node_organisms in self.neighbors_graph.nodes(data=True):
-                if filter_by_partition is not None and "partition" in node_organisms and node_organisms["partition"] != filter_by_partition:
-                    continue
-                logging.getLogger().debug(node_organisms)
-                logging.getLogger().debug(organisms)
-                
-                if not organisms.isdisjoint(node_organisms): # if at least one commun organism
-                    dat_file.write("\t".join(["1" if org in node_organisms else "0" for org in organisms])+"\n")
-                    index_fam[node_name] = len(index_fam)+1
-                    index_file.write(str(len(index_fam))+"\t"+str(node_name)+"\n")
-            for node_name, index in index_fam.items():
-                row_fam         = []
-                row_dist_score  = []
-                neighbor_number = 0
-                try:
-                    for neighbor in set(nx.all_neighbors(self.neighbors_graph, node_name)):
-                        if filter_by_partition is not None and "partition" in self.neighbors_graph.node[neighbor] and self.neighbors_graph.node[neighbor]["partition"] == filter_by_partition:
-                            continue
-                        coverage = 0
-                        if self.neighbors_graph.is_directed():
-                            cov_sens, cov_antisens = (0,0)
-                            try:
-                                cov_sens = sum([pre_abs for org, pre_abs in self.neighbors_graph[node_name][neighbor].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
-                            except KeyError:
-                                pass
-                            try:
-                                cov_antisens = sum([pre_abs for org, pre_abs in self.neighbors_graph[neighbor][node_name].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
-                            except KeyError:
-                                pass
-                            coverage = cov_sens + cov_antisens
-                        else:
-                            coverage = sum([pre_abs for org, pre_abs in self.neighbors_graph[node_name][neighbor].items() if ((org in organisms) and (org not in RESERVED_WORDS))])
-
-                        if coverage==0:
-                            continue
-                        distance_score = coverage#/len(organisms)
-                        row_fam.append(str(index_fam[neighbor]))
-                        row_dist_score.append(str(round(distance_score,4)))
-                        neighbor_number += 1
-                    if neighbor_number>0:
-                        nei_file.write("\t".join([str(item) for sublist in [[index_fam[node_name]],[neighbor_number],row_fam,row_dist_score] for item in sublist])+"\n")
-                    else:
-                        nei_file.write(str(index_fam[node_name])+"\t0\n")
-                        logging.getLogger().debug("The family: "+node_name+" is an isolated family in the selected organisms")
-                except nx.exception.NetworkXError as nxe:
-                    print(nxe)
-                    logging.getLogger().debug("The family: "+node_name+" is an isolated family")
-                    nei_file.write(str(index_fam[node_name])+"\t0\n")
+            if self.shared is not None and filter_by_partition is None:
+                nb_fam = self.shared.write_nem_input_files(organisms, index_file, dat_file, nei_file)
+                index_fam = range(nb_fam)
+            else:
+                index_fam = self.__write_nem_matrix_from_graph(organisms, index_file, dat_file, nei_file, filter_by_partition)
 
             if init is not None:
                 m_file.write("1 ")# 1 to initialize parameter,
@@ -929,6 +1002,77 @@ class PPanGGOLiN:
             str_file.write("S\t"+str(len(index_fam))+"\t"+
                                  str(len(organisms))+"\n")
 
+        if collapse:
+            collapse_nem_input_files(nem_dir_path)
+        elif os.path.lexists(nem_dir_path+"/nem_file.wei"):
+            os.remove(nem_dir_path+"/nem_file.wei")# weights of a previous collapsed run
+
+    def __set_partitions(self, partitions, BIC = 0, posteriors = {}):
+        """
+            Store the partition of each family in the object (attributes of the nodes of the neighbors graph and partitions lists)
+            :param partitions: a dict having the families as keys and their partition ("P", "S", "C" or "U") as value
+            :param BIC: a float containing the BIC of the partitioning
+            :param posteriors: a dict having the families as keys and the posterior probabilities of the persistent, shell and cloud classes as value
+            :type dict:
+            :type float:
+            :type dict:
+        """
+        self.BIC = BIC
+        self.partition_posteriors = array("f")
+        self.posteriors_index     = dict()
+        for node, posterior in posteriors.items():
+            self.posteriors_index[node] = len(self.posteriors_index)
+            self.partition_posteriors.extend(posterior)
+        if self.is_partitionned:
+            for p in SHORT_TO_LONG.values():
+                self.partitions[p] = list()# erase older values
+        for node, nem_class in partitions.items():
+            nb_orgs=0
+            for key in list(self.neighbors_graph.node[node].keys()):
+                if key not in RESERVED_WORDS:
+                    #self.partitions_by_organisms[key][partition[int(nem_class)]].add(self.neighbors_graph.node[node][key])
+                    nb_orgs+=1
+
+            self.neighbors_graph.node[node]["partition"]=SHORT_TO_LONG[nem_class]
+                
+            self.partitions[SHORT_TO_LONG[nem_class]].append(node)
+
+            if nb_orgs == self.nb_organisms:
+                self.partitions["core_exact"].append(node)#CORE EXACT
+                self.neighbors_graph.node[node]["partition_exact"]="core_exact"
+            elif nb_orgs < self.nb_organisms:
+                self.partitions["accessory"].append(node)#ACCESSORY
+                self.neighbors_graph.node[node]["partition_exact"]="accessory"
+            else:
+                logging.getLogger().error("nb_orgs can't be > to self.nb_organisms")
+                exit(1)
+            self.neighbors_graph.nodes[node]["viz"]={}
+            if nem_class != "U":
+                self.neighbors_graph.nodes[node]["viz"]['color']=COLORS_RGB[self.neighbors_graph.node[node]["partition"]]
+            else:
+                self.neighbors_graph.nodes[node]["viz"]['color']=COLORS_RGB[self.neighbors_graph.node[node]["partition_exact"]]
+            self.neighbors_graph.nodes[node]["viz"]['size']=nb_orgs
+        if self.families_repeted_th > 0:
+            if len(self.families_repeted)>0:
+                logging.getLogger().info("Gene families that have been discarded because there are repeated:\t"+" ".join(self.families_repeted))
+            else:
+                logging.getLogger().info("No gene families have been discarded because there are repeated")
+
+        logging.getLogger().debug(nx.number_of_edges(self.neighbors_graph))
+
+        self.is_partitionned=True
+        self.compute_neighbors_partitions()
+
+    def posterior(self, family):
+        """
+            :return: the posterior probabilities of the persistent, shell and cloud classes of family (averaged over the chunks if the pangenome was partitioned by chunks) or None if they are unknown
+            :rtype: tuple
+        """
+        row = self.posteriors_index.get(family)
+        if row is None:
+            return(None)
+        return(tuple(self.partition_posteriors[row*len(POSTERIOR_CLASSES):(row+1)*len(POSTERIOR_CLASSES)]))
+
     def partition(self, nem_dir_path    = tempfile.mkdtemp(),
                         organisms       = None,
                         beta            = 0.5,
@@ -936,9 +1080,16 @@ class PPanGGOLiN:
                         chunck_size     = 500,
                         inplace         = True,
                         just_stats      = False,
-                        nb_threads      = 1):
+                        nb_threads      = 1,
+                        checkpoint_interval = None,
+                        resume          = False,
+                        seed            = None,
+                        parallel_nem    = False,
+                        init_from_profiles = False,
+                        queue           = None):
         """
             Use the graph topology and the presence or absence of genes from each organism into families to partition the pangenome in three groups ('persistent', 'shell' and 'cloud')
+            If inplace and the organisms are not partitioned by chunks, the fitted parameters are kept in the partition_model attribute (see classify)
             . seealso:: Read the Mo Dang's thesis to understand NEM, a summary is available here : http://www.kybernetika.cz/content/1998/4/393/paper.pdf
             :param nem_dir_path: a str containing a path to store temporary file of the NEM program
             :param organisms: a list of organism to used to obtain the partition (must be included in the organism attributes of the object) or None to used all organisms in the object
@@ -948,6 +1099,12 @@ class PPanGGOLiN:
             :param inplace: a boolean specifying if the partition must be stored in the object of returned (throw an error if inplace is true and organisms parameter i not None)
             :param just_stats: a boolean specifying if the partitions must be returned or just stats about them (number of families in each partition)
             :param nb_threads: an integer specifying the number of threads to use (works only if the number of organisms is higher than the chunck_size)
+            :param checkpoint_interval: an int specifying the minimal number of seconds between two checkpoints of the votes of the chunks written in nem_dir_path (None to never write checkpoints, works only if the number of organisms is higher than the chunck_size)
+            :param resume: a bool specifying if the votes, the validated families and the random state saved in the last checkpoint of nem_dir_path must be restored (the finished chunks are not computed again)
+            :param seed: an int used to derive the seed of the sampling of each chunk and of each NEM run (None to use the global random generator and seeds based on the time)
+            :param parallel_nem: a bool specifying if NEM uses nb_threads threads when the organisms are not partitioned by chunks (parallel update of the families, giving the same result whatever nb_threads but not the same as the default sequential update)
+            :param init_from_profiles: a bool specifying if the spatial partitioning (beta > 0) is initialized with the parameters of a first partitioning without smoothing on the unique presence/absence profiles (works only if the number of organisms is not higher than the chunck_size)
+            :param queue: a WorkQueue in which the chunks are submitted to be run by workers (possibly on other machines) instead of local processes, nb_threads is then the number of chunks submitted at the same time (None to run the chunks locally)
             :type str: 
             :type list: 
             :type float: 
@@ -956,6 +1113,12 @@ class PPanGGOLiN:
             :type bool: 
             :type bool: 
             :type int: 
+            :type int: 
+            :type bool: 
+            :type int: 
+            :type bool: 
+            :type bool: 
+            :type WorkQueue: 
         """ 
         
         if organisms is None:
@@ -981,19 +1144,30 @@ class PPanGGOLiN:
         
         #core exact first
         families = []
-        for node_name, data_organisms in self.neighbors_graph.nodes(data=True):
-            compressed_vector = set([True if org in data_organisms else False for org in organisms])
-            if len(compressed_vector)>1:
-                families.append(node_name)
-                stats["accessory"]+=1
-            elif True in compressed_vector:# if size = 1 and contains just True, then core_exact
-                families.append(node_name)
-                stats["core_exact"]+=1
+        if self.shared is not None:
+            for node_name, nb_present in self.shared.nb_present_by_family(organisms):
+                if 0 < nb_present < len(organisms):
+                    families.append(node_name)
+                    stats["accessory"]+=1
+                elif nb_present == len(organisms):
+                    families.append(node_name)
+                    stats["core_exact"]+=1
+        else:
+            for node_name, data_organisms in self.neighbors_graph.nodes(data=True):
+                compressed_vector = set([True if org in data_organisms else False for org in organisms])
+                if len(compressed_vector)>1:
+                    families.append(node_name)
+                    stats["accessory"]+=1
+                elif True in compressed_vector:# if size = 1 and contains just True, then core_exact
+                    families.append(node_name)
+                    stats["core_exact"]+=1
 
         BIC = 0
         
         if len(organisms) > chunck_size:
 
+            if inplace:
+                self.partition_model = None# each chunk has its own parameters
             cpt_partition = OrderedDict()
             for fam in families:
                 cpt_partition[fam]= {"P":0,"S":0,"C":0,"U":0}
@@ -1007,43 +1181,87 @@ class PPanGGOLiN:
             validated = set()
             cpt=0
 
+            checkpoint_path = nem_dir_path+"/"+PARTITION_CHECKPOINT_FILE
+            if checkpoint_interval is not None and not os.path.exists(nem_dir_path):# the chunks of a queue are written in the queue directory
+                os.makedirs(nem_dir_path)
+            signature       = (list(organisms), chunck_size, beta, free_dispersion, seed)
+            if resume:
+                checkpoint = read_partition_checkpoint(checkpoint_path, signature)
+                if checkpoint is not None:
+                    (cpt_partition, validated, cpt, random_state) = checkpoint
+                    setstate(random_state)
+                    logging.getLogger().info("Resuming the partitioning from "+checkpoint_path+" ("+str(cpt)+" chunks, "+str(len(validated))+" validated families)")
+            last_checkpoint = time()
+            pan_size        = stats["accessory"]+stats["core_exact"]
+
             if inplace:
-                bar = tqdm(total = stats["accessory"]+stats["core_exact"], unit = "families partitionned")
+                bar = tqdm(total = pan_size, unit = "families partitionned")
+                bar.update(len(validated))
 
             sem = Semaphore(nb_threads)
 
-            def validate_family(result):
+            # the results of the chunks are applied in the order of the chunks (and the ones arriving after the validation of all the families are ignored) 
+            # so that the votes do not depend on the number of threads, a checkpoint only counts the chunks whose votes are applied 
+            # (with the random state before the sampling of the first chunk not applied, the chunks still running are sampled again after a resume)
+            pending      = {}
+            applied      = cpt
+            chunk_states = {}# index of a chunk -> random state before its sampling
+
+            def validate_family(index, result):
                 #nonlocal total_BIC
+                nonlocal last_checkpoint, applied
                 try:
-                    partitions = result
-                    #total_BIC += BIC
-                    for node,nem_class in partitions[FAMILIES_PARTITION].items():
-                        cpt_partition[node][nem_class]+=1
-                        sum_partionning = sum(cpt_partition[node].values())
-                        if (sum_partionning > len(organisms)/chunck_size and max(cpt_partition[node].values()) >= sum_partionning*0.5) or (sum_partionning > len(organisms)):
-                            if node not in validated:
-                                if inplace:
-                                    bar.update()
-                                if max(cpt_partition[node].values()) < sum_partionning*0.5:
-                                    cpt_partition[node]["U"] = sys.maxsize #if despite len(organisms) partionning, the abosolute majority is found, then the families is set to undefined 
-                                validated.add(node)
-                                # if max(cpt_partition[node], key=cpt_partition[node].get) == "P" and cpt_partition[node]["S"]==0 and cpt_partition[node]["C"]==0:
-                                        #     validated[node]="P"
-                                        # elif cpt_partition[node]["S"]==0:
-                                        #     validated[node]="C"
-                                        # else:
-                                        #     validated[node]="S" 
+                    pending[index] = result
+                    while applied in pending:
+                        partitions = pending.pop(applied)
+                        chunk_states.pop(applied, None)
+                        applied += 1
+                        if len(validated) < pan_size:
+                            vote(partitions)
+                    if checkpoint_interval is not None and time()-last_checkpoint >= checkpoint_interval:
+                        write_partition_checkpoint(checkpoint_path, signature, cpt_partition, validated, applied, chunk_states.get(applied, getstate()))
+                        last_checkpoint = time()
                 finally:
                     sem.release()
 
-            with contextlib.closing(Pool(processes = nb_threads)) if nb_threads>1 else empty_cm() as pool:
+            def vote(partitions):
+                #total_BIC += BIC
+                # each chunk gives the posterior probabilities of the classes (soft vote) or a vote for undefined if its partitioning failed
+                for node,nem_class in partitions[FAMILIES_PARTITION].items():
+                    posterior = partitions[FAMILIES_POSTERIORS].get(node)
+                    if posterior is None or sum(posterior) <= 0:
+                        cpt_partition[node][nem_class]+=1
+                    else:
+                        for cls, prob in zip(POSTERIOR_CLASSES, posterior):
+                            cpt_partition[node][cls]+=prob/sum(posterior)
+                    sum_partionning = round(sum(cpt_partition[node].values()), 6)# number of chunks including the family (each one adds 1)
+                    if (sum_partionning > len(organisms)/chunck_size and max(cpt_partition[node].values()) >= sum_partionning*0.5) or (sum_partionning > len(organisms)):
+                        if node not in validated:
+                            if inplace:
+                                bar.update()
+                            if max(cpt_partition[node].values()) < sum_partionning*0.5:
+                                cpt_partition[node]["U"] = sys.maxsize #if despite len(organisms) partionning, the abosolute majority is found, then the families is set to undefined 
+                            validated.add(node)
+                            # if max(cpt_partition[node], key=cpt_partition[node].get) == "P" and cpt_partition[node]["S"]==0 and cpt_partition[node]["C"]==0:
+                                    #     validated[node]="P"
+                                    # elif cpt_partition[node]["S"]==0:
+                                    #     validated[node]="C"
+                                    # else:
+                                    #     validated[node]="S" 
+
+            queued = {}# task of the queue -> index of the chunk
+            with contextlib.closing(Pool(processes = nb_threads)) if nb_threads>1 and queue is None else empty_cm() as pool:
             
                 #proba_sample = OrderedDict(zip(organisms,[len(organisms)]*len(organisms)))
 
-                pan_size = stats["accessory"]+stats["core_exact"]
-                
                 while len(validated)<pan_size:
-                    if sem.acquire() if nb_threads>1 else True:#
+                    if queue is not None and not sem.acquire(False):# as many chunks as nb_threads are in the queue, waiting for a result
+                        for task, result in queue.results():
+                            validate_family(queued.pop(task), result)
+                        if not sem.acquire(False):
+                            sleep(queue.poll_interval)
+                            continue
+                    if queue is not None or (sem.acquire() if nb_threads>1 else True):#
                         # print(organisms)
                         # print(chunck_size)
                         # print(proba_sample.values())
@@ -1059,7 +1277,11 @@ class PPanGGOLiN:
                         #s = sum(proba_sample.values())
                         
                         #orgs = np.random.choice(organisms, size = chunck_size, replace = False, p = [p/s for p in proba_sample.values()])#
-                        orgs = sample(organisms,chunck_size)
+                        chunk_states[cpt] = getstate()
+                        if seed is None:
+                            orgs = sample(organisms,chunck_size)
+                        else:
+                            orgs = Random(derive_seed(seed, "chunk", cpt)).sample(organisms,chunck_size)
                         orgs = OrderedSet(orgs)
 
                         # for org, p in proba_sample.items():
@@ -1068,41 +1290,60 @@ class PPanGGOLiN:
                         #     else:
                         #         proba_sample[org] = p + len(organisms)/chunck_size
 
-                        index = self.__write_nem_input_files(nem_dir_path+"/"+str(cpt)+"/",
-                                                             orgs)
-                        if nb_threads>1:
+                        if queue is not None:
+                            (task, chunk_dir_path) = queue.new_task()
+                        else:
+                            chunk_dir_path = nem_dir_path+"/"+str(cpt)+"/"
+                        index = self.__write_nem_input_files(chunk_dir_path,
+                                                             orgs,
+                                                             collapse = beta == 0)
+                        nem_seed = None if seed is None else derive_seed(seed, "chunk", cpt, "nem")
+                        if queue is not None:
+                            queued[task] = cpt
+                            queue.submit(task, len(orgs), beta, free_dispersion, seed = nem_seed)
+                        elif nb_threads>1:
                             res = pool.apply_async(run_partitioning,
                                                    args = (nem_dir_path+"/"+str(cpt)+"/",#nem_dir_path
                                                            len(orgs),
                                                            beta,
-                                                           free_dispersion),                                                        
-                                                   callback = validate_family)
+                                                           free_dispersion),
+                                                   kwds = {"seed":nem_seed},
+                                                   callback = lambda result, index = cpt: validate_family(index, result))
                         else:
                             res = run_partitioning(nem_dir_path+"/"+str(cpt)+"/",#nem_dir_path
                                                    len(orgs),
                                                    beta,
-                                                   free_dispersion)
-                            validate_family(res)
+                                                   free_dispersion,
+                                                   seed = nem_seed)
+                            validate_family(cpt, res)
                         cpt +=1
                     else:
                         sleep(0.01)
 
                     # if inplace:
                     #     bar.update()    
-                if nb_threads>1:
+                if queue is not None:
+                    queue.cancel(list(queued))# the chunks still running are useless
+                elif nb_threads>1:
                     sleep(1)
                     pool.close()
                     pool.join() 
                 #BIC = total_BIC/cpt
                 BIC = 0
+            if checkpoint_interval is not None:
+                write_partition_checkpoint(checkpoint_path, signature, cpt_partition, validated, applied, chunk_states.get(applied, getstate()))
             partitions = dict()
 
             # if just_stats:
             #     print('len(validated)= '+str(len(validated)))
             #     print('len(cpt_partition)= '+str(len(cpt_partition)))
 
+            posteriors = dict()
             for fam, data in cpt_partition.items():
                 partitions[fam]=max(data, key=data.get)
+                total = sum([data[cls] for cls in POSTERIOR_CLASSES])
+                if total > 0:
+                    posteriors[fam] = tuple([data[cls]/total for cls in POSTERIOR_CLASSES])
 
             # if just_stats:
             #     print("stat")
@@ -1120,50 +1361,30 @@ class PPanGGOLiN:
             #     print('total '+str(stats["accessory"]+stats["core_exact"]))
             #     print(' ')
         else:
+            # without smoothing, the families having the same presence/absence profile are partitioned together
             self.__write_nem_input_files(nem_dir_path+"/",
-                                         organisms)
-            partitions = run_partitioning(nem_dir_path, len(organisms), beta, free_dispersion)[FAMILIES_PARTITION]
+                                         organisms,
+                                         collapse = beta == 0)
+            if beta > 0 and init_from_profiles:
+                profiles_dir_path = nem_dir_path+"/profiles/"
+                link_nem_input_files(nem_dir_path, profiles_dir_path, ["nem_file.m", "column_org_file"])
+                collapse_nem_input_files(nem_dir_path, profiles_dir_path)
+                parameters = run_partitioning(profiles_dir_path, len(organisms), 0, free_dispersion, seed = None if seed is None else derive_seed(seed, "profiles"),
+                                              nb_threads = nb_threads if parallel_nem else 1)[PARTITION_PARAMETERS]
+                if len(parameters)>0:
+                    write_nem_param_file(nem_dir_path+"/nem_file.m", parameters)
+            result     = run_partitioning(nem_dir_path, len(organisms), beta, free_dispersion, seed = None if seed is None else derive_seed(seed, "nem"),
+                                          nb_threads = nb_threads if parallel_nem else 1)
+            partitions = result[FAMILIES_PARTITION]
+            posteriors = result[FAMILIES_POSTERIORS]
+            if inplace and len(result[PARTITION_PARAMETERS])>0:
+                self.partition_model = {"organisms"       : list(organisms),
+                                        "parameters"      : result[PARTITION_PARAMETERS],
+                                        "beta"            : beta,
+                                        "free_dispersion" : free_dispersion}
             
         if inplace:
-            self.BIC = BIC
-            if self.is_partitionned:
-                for p in SHORT_TO_LONG.values():
-                    self.partitions[p] = list()# erase older values
-            for node, nem_class in partitions.items():
-                nb_orgs=0
-                for key in list(self.neighbors_graph.node[node].keys()):
-                    if key not in RESERVED_WORDS:
-                        #self.partitions_by_organisms[key][partition[int(nem_class)]].add(self.neighbors_graph.node[node][key])
-                        nb_orgs+=1
-
-                self.neighbors_graph.node[node]["partition"]=SHORT_TO_LONG[nem_class]
-                
-                self.partitions[SHORT_TO_LONG[nem_class]].append(node)
-
-                if nb_orgs == self.nb_organisms:
-                    self.partitions["core_exact"].append(node)#CORE EXACT
-                    self.neighbors_graph.node[node]["partition_exact"]="core_exact"
-                elif nb_orgs < self.nb_organisms:
-                    self.partitions["accessory"].append(node)#ACCESSORY
-                    self.neighbors_graph.node[node]["partition_exact"]="accessory"
-                else:
-                    logging.getLogger().error("nb_orgs can't be > to self.nb_organisms")
-                    exit(1)
-                self.neighbors_graph.nodes[node]["viz"]={}
-                if nem_class != "U":
-                    self.neighbors_graph.nodes[node]["viz"]['color']=COLORS_RGB[self.neighbors_graph.node[node]["partition"]]
-                else:
-                    self.neighbors_graph.nodes[node]["viz"]['color']=COLORS_RGB[self.neighbors_graph.node[node]["partition_exact"]]
-                self.neighbors_graph.nodes[node]["viz"]['size']=nb_orgs
-            if self.families_repeted_th > 0:
-                if len(self.families_repeted)>0:
-                    logging.getLogger().info("Gene families that have been discarded because there are repeated:\t"+" ".join(self.families_repeted))
-                else:
-                    logging.getLogger().info("No gene families have been discarded because there are repeated")
-
-            logging.getLogger().debug(nx.number_of_edges(self.neighbors_graph))
-
-            self.is_partitionned=True
+            self.__set_partitions(partitions, BIC, posteriors)
         else:
             if just_stats:
                 for node_name, nem_class in partitions.items():
@@ -1172,24 +1393,183 @@ class PPanGGOLiN:
             else:
                 return partitions
 
+    def classify(self, model        = None,
+                       nem_dir_path = tempfile.mkdtemp(),
+                       organisms    = None,
+                       beta         = None,
+                       inplace      = True,
+                       nb_threads   = 1):
+        """
+            Partition the families using the parameters of a fitted model without estimating them again: NEM only computes the posterior probabilities of the classes (E-step), smoothed using the neighbors graph if beta > 0
+            It is used to partition an updated graph, new families or a subset of the organisms of the model without running EM from scratch
+            :param model: a dict as the partition_model attribute (containing the organisms used, the parameters of each class, beta and free_dispersion) or None to use the partition_model attribute
+            :param nem_dir_path: a str containing a path to store temporary file of the NEM program
+            :param organisms: a list of organism to used to obtain the partition (must be included in the organisms of the model and in the organism attributes of the object) or None to used all organisms in the object
+            :param beta: a float containing the spatial coefficient of smoothing (None to use the one of the model)
+            :param inplace: a boolean specifying if the partition must be stored in the object of returned (throw an error if inplace is true and organisms parameter i not None)
+            :param nb_threads: an integer specifying the number of threads used by NEM
+            :type dict:
+            :type str:
+            :type list:
+            :type float:
+            :type bool:
+            :type int:
+            :return: if inplace is False, a tuple containing a dict giving the partition of each family and a dict giving the posterior probabilities of the persistent, shell and cloud classes of each family
+            :rtype: tuple
+        """
+        model = self.partition_model if model is None else model
+        if model is None:
+            raise Exception("No partition model available, the pangenome must be partitioned without chunks before")
+        if organisms is None:
+            organisms = self.organisms
+        else:
+            organisms = OrderedSet(organisms)
+            if len(organisms - self.organisms)>0:
+                raise Exception("organisms parameter must be included in the organisms attribute of the objet")
+            if inplace:
+                raise Exception("inplace can't be true if the organisms parameter has not the same size than organisms attribute")
+        columns = dict(zip(model["organisms"], range(len(model["organisms"]))))
+        unknown = [org for org in organisms if org not in columns]
+        if len(unknown)>0:
+            raise Exception("The organisms "+" ".join(unknown)+" are not in the partition model, the pangenome must be partitioned again")
+
+        beta       = model["beta"] if beta is None else beta
+        parameters = dict([(k, ([mu_k[columns[org]] for org in organisms], [epsilon_k[columns[org]] for org in organisms], proportion)) for k, (mu_k, epsilon_k, proportion) in model["parameters"].items()])
+        self.__write_nem_input_files(nem_dir_path+"/",
+                                     organisms,
+                                     collapse = beta == 0)
+        write_nem_param_file(nem_dir_path+"/nem_file.m", parameters, fixed = True)
+        result = run_partitioning(nem_dir_path, len(organisms), beta, model["free_dispersion"], nb_threads = nb_threads)
+
+        if inplace:
+            self.__set_partitions(result[FAMILIES_PARTITION], result[PARTITION_CRITERIA].get("BIC", 0), result[FAMILIES_POSTERIORS])
+        else:
+            return((result[FAMILIES_PARTITION], result[FAMILIES_POSTERIORS]))
+
+    def partition_beta_sweep(self, betas,
+                                   nem_dir_path    = tempfile.mkdtemp(),
+                                   organisms       = None,
+                                   free_dispersion = False,
+                                   warm_start      = True,
+                                   nb_threads      = 1,
+                                   seed            = None):
+        """
+            Partition the pangenome for several values of beta without modifying the object in order to calibrate the smoothing.
+            The NEM input files are written once and shared by all the fits. If warm_start is True, the values of beta are fitted by waves of doubling size in increasing order (the smallest value alone, then the next 2, the next 4, ...), 
+            each fit being initialized using the parameters fitted for the nearest value of beta of the previous waves. The waves do not depend on nb_threads so that the results do not depend on the number of threads.
+            The fit without smoothing (beta = 0) only uses the unique presence/absence profiles (see collapse_nem_input_files), it is the fastest initialization of a sweep starting from 0.
+            The fits are performed on all the organisms at once (not by chunks).
+            :param betas: a list of float containing the values of beta to test
+            :param nem_dir_path: a str containing a path to store temporary file of the NEM program
+            :param organisms: a list of organism to used to obtain the partition (must be included in the organism attributes of the object) or None to used all organisms in the object
+            :param free_dispersion: a bool specyfing if the dispersion around the centroid vector of each paritition is the same for all the organisms or if the dispersion is free
+            :param warm_start: a bool specifying if each fit is initialized using the parameters of the nearest value of beta already fitted
+            :param nb_threads: an integer specifying the number of fits executed concurrently
+            :param seed: an int used to derive the seed of the NEM run of each value of beta (None means seeded by the time)
+            :type list:
+            :type str:
+            :type list:
+            :type bool:
+            :type bool:
+            :type int:
+            :type int:
+            :return: sweep: a list of OrderedDict (one by value of beta sorted by increasing beta) giving the size of each partition, the criteria of the fit, the number of families having changed of partition compared to the previous value of beta and the value of beta used to initialize the fit
+            :rtype: list
+        """
+        organisms = self.organisms if organisms is None else OrderedSet(organisms)
+        betas     = sorted(set(betas))
+        nb_threads = max(1, nb_threads)
+        self.__write_nem_input_files(nem_dir_path+"/", organisms)
+        
+        fits = {}
+        remaining = list(betas)
+        wave_size = 1
+        while remaining:
+            wave      = remaining[:wave_size] if warm_start else remaining
+            remaining = remaining[len(wave):]
+            wave_size *= 2
+            args      = []
+            for beta in wave:
+                beta_dir_path = nem_dir_path+"/beta"+str(beta)+"/"
+                init_from     = min(fits, key = lambda fitted: abs(fitted-beta)) if len(fits)>0 else None
+                if init_from is not None and len(fits[init_from][PARTITION_PARAMETERS])>0:
+                    link_nem_input_files(nem_dir_path, beta_dir_path, [f for f in NEM_INPUT_FILES if f != "nem_file.m"])
+                    write_nem_param_file(beta_dir_path+"/nem_file.m", fits[init_from][PARTITION_PARAMETERS])
+                else:
+                    init_from = None
+                    link_nem_input_files(nem_dir_path, beta_dir_path)
+                if beta == 0:
+                    collapse_nem_input_files(nem_dir_path, beta_dir_path)
+                logging.getLogger().info("Partitioning using beta="+str(beta)+(" (initialized with the parameters fitted for beta="+str(init_from)+")" if init_from is not None else ""))
+                args.append(((beta_dir_path, len(organisms), beta, free_dispersion, 3, "param_file_default", None if seed is None else derive_seed(seed, "beta", beta)), init_from))
+
+            if nb_threads > 1 and len(args) > 1:
+                with contextlib.closing(Pool(processes = min(nb_threads, len(args)))) as pool:
+                    results = pool.starmap(run_partitioning, [run_args for run_args, _ in args])
+            else:
+                results = [run_partitioning(*run_args) for run_args, _ in args]
+            for beta, (_, init_from), result in zip(wave, args, results):
+                fits[beta] = result + (init_from,)
+
+        sweep = []
+        previous = None
+        for beta in betas:
+            (partitions, parameters, criteria, posteriors, init_from) = fits[beta]
+            counts = Counter(partitions.values())
+            row = OrderedDict([("beta",       beta),
+                               ("persistent", counts["P"]),
+                               ("shell",      counts["S"]),
+                               ("cloud",      counts["C"]),
+                               ("undefined",  counts["U"]),
+                               ("U",          criteria.get("U")),
+                               ("M",          criteria.get("M")),
+                               ("BIC",        criteria.get("BIC")),
+                               ("changed",    sum([1 for fam, nem_class in partitions.items() if previous[fam] != nem_class]) if previous is not None else 0),
+                               ("init_from",  init_from)])
+            sweep.append(row)
+            previous = partitions
+        return(sweep)
+
     def partition_shell(self, nem_dir_path = tempfile.mkdtemp(),
                         subpart_name    = "subpartition_shell",
                         beta            = 0.5,
                         free_dispersion = False,
                         Q               = "auto",
                         exclusity_th    = 0.1,
-                        init_using_qual = None):
+                        init_using_qual = None,
+                        nb_starts       = 1,
+                        seed            = None,
+                        nb_threads      = 1,
+                        criterion       = "BIC",
+                        Q_max           = None):
         """
-
+            Subpartition the shell genome in Q classes using NEM
+            :param Q: an int specifying the number of subpartitions or "auto" to select it using the criterion (all the numbers of subpartitions from 2 to Q_max are fitted concurrently on the same shell-only input files)
+            :param nb_starts: an int specifying the number of seeded NEM runs used when the initialisation is random (the best one according to the criterion is kept)
+            :param seed: an int used to derive the seed of each NEM run (None means a random seed)
+            :param nb_threads: an int specifying the number of NEM runs executed concurrently
+            :param criterion: a str specifying the criterion used to choose between NEM runs ("BIC" or "ICL")
+            :param Q_max: an int specifying the maximal number of subpartitions tested if Q is "auto" (None means twice the mean number of shell genes by organism divided by the shell size)
+            :type int:
+            :type int:
+            :type int:
+            :type int:
+            :type str:
+            :type int:
+            :return: Q
+            :rtype: int
         """ 
         if not self.is_partitionned:
             logging.getLogger().warning("The pangenome must be already partionned to subpartition the shell genome")
         else:
+            Q_range = None
             if Q == "auto":
                 if init_using_qual is None:
-                    stats = self.projection(nem_dir_path,self.organisms)
-                    Q = float(len(self.partitions["shell"]))/stats[1]
-                    Q = int(round(Q, 0))+1 # +1 to store unexclusive families
+                    if Q_max is None:
+                        shell_genes = mean([nb_genes["shell"] for nb_genes in self.nb_genes_by_partition().values()])
+                        Q_estimated = int(round(float(len(self.partitions["shell"]))/shell_genes, 0))+1 if shell_genes > 0 else 2 # +1 to store unexclusive families
+                        Q_max = max(3, 2*Q_estimated)
+                    Q_range = list(range(2, Q_max+1))
                 else:
                     if isinstance(init_using_qual,dict):
                         Q = len(init_using_qual)+1
@@ -1204,7 +1584,19 @@ class PPanGGOLiN:
                                         self.organisms,
                                         init=init_using_qual,
                                         filter_by_partition="shell")
-            subpartitions = run_partitioning(nem_dir_path, self.nb_organisms, beta, free_dispersion, Q = Q, init="random" if init_using_qual is None else "param_file")
+            if Q_range is not None:
+                logging.getLogger().info("Selecting the number of subpartitions of the shell between "+str(Q_range[0])+" and "+str(Q_range[-1])+" using the "+criterion+"...")
+                fits = run_partitioning_sweep(nem_dir_path, self.nb_organisms, beta, free_dispersion, Q_range = Q_range, init = "random",
+                                              nb_starts = nb_starts, seed = seed, nb_threads = nb_threads, criterion = criterion)
+                self.subpartitions_shell_criteria = OrderedDict((q, fits[q][0][PARTITION_CRITERIA]) for q in Q_range)
+                Q = min(Q_range, key = lambda q: criterion_score(self.subpartitions_shell_criteria[q], criterion))
+                logging.getLogger().info("\n".join(["Q="+str(q)+"\tBIC="+str(c.get("BIC"))+"\tICL="+str(c.get("ICL")) for q, c in self.subpartitions_shell_criteria.items()]))
+                subpartitions, self.subpartitions_shell_starts = fits[Q]
+            elif init_using_qual is None:
+                subpartitions, self.subpartitions_shell_starts = run_partitioning_multistart(nem_dir_path, self.nb_organisms, beta, free_dispersion, Q = Q, init = "random",
+                                                                                              nb_starts = nb_starts, seed = seed, nb_threads = nb_threads, criterion = criterion)
+            else:
+                subpartitions = run_partitioning(nem_dir_path, self.nb_organisms, beta, free_dispersion, Q = Q, init="param_file", seed = seed)
             self.subpartitions_shell_parameters = {} 
             self.organisms_subpartitions_shell = defaultdict(set)
             proportion_exclusive = 0
@@ -1236,8 +1628,8 @@ class PPanGGOLiN:
                 for org in self.subpartitions_shell_parameters[label][0]:
                     self.organisms_subpartitions_shell[org].add(label)
                 labels[k]=label
-                print(parameters[EPSILON])
-                print(parameters[PROPORTION])
+                logging.getLogger().debug(parameters[EPSILON])
+                logging.getLogger().debug(parameters[PROPORTION])
                 
             self.subpartition_shell = defaultdict(list)
             nx.set_node_attributes(self.neighbors_graph,nx.get_node_attributes(self.neighbors_graph, "partition"),subpart_name)
@@ -1261,13 +1653,31 @@ class PPanGGOLiN:
                        scalingRatio=50000,
                        strongGravityMode=True,
                        gravity=1.0,
-                       verbose=False):
+                       verbose=False,
+                       multilevel=False,
+                       refinement_iterations=50,
+                       persistent_shell_only=False,
+                       positions_file=None):
+        """
+            Compute a ForceAtlas2 layout of the graph and store the positions in the viz attribute of the nodes
+            :param multilevel: a bool specifying if the layout is computed on a hierarchy of coarsened graphs (chains of degree-2 families and leaves collapsed, see coarsen_graph) and then refined level by level
+            :param refinement_iterations: an int specifying the number of iterations used to refine each finer level (or a partial layout read from positions_file)
+            :param persistent_shell_only: a bool specifying if only the persistent and shell families are laid out (cloud families are then placed near their neighbors)
+            :param positions_file: a str containing the path of a file caching the positions: positions found in the file are reused and the new positions are written in it
+            :type bool:
+            :type int:
+            :type bool:
+            :type str:
+        """
         G=None
         if graph_type == "untangled_neighbors_graph":
             G = self.untangled_neighbors_graph
+        elif graph_type == "compressed_neighbors_graph":
+            G = self.compressed_neighbors_graph
         else:
             G = self.neighbors_graph
 
+        from fa2 import ForceAtlas2
         forceatlas2 = ForceAtlas2(
                           outboundAttractionDistribution=outboundAttractionDistribution,
                           linLogMode=linLogMode,
@@ -1282,14 +1692,38 @@ class PPanGGOLiN:
                           gravity=gravity,
                           verbose=verbose)
 
-        for node, pos_x_y in forceatlas2.forceatlas2_networkx_layout(G, pos=None, iterations=iterations).items():
+        cached = {}
+        if positions_file is not None and os.path.isfile(positions_file):
+            cached = dict([(node, pos_x_y) for node, pos_x_y in read_layout_positions(positions_file).items() if node in G])
+            logging.getLogger().info(str(len(cached))+" cached positions read in "+positions_file)
+
+        if len(cached) == G.number_of_nodes():
+            positions = cached
+        else:
+            to_layout = G
+            if persistent_shell_only and self.is_partitionned:
+                to_layout = G.subgraph([node for node, data in G.nodes(data=True) if data.get("partition") in ("persistent","shell")])
+            if len(cached) > 0:
+                positions = forceatlas2.forceatlas2_networkx_layout(to_layout, pos=place_around_anchors(to_layout, cached), iterations=refinement_iterations)
+            elif multilevel:
+                positions = multilevel_layout(to_layout, forceatlas2, iterations, refinement_iterations)
+            else:
+                positions = forceatlas2.forceatlas2_networkx_layout(to_layout, pos=None, iterations=iterations)
+            if to_layout is not G:
+                positions = place_around_anchors(G, positions)
+            if positions_file is not None:
+                write_layout_positions(positions_file, positions)
+
+        for node, pos_x_y in positions.items():
             z=(0,)
             if self.is_partitionned:
-                if self.neighbors_graph.nodes[node]["partition"]=="persistent":
+                if G.nodes[node]["partition"]=="persistent":
                     z=(2,)
-                elif self.neighbors_graph.nodes[node]["partition"]=="shell":
+                elif G.nodes[node]["partition"]=="shell":
                     z=(1,)
-            self.neighbors_graph.nodes[node]["viz"]['position']=dict(zip(["x","y","z"],pos_x_y+z))
+            if "viz" not in G.nodes[node]:
+                G.nodes[node]["viz"]={}
+            G.nodes[node]["viz"]['position']=dict(zip(["x","y","z"],tuple(pos_x_y)+z))
 
     def export_to_GEXF(self, graph_output_path, compressed=False, metadata = None, all_node_attributes = True, all_edge_attributes = True, graph_type = "neighbors_graph"):
         """
@@ -1304,36 +1738,38 @@ class PPanGGOLiN:
             :type bool: 
             :type dict: 
         """
-        graph_to_save=None
-        if "neighbors_graph":
-            graph_to_save = self.neighbors_graph.copy()
-        elif "untangled_neighbors_graph":
-            graph_to_save = self.untangled_neighbors_graph.copy()
-            
-        for node in self.neighbors_graph.nodes():            
-            for key in list(self.neighbors_graph.node[node].keys()):
+        graph = self.neighbors_graph
+        if graph_type == "untangled_neighbors_graph":
+            graph = self.untangled_neighbors_graph
+        elif graph_type == "compressed_neighbors_graph":
+            graph = self.compressed_neighbors_graph
+        graph_to_save = graph.copy()
+
+        for node in graph.nodes():            
+            for key in list(graph.node[node].keys()):
                 if key == "viz":
                     continue
                 if not all_node_attributes and key in self.organisms:
                     del graph_to_save.node[node][key]
+                elif key == "length":
+                    l = graph.node[node][key]
+                    graph_to_save.node[node]["length_avg"] = float(l.mean())
+                    graph_to_save.node[node]["length_med"] = float(l.median())
+                    graph_to_save.node[node]["length_min"] = l.min
+                    graph_to_save.node[node]["length_max"] = l.max
+                    del graph_to_save.node[node]["length"]
                 else:
                     try:
-                        if not isinstance(self.neighbors_graph.node[node][key], str):
-                            graph_to_save.node[node][key]="|".join(self.neighbors_graph.node[node][key])#because networkx and gephi do not support list type in gexf despite it is possible according to the specification using liststring (https://gephi.org/gexf/1.2draft/data.xsd)
+                        if not isinstance(graph.node[node][key], str):
+                            graph_to_save.node[node][key]="|".join(sorted(graph.node[node][key]) if isinstance(graph.node[node][key], set) else graph.node[node][key])#sets are sorted to get reproducible files, because networkx and gephi do not support list type in gexf despite it is possible according to the specification using liststring (https://gephi.org/gexf/1.2draft/data.xsd)
                     except TypeError:
-                        if key == "length":
-                            l = list(self.neighbors_graph.node[node][key])
-                            graph_to_save.node[node]["length_avg"] = float(mean(l))
-                            graph_to_save.node[node]["length_med"] = float(median(l))
-                            graph_to_save.node[node]["length_min"] = min(l)
-                            graph_to_save.node[node]["length_max"] = max(l)
-                            del graph_to_save.node[node]["length"]
-        for node_i, node_j, data in self.neighbors_graph.edges(data = True):
-            l = list(data["length"])
-            graph_to_save[node_i][node_j]["length_avg"] = float(mean(l))
-            graph_to_save[node_i][node_j]["length_med"] = float(median(l))
-            graph_to_save[node_i][node_j]["length_min"] = min(l)
-            graph_to_save[node_i][node_j]["length_max"] = max(l)
+                        pass
+        for node_i, node_j, data in graph.edges(data = True):
+            l = data["length"]
+            graph_to_save[node_i][node_j]["length_avg"] = float(l.mean())
+            graph_to_save[node_i][node_j]["length_med"] = float(l.median())
+            graph_to_save[node_i][node_j]["length_min"] = l.min
+            graph_to_save[node_i][node_j]["length_max"] = l.max
             del graph_to_save[node_i][node_j]["length"]
             
             atts = set()
@@ -1355,6 +1791,12 @@ class PPanGGOLiN:
 
             graph_to_save[node_i][node_j]["viz"]={"thickness":graph_to_save[node_i][node_j]["weight"]}
 
+        for node in graph.nodes():
+            posterior = self.posterior(node)
+            if posterior is not None:
+                for cls, prob in zip(POSTERIOR_CLASSES, posterior):
+                    graph_to_save.node[node]["posterior_"+SHORT_TO_LONG[cls]] = round(prob, 4)
+
         graph_output_path = graph_output_path+".gexf"
         if compressed:
             graph_output_path = gzip.open(graph_output_path+".gz","w")
@@ -1400,6 +1842,7 @@ class PPanGGOLiN:
     def write_matrix(self, path, header=True, csv = True, Rtab = True):
         """
             Export the pangenome as a csv_matrix similar to the csv et Rtab matrix exported by Roary (https://sanger-pathogens.github.io/Roary/)
+            The QC column gives the posterior probability of the partition of each family
             :param nem_dir_path: a str containing the path of the out files (csv+Rtab)
             :param header: a bool specifying if the header must be added to the file or not
             :type str: 
@@ -1419,19 +1862,20 @@ class PPanGGOLiN:
                                                '"Genome Fragment"',#8
                                                '"Order within Fragment"',#9
                                                '"Accessory Order with Fragment"',#10
-                                               '"QC"',#11
+                                               '"QC"',#11 (posterior probability of the partition)
                                                '"Min group size nuc"',#12
                                                '"Max group size nuc"',#13
                                                '"Avg group size nuc"']#14
                                                +['"'+org+'"' for org in list(self.organisms)])+"\n")#15
 
                     for node, data in self.neighbors_graph.nodes(data=True):
-                        genes  = [('"'+"|".join(data[org])+'"' if gene_or_not else str(len(data[org]))) if org in data else ('""' if gene_or_not else "0") for org in self.organisms]
+                        genes  = [('"'+"|".join(sorted(data[org]))+'"' if gene_or_not else str(len(data[org]))) if org in data else ('""' if gene_or_not else "0") for org in self.organisms]
                         nb_org = len([gene for gene in genes if gene != ('""' if gene_or_not else "0")])
-                        l = list(data["length"])
+                        l = data["length"]
+                        posterior = self.posterior(node)
                         matrix.write(sep.join(['"'+node+'"',#1
                                                '"'+data["partition"]+'"',#2
-                                               '"'+"|".join(data["product"])+'"',#3
+                                               '"'+"|".join(sorted(data["product"]))+'"',#3
                                                str(nb_org),#4
                                                str(data["nb_genes"]),#5
                                                str(round(data["nb_genes"]/nb_org,2)),#6
@@ -1439,10 +1883,10 @@ class PPanGGOLiN:
                                                '""',#8
                                                '""',#9
                                                '""',#10
-                                               '""',#11
-                                               str(min(l)),#12
-                                               str(max(l)),#13
-                                               str(round(mean(l),2))]#14
+                                               str(round(posterior[[SHORT_TO_LONG[cls] for cls in POSTERIOR_CLASSES].index(data["partition"])], 4)) if posterior is not None and data["partition"] != "undefined" else '""',#11
+                                               str(l.min),#12
+                                               str(l.max),#13
+                                               str(round(l.mean(),2))]#14
                                                +genes)+"\n")#15
             if csv:
                 logging.getLogger().info("Writing csv matrix")
@@ -1474,6 +1918,26 @@ class PPanGGOLiN:
     #     self.BIC                      = None
     #     #self.partitions_by_organisms  = defaultdict(lambda: defaultdict(set))
 
+    def share_memory(self):
+        """
+            Copy the presence/absence matrix, the adjacency, the edge coverage and the organism index of the neighbors graph into shared memory.
+            The partitions (and the evolution curve) computed thereafter read these buffers instead of the networkx graph so that the worker processes 
+            do not duplicate the graph pages (copy-on-write is triggered by the reference counts as soon as a worker walks the graph).
+            The shared copy is a snapshot: it must be released (and re-created) if families, organisms or edges are modified.
+        """
+        self.release_shared_memory()
+        logging.getLogger().info("Copying the pangenome graph into shared memory...")
+        self.shared = SharedPangenome(self)
+        logging.getLogger().debug(str(self.shared.size)+" bytes of shared memory used")
+
+    def release_shared_memory(self):
+        """
+            Free the shared memory created by share_memory()
+        """
+        if self.shared is not None:
+            self.shared.release()
+            self.shared = None
+
     def delete_nem_intermediate_files(self):
         """
             Delete all the tempory files used to partion the pangenome
@@ -1489,6 +1953,7 @@ class PPanGGOLiN:
             :param outdir: a str containing the path of the output file
             :type str: 
         """ 
+        from highcharts import Highchart
         ushaped_plot = Highchart(width = 1800, height = 800)
 
         count = defaultdict(lambda : defaultdict(int))
@@ -1695,44 +2160,124 @@ class PPanGGOLiN:
 
     #                 self.neighbors_graph.node[index_inv[i+1]]["subshell"]=str(classes[0])
 
-    def projection(self, out_dir, organisms_to_project):
+    def nb_genes_by_partition(self, organisms = None):
+        """
+            Count in memory the number of genes of each organism in each partition (without writing any file)
+            :param organisms: a list of str containing the name of the organisms (None means all the organisms)
+            :type list:
+            :return: nb_genes: a dict having the organisms as keys and as value a dict giving the number of genes in each partition (including core_exact, accessory and pangenome)
+            :rtype: dict
+        """
+        organisms = set(self.organisms if organisms is None else organisms)
+        nb_genes = {org: defaultdict(int) for org in organisms}
+        for node, data in self.neighbors_graph.nodes(data=True):
+            for org in organisms.intersection(data):
+                nb = len(data[org])
+                nb_genes[org][data["partition"]]+=nb
+                nb_genes[org][data["partition_exact"]]+=nb
+                nb_genes[org]["pangenome"]+=nb
+        return(nb_genes)
+
+    def rarefaction_curves(self, sizes = None, variance = True):
+        """
+            Compute without any resampling the expected numbers of core_exact, accessory and pangenome families (and their variances) of a subsample of k organisms drawn without replacement, for each size k.
+            A family present in c of the N organisms is in the pangenome of the subsample with the probability 1-C(N-c,k)/C(N,k) and in its core_exact with the probability C(c,k)/C(N,k).
+            The variances require the joint probabilities of each pair of families which only depend on the sizes of the intersection and of the union of their presence profiles (identical profiles are processed once).
+            :param sizes: a list of int containing the sizes of the subsamples (None means 1 to N)
+            :param variance: a bool specifying if the variances must be computed (quadratic in the number of distinct presence profiles)
+            :type list:
+            :type bool:
+            :return: curves: an OrderedDict having the sizes as keys and as value a dict giving a tuple (mean, variance) for core_exact, accessory and pangenome (variance is None if not computed)
+            :rtype: OrderedDict
+        """
+        nb_org   = self.nb_organisms
+        org_bits = dict([(org, 1<<i) for i, org in enumerate(self.organisms)])
+        profiles = Counter()
+        for node, data in self.neighbors_graph.nodes(data=True):
+            profile = 0
+            for org in data:
+                profile |= org_bits.get(org, 0)
+            if profile:
+                profiles[profile]+=1
+        profiles     = [(profile, nb, popcount(profile)) for profile, nb in profiles.items()]
+        nb_families  = sum([nb for profile, nb, size in profiles])
+        by_frequency = Counter()
+        for profile, nb, size in profiles:
+            by_frequency[size]+=nb
+
+        if variance:
+            # number of ordered pairs of families (i,j) (including i=j) by the number of organisms having both families, having none of them and having j but not i
+            (both, none, only_second) = ([0]*(nb_org+1), [0]*(nb_org+1), [0]*(nb_org+1))
+            for i, (profile, nb, size) in enumerate(profiles):
+                both[size]          += nb*nb
+                none[nb_org-size]   += nb*nb
+                only_second[0]      += nb*nb
+                for (other, nb_other, size_other) in profiles[i+1:]:
+                    shared = popcount(profile & other)
+                    both[shared]                          += 2*nb*nb_other
+                    none[nb_org-size-size_other+shared]   += 2*nb*nb_other
+                    only_second[size_other-shared]        += nb*nb_other
+                    only_second[size-shared]              += nb*nb_other
+
+        curves = OrderedDict()
+        for k in (range(1, nb_org+1) if sizes is None else sizes):
+            probabilities = subset_probabilities(nb_org, k)
+            core   = sum([nb*probabilities[c] for c, nb in by_frequency.items()])
+            absent = sum([nb*probabilities[nb_org-c] for c, nb in by_frequency.items()])
+            (var_core, var_pangenome, var_accessory) = (None, None, None)
+            if variance:
+                var_core      = max(sum([nb*p for nb, p in zip(both, probabilities)]) - core*core, 0.0)
+                var_pangenome = max(sum([nb*p for nb, p in zip(none, probabilities)]) - absent*absent, 0.0)
+                cov_absent_core = sum([nb*p for nb, p in zip(only_second, probabilities)]) - absent*core
+                var_accessory = max(var_pangenome + var_core + 2*cov_absent_core, 0.0)# pangenome = nb_families - absent, so cov(pangenome, core) = -cov(absent, core)
+            curves[k] = {"core_exact" : (core, var_core),
+                         "accessory"  : (max(nb_families-absent-core, 0.0), var_accessory),
+                         "pangenome"  : (nb_families-absent, var_pangenome)}
+        return(curves)
+
+    def compute_neighbors_partitions(self):
+        """
+            Count once for each family the number of its neighbors in the persistent, shell and cloud partitions (stored in the neighbors_partitions attribute and used by the projection)
+        """
+        self.neighbors_partitions = {}
+        for node in self.neighbors_graph.nodes():
+            nei_partitions = Counter([self.neighbors_graph.node[nei]["partition"] for nei in nx.all_neighbors(self.neighbors_graph, node)])
+            self.neighbors_partitions[node] = (nei_partitions["persistent"], nei_partitions["shell"], nei_partitions["cloud"])
+
+    def projection(self, out_dir, organisms_to_project, nb_threads = 1, compressed = False, buffer_size = 10000):
         """
             generate files about the projection of the partition of the graph on the organisms
             return statistics about the number of genes in each organism to project for each partition in the file out_dir/nb_genes.csv
+            The organisms are distributed to a pool of nb_threads processes sharing a read-only family -> partition table, each one writing the files of its organisms, 
+            the statistics returned by the workers are merged in nb_genes.csv at the end (in the order of organisms_to_project)
             :param outdir: a str containing the path of the output directory (name of files will be the name of organisms)
             :param organisms_to_project: a list of str containing the name of the organism
+            :param nb_threads: an int specifying the number of organisms projected concurrently
+            :param compressed: a bool specifying if the file of each organism must be compressed in gzip or not
+            :param buffer_size: an int specifying the number of lines accumulated before each write
             :type str:
             :type list
+            :type int:
+            :type bool:
+            :type int:
             :return: stats: 
             :rtype: dict 
         """ 
-        sep=","
         if self.is_partitionned:
+            if len(self.neighbors_partitions) != self.pan_size:
+                self.compute_neighbors_partitions()
+            table = projection_table_from(dict([(node, (data["partition"], data["partition_exact"])+self.neighbors_partitions[node]) for node, data in self.neighbors_graph.nodes(data=True)]))
+            args  = [(out_dir, organism, self.annotations[organism], compressed, buffer_size) for organism in organisms_to_project]
+            if nb_threads > 1 and len(args) > 1:
+                with contextlib.closing(Pool(processes = min(nb_threads, len(args)), initializer = init_projection_worker, initargs = (table,))) as pool:
+                    results = dict(pool.imap_unordered(write_organism_projection, args))
+            else:
+                init_projection_worker(table)
+                results = dict(map(write_organism_projection, args))
             with open(out_dir+"/nb_genes.csv","w") as nb_genes_file:
                 nb_genes_file.write("org\tpersistent\tshell\tcloud\tcore_exact\taccessory\tpangenome\n")
                 for organism in organisms_to_project:
-                    nb_genes_by_partition = defaultdict(int)
-                    with open(out_dir+"/"+organism+".csv","w") as out_file:
-                        out_file.write(sep.join(["gene","contig","coord_start","coord_end","strand","ori","family","nb_copy_in_org","partition","persistent","shell","cloud"])+"\n")
-                        for contig, contig_annot in self.annotations[organism].items():
-                            for gene, gene_info in contig_annot.items():
-                                if gene_info[FAMILY] not in self.families_repeted:
-                                    nb_genes_by_partition[self.neighbors_graph.node[gene_info[FAMILY]]["partition"]]+=1
-                                    nb_genes_by_partition[self.neighbors_graph.node[gene_info[FAMILY]]["partition_exact"]]+=1
-                                    nb_genes_by_partition["pangenome"]+=1
-                                    nei_partitions = [self.neighbors_graph.node[nei]["partition"] for nei in nx.all_neighbors(self.neighbors_graph,gene_info[FAMILY])]
-                                    out_file.write(sep.join([gene,
-                                                              contig,
-                                                              str(gene_info[START]),
-                                                              str(gene_info[END]),
-                                                              gene_info[STRAND],
-                                                              "T" if (gene_info[NAME].upper() == "DNAA" or gene_info[PRODUCT].upper() == "DNAA") else "F",
-                                                              gene_info[FAMILY],
-                                                              str(len(self.neighbors_graph.node[gene_info[FAMILY]][organism])),
-                                                              self.neighbors_graph.node[gene_info[FAMILY]]["partition"],
-                                                              str(nei_partitions.count("persistent")),
-                                                              str(nei_partitions.count("shell")),
-                                                              str(nei_partitions.count("cloud"))])+"\n")
+                    nb_genes_by_partition = results[organism]
                     self.partitions_by_organism[organism]=nb_genes_by_partition
                     nb_genes_file.write("\t".join([organism,
                                                   str(nb_genes_by_partition["persistent"]),
@@ -1756,10 +2301,1044 @@ class PPanGGOLiN:
     
 ################ END OF CLASS PPanGGOLiN ################
 
+################ CLASS AnnotationStore ################
+class AnnotationStore(Mapping):
+    """
+        Read-only mapping organism -> annotations (contig -> OrderedDict of genes) whose values are stored on the disk (one pickle record by organism appended to a single file) 
+        and read again each time they are accessed, used to build the pangenome graph in streaming mode without keeping the gene level information of all the organisms in memory.
+    """
+    def __init__(self, path):
+        """
+            :param path: a str containing the path of the file storing the annotations (erased if it exists)
+            :type str:
+        """
+        self.path    = path
+        self.offsets = OrderedDict()# organism -> offset of its record in the file
+        open(self.path,"wb").close()
+
+    def add(self, organism, annotations):
+        """
+            Append the annotations of an organism to the store
+            :param organism: a str containing the organism name
+            :param annotations: a dict having the contigs of the organism as keys and the OrderedDict of its genes as value
+            :type str:
+            :type dict:
+        """
+        with open(self.path,"ab") as store_file:
+            self.offsets[organism] = store_file.tell()
+            pickle.dump(annotations, store_file, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def __getitem__(self, organism):
+        offset = self.offsets[organism]
+        with open(self.path,"rb") as store_file:
+            store_file.seek(offset)
+            return(pickle.load(store_file))
+
+    def __iter__(self):
+        return(iter(self.offsets))
+
+    def __len__(self):
+        return(len(self.offsets))
+
+    def __contains__(self, organism):
+        return(organism in self.offsets)
+
+################ CLASS GffCache ################
+class GffCache:
+    """
+        Cache of the parsed gff files: for each gff file, the contigs (genes sorted by position with their resolved family), the size of the sequence regions and the number of copies of each family are pickled in a file of the cache directory.
+        An entry is identified by the hash of the content of the gff file, the hash of the families file and the infer_singletons parameter, so that a modified gff or families file is parsed again.
+        Only regular files can be hashed: the gff files read from a pipe or a stream are always parsed, and nothing is cached if the families file is not a regular file.
+        The hash of each gff file is only computed again if its size or modification time changed since it was hashed. 
+        The least recently used entries are removed when the cache exceeds max_size bytes.
+    """
+    INDEX_FILE = "index.pkl"
+
+    def __init__(self, directory, families_file_path, max_size = 2**30):
+        """
+            :param directory: a str containing the path of the cache directory (created if required)
+            :param families_file_path: a str containing the path of the families file used to resolve the family of each gene
+            :param max_size: an int specifying the maximum size of the cache in bytes
+            :type str:
+            :type str:
+            :type int:
+        """
+        self.directory     = directory
+        self.max_size      = max_size
+        self.families_hash = file_hash(families_file_path) if os.path.isfile(families_file_path) else None
+        if self.families_hash is None:
+            logging.getLogger().warning("The families file "+families_file_path+" is not a regular file, the gff cache is not used")
+        self.nb_hits       = 0
+        self.nb_misses     = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.index = {}# absolute path of a gff file -> (size, modification time, hash of its content)
+        index_path = os.path.join(self.directory, GffCache.INDEX_FILE)
+        if os.path.isfile(index_path):
+            try:
+                with open(index_path,"rb") as index_file:
+                    self.index = pickle.load(index_file)
+            except (pickle.UnpicklingError, EOFError):
+                logging.getLogger().warning("The index of the gff cache "+index_path+" is corrupted, the gff files will be hashed again")
+
+    def __entry_path(self, gff_file_path, infer_singletons):
+        """ Return the path of the cache entry of a gff file (hashing it if it changed) """
+        path = os.path.abspath(gff_file_path)
+        stat = os.stat(path)
+        known = self.index.get(path)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            content_hash = known[2]
+        else:
+            content_hash = file_hash(path)
+            if known is not None and known[2] != content_hash:# invalidation of the entries of the previous content
+                for old_entry in (self.__entry_name(known[2], singletons) for singletons in (True, False)):
+                    if os.path.isfile(os.path.join(self.directory, old_entry)):
+                        os.remove(os.path.join(self.directory, old_entry))
+            self.index[path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        return(os.path.join(self.directory, self.__entry_name(content_hash, infer_singletons)))
+
+    def __is_cacheable(self, gff_file_path):
+        return(self.families_hash is not None and os.path.isfile(gff_file_path))
+
+    def __entry_name(self, content_hash, infer_singletons):
+        return(hashlib.sha1((content_hash+self.families_hash+str(infer_singletons)).encode()).hexdigest()+".pkl")
+
+    def get(self, gff_file_path, infer_singletons):
+        """
+            :return: a tuple (annotations of the gff file, dict giving the size of each sequence region, dict giving the number of copies of each family) or None if the gff file is not in the cache (or is not a regular file)
+            :rtype: tuple
+        """
+        if not self.__is_cacheable(gff_file_path):
+            return(None)
+        entry_path = self.__entry_path(gff_file_path, infer_singletons)
+        if not os.path.isfile(entry_path):
+            self.nb_misses += 1
+            return(None)
+        try:
+            with open(entry_path,"rb") as entry_file:
+                (contigs, sequence_regions, cpt_fam_occ) = pickle.load(entry_file)
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            logging.getLogger().warning("Corrupted entry of the gff cache "+entry_path+" for "+gff_file_path)
+            os.remove(entry_path)
+            self.nb_misses += 1
+            return(None)
+        os.utime(entry_path)# the entry is the most recently used
+        self.nb_hits += 1
+        annot = defaultdict(OrderedDict)
+        for contig, genes in contigs:
+            annot[contig] = OrderedDict(genes)
+        return((annot, sequence_regions, cpt_fam_occ))
+
+    def put(self, gff_file_path, infer_singletons, annot, sequence_regions, cpt_fam_occ):
+        """
+            Store the result of the parsing of a gff file (see get)
+        """
+        if not self.__is_cacheable(gff_file_path):
+            return
+        entry_path = self.__entry_path(gff_file_path, infer_singletons)
+        with open(entry_path+".tmp","wb") as entry_file:
+            pickle.dump(([(contig, list(genes.items())) for contig, genes in annot.items()], sequence_regions, dict(cpt_fam_occ)), entry_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(entry_path+".tmp", entry_path)
+
+    def close(self):
+        """
+            Save the index of the hashes and remove the least recently used entries exceeding the maximum size of the cache
+        """
+        index_path = os.path.join(self.directory, GffCache.INDEX_FILE)
+        with open(index_path+".tmp","wb") as index_file:
+            pickle.dump(self.index, index_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(index_path+".tmp", index_path)
+        entries = []
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".pkl") and entry != GffCache.INDEX_FILE:
+                stat = os.stat(os.path.join(self.directory, entry))
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        total_size = sum([size for _, size, _ in entries])
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, entry))
+            total_size -= size
+        logging.getLogger().info("gff cache: "+str(self.nb_hits)+" files read from the cache, "+str(self.nb_misses)+" parsed ("+str(round(total_size/2**20,1))+" MB in "+self.directory+")")
+
+################ CLASS GeneIndex ################
+class GeneIndex:
+    """
+        Positional index of the genes of a pangenome (replace a bidict gene -> (organism, contig, position) without storing a tuple by gene)
+        Each contig is numbered and stored as a list of gene identifiers (position -> gene) and each gene is mapped to an integer encoding its contig number and its position (gene -> position).
+        Positions are the ranks of the genes in the annotations of each contig.
+    """
+    POSITION_BITS = 32
+
+    def __init__(self, annotations):
+        """
+            :param annotations: the annotations attribute of the pangenome (organism -> contig -> OrderedDict of genes)
+            :type dict:
+        """
+        self.contigs    = []# (organism, contig) of each contig number
+        self.contig_ids = {}# (organism, contig) -> contig number
+        self.genes      = []# list of the genes of each contig number
+        self.positions  = {}# gene -> (contig number << POSITION_BITS) + position
+        for organism, contigs in annotations.items():
+            for contig, contig_annot in contigs.items():
+                contig_id = len(self.contigs)
+                genes     = list(contig_annot)
+                self.contig_ids[(organism, contig)] = contig_id
+                self.contigs.append((organism, contig))
+                self.genes.append(genes)
+                first = contig_id << GeneIndex.POSITION_BITS
+                self.positions.update(zip(genes, range(first, first+len(genes))))
+
+    def __len__(self):
+        return(len(self.positions))
+
+    def __contains__(self, gene):
+        return(gene in self.positions)
+
+    def locate(self, gene):
+        """
+            :param gene: a gene identifier
+            :type str:
+            :return: a tuple (organism, contig, position) (raise KeyError if the gene is unknown)
+            :rtype: tuple
+        """
+        code = self.positions[gene]
+        (organism, contig) = self.contigs[code >> GeneIndex.POSITION_BITS]
+        return((organism, contig, code & ((1 << GeneIndex.POSITION_BITS)-1)))
+
+    def gene_at(self, organism, contig, position):
+        """
+            :return: the identifier of the gene at this position of the contig (raise KeyError if there is no gene at this position)
+            :rtype: str
+        """
+        genes = self.genes[self.contig_ids[(organism, contig)]]
+        if not 0 <= position < len(genes):
+            raise KeyError((organism, contig, position))
+        return(genes[position])
+
+    def contig_size(self, organism, contig):
+        """
+            :return: the number of genes of the contig
+            :rtype: int
+        """
+        return(len(self.genes[self.contig_ids[(organism, contig)]]))
+
+################ CLASS FamilyWindowIndex ################
+class FamilyWindowIndex:
+    """
+        Encode each contig once as an array of integer family identifiers (genes of the repeted families are skipped as in the neighbors graph) 
+        and index the windows of k consecutive families (k-mers, wrapping around the circular contigs) to find the occurrences of a path of families by hash lookups.
+        The index of a window size is built the first time this size is requested and kept up to date when a gene changes of family (see rename).
+    """
+    def __init__(self, gene_index, annotations, families_repeted, circular_contig_size):
+        """
+            :param gene_index: the positional index of the genes
+            :param annotations: the annotations attribute of the pangenome
+            :param families_repeted: the families to skip
+            :param circular_contig_size: the contigs to circularize
+            :type GeneIndex:
+            :type dict:
+            :type set:
+            :type dict:
+        """
+        self.family_ids   = {}# family name -> family identifier
+        self.family_names = []# family identifier -> family name
+        self.contigs    = []# (organism, contig, circular) of each contig number
+        self.genes      = []# genes of each contig number
+        self.families   = []# array of the family identifiers of each contig number
+        self.positions  = {}# gene -> (contig number << POSITION_BITS) + position
+        self.windows    = {}# k -> {tuple of k family identifiers: set of (contig number, start position)}
+        for contig_id, (organism, contig) in enumerate(gene_index.contigs):
+            contig_annot = annotations[organism][contig]
+            genes = [gene for gene in gene_index.genes[contig_id] if contig_annot[gene][FAMILY] not in families_repeted]
+            self.contigs.append((organism, contig, contig in circular_contig_size))
+            self.genes.append(genes)
+            self.families.append(array("l", [self.family_id(contig_annot[gene][FAMILY]) for gene in genes]))
+            first = contig_id << GeneIndex.POSITION_BITS
+            self.positions.update(zip(genes, range(first, first+len(genes))))
+
+    def family_id(self, family):
+        try:
+            return(self.family_ids[family])
+        except KeyError:
+            self.family_ids[family] = len(self.family_names)
+            self.family_names.append(family)
+            return(self.family_ids[family])
+
+    def __starts(self, contig_id, k):
+        size = len(self.families[contig_id])
+        if self.contigs[contig_id][2] and size >= k:
+            return(range(size))
+        return(range(size-k+1))
+
+    def __window(self, contig_id, start, k):
+        families = self.families[contig_id]
+        size     = len(families)
+        if start+k <= size:
+            return(tuple(families[start:start+k]))
+        return(tuple(families[start:])+tuple(families[:start+k-size]))
+
+    def __index(self, k):
+        if k not in self.windows:
+            windows = defaultdict(set)
+            for contig_id in range(len(self.contigs)):
+                for start in self.__starts(contig_id, k):
+                    windows[self.__window(contig_id, start, k)].add((contig_id, start))
+            self.windows[k] = windows
+        return(self.windows[k])
+
+    def __position(self, contig_id, position):
+        """ return the position on the contig (wrapped if circular) or None if the position is outside of a linear contig """
+        size = len(self.families[contig_id])
+        if self.contigs[contig_id][2]:
+            return(position % size)
+        return(position if 0 <= position < size else None)
+
+    def contig(self, gene):
+        """
+            :return: the contig of a gene
+            :rtype: str
+        """
+        return(self.contigs[self.positions[gene] >> GeneIndex.POSITION_BITS][1])
+
+    def flanked_occurrences(self, path):
+        """
+            Find the occurrences of a path of families in the contigs and their flanking families
+            :param path: a sequence of family names
+            :type tuple:
+            :return: a generator of tuple (left flanking family, right flanking family, organism, tuple of genes from the left flanking gene to the right one in the order of the path)
+            :rtype: generator
+        """
+        try:
+            key = tuple([self.family_ids[family] for family in path])
+        except KeyError:
+            return
+        k       = len(key)
+        windows = self.__index(k)
+        for window, orientation in [(key, 1)] + ([(tuple(reversed(key)), -1)] if key != tuple(reversed(key)) else []):
+            for (contig_id, start) in windows.get(window, ()):
+                first  = start if orientation == 1 else start+k-1
+                left   = self.__position(contig_id, first-orientation)
+                right  = self.__position(contig_id, first+k*orientation)
+                if left is None or right is None or (k+2 > len(self.families[contig_id])):
+                    continue
+                positions = [left]+[self.__position(contig_id, first+i*orientation) for i in range(k)]+[right]
+                genes     = tuple([self.genes[contig_id][pos] for pos in positions])
+                yield (self.family_names[self.families[contig_id][left]], self.family_names[self.families[contig_id][right]], self.contigs[contig_id][0], genes)
+
+    def rename(self, gene, family):
+        """
+            Change the family of a gene and update the indexed windows containing it
+            :param gene: the gene identifier
+            :param family: the new family name
+            :type str:
+            :type str:
+        """
+        code      = self.positions[gene]
+        contig_id = code >> GeneIndex.POSITION_BITS
+        position  = code & ((1 << GeneIndex.POSITION_BITS)-1)
+        for k, windows in self.windows.items():
+            for start in self.__starts_covering(contig_id, position, k):
+                window = self.__window(contig_id, start, k)
+                windows[window].discard((contig_id, start))
+                if len(windows[window]) == 0:
+                    del windows[window]
+        self.families[contig_id][position] = self.family_id(family)
+        for k, windows in self.windows.items():
+            for start in self.__starts_covering(contig_id, position, k):
+                windows[self.__window(contig_id, start, k)].add((contig_id, start))
+
+    def __starts_covering(self, contig_id, position, k):
+        size = len(self.families[contig_id])
+        if self.contigs[contig_id][2]:
+            return(set([(position-i) % size for i in range(k)]) if size >= k else set())
+        return(set([start for start in range(position-k+1, position+1) if 0 <= start <= size-k]))
+
+################ CLASS SharedPangenome ################
+class SharedPangenome:
+    """
+        Read-only flat copy of a pangenome graph stored in a single shared memory block (or an anonymous mmap if shared_memory is not available).
+        Worker processes attach to the block (by inheritance if forked, by name if the object is pickled) instead of duplicating the networkx graph.
+        The block contains:
+            * the presence/absence matrix (a bit-packed row of nb_organisms bits by family)
+            * the family names (utf-8, concatenated) and their offsets
+            * the adjacency in CSR format (the neighbors of the family i are adj_idx[adj_ptr[i]:adj_ptr[i+1]], sorted, and adj_edge gives the corresponding edges)
+            * the edge coverage in CSR format (the organisms supporting the edge e are cov_org[cov_ptr[e]:cov_ptr[e+1]] and cov_count gives the number of links in each organism)
+        Organisms are identified by their rank in the organisms attribute of the pangenome (organism index).
+    """
+    ARRAYS = (("presence","B"),("names","B"),("name_ptr","Q"),("adj_ptr","Q"),("adj_idx","I"),("adj_edge","I"),("cov_ptr","Q"),("cov_org","I"),("cov_count","I"))
+
+    def __init__(self, pangenome):
+        """
+            :param pangenome: the pangenome to copy (the neighbors graph must be computed)
+            :type PPanGGOLiN:
+        """
+        graph          = pangenome.neighbors_graph
+        self.organisms = list(pangenome.organisms)
+        self.org_index = dict(zip(self.organisms, range(len(self.organisms))))
+        self.row_size  = (len(self.organisms)+7)//8
+        families       = list(graph.nodes())
+        fam_index      = dict(zip(families, range(len(families))))
+        self.nb_families = len(families)
+
+        arrays = dict([(name, array(typecode)) for name, typecode in SharedPangenome.ARRAYS])
+        arrays["presence"] = array("B", bytes(self.nb_families*self.row_size))
+        arrays["name_ptr"].append(0)
+        arrays["adj_ptr"].append(0)
+        arrays["cov_ptr"].append(0)
+        edges = {}
+        for i, (fam, data) in enumerate(graph.nodes(data=True)):
+            for org in data:
+                j = self.org_index.get(org)
+                if j is not None:
+                    arrays["presence"][i*self.row_size+(j>>3)] |= 1<<(j&7)
+            name = str(fam).encode("utf-8")
+            arrays["names"].frombytes(name)
+            arrays["name_ptr"].append(len(arrays["names"]))
+            for k in sorted([fam_index[neighbor] for neighbor in set(nx.all_neighbors(graph, fam))]):
+                key = (min(i,k),max(i,k))
+                if key not in edges:
+                    edges[key] = len(edges)
+                    coverage = Counter()
+                    for (u, v) in (set([(fam, families[k]), (families[k], fam)]) if graph.is_directed() else [(fam, families[k])]):
+                        if graph.has_edge(u, v):
+                            coverage.update(dict([(self.org_index[org], nb) for org, nb in graph[u][v].items() if org in self.org_index]))
+                    for j, nb in sorted(coverage.items()):
+                        arrays["cov_org"].append(j)
+                        arrays["cov_count"].append(nb)
+                    arrays["cov_ptr"].append(len(arrays["cov_org"]))
+                arrays["adj_idx"].append(k)
+                arrays["adj_edge"].append(edges[key])
+            arrays["adj_ptr"].append(len(arrays["adj_idx"]))
+
+        self.layout = []
+        offset = 0
+        for name, typecode in SharedPangenome.ARRAYS:
+            nbytes = len(arrays[name])*arrays[name].itemsize
+            self.layout.append((name, typecode, offset, len(arrays[name])))
+            offset += nbytes + (-nbytes % 8) # keep the arrays aligned on 8 bytes
+        self.size   = max(offset, 1)
+        self.owner  = os.getpid()
+        if shared_memory is not None:
+            self.shm  = shared_memory.SharedMemory(create = True, size = self.size)
+            self.name = self.shm.name
+            buffer    = self.shm.buf
+        else:
+            self.shm  = mmap.mmap(-1, self.size)
+            self.name = None
+            buffer    = memoryview(self.shm)
+        for name, typecode, offset, length in self.layout:
+            buffer[offset:offset+length*arrays[name].itemsize] = arrays[name].tobytes()
+        self.__attach_views()
+
+    def __attach_views(self):
+        buffer = self.shm.buf if shared_memory is not None else memoryview(self.shm)
+        for name, typecode, offset, length in self.layout:
+            itemsize = array(typecode).itemsize
+            setattr(self, name, buffer[offset:offset+length*itemsize].cast(typecode))
+
+    def __getstate__(self):
+        if self.name is None:
+            raise pickle.PicklingError("anonymous mmap can only be shared by forked processes")
+        state = dict(self.__dict__)
+        for name, typecode in SharedPangenome.ARRAYS:
+            del state[name]
+        del state["shm"]
+        return(state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name = self.name)
+        if os.getpid() != self.owner:# only the creator must unlink the block, the attached processes must not register it
+            try:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception:
+                pass
+        self.owner = None
+        self.__attach_views()
+
+    def release(self):
+        """
+            Detach the views and free the shared memory (unlinked only by the process which created it)
+        """
+        for name, typecode in SharedPangenome.ARRAYS:
+            getattr(self, name).release()
+            delattr(self, name)
+        self.shm.close()
+        if self.name is not None and os.getpid() == self.owner:
+            self.shm.unlink()
+
+    def family(self, i):
+        """
+            :return: the name of the family of index i
+            :rtype: str
+        """
+        return(bytes(self.names[self.name_ptr[i]:self.name_ptr[i+1]]).decode("utf-8"))
+
+    def columns(self, organisms):
+        """
+            :return: the list of the organism indexes of organisms (in the same order)
+            :rtype: list
+        """
+        return([self.org_index[org] for org in organisms])
+
+    def nb_present_by_family(self, organisms):
+        """
+            Iterate over the families and give the number of organisms of organisms having at least a gene in each family 
+            :return: a generator of tuple (family name, number of organisms)
+            :rtype: generator
+        """
+        masks = self.__row_masks(self.columns(organisms))
+        for i in range(self.nb_families):
+            row = i*self.row_size
+            yield (self.family(i), sum([bin(self.presence[row+byte] & mask).count("1") for byte, mask in masks]))
+
+    def __row_masks(self, columns):
+        masks = defaultdict(int)
+        for j in columns:
+            masks[j>>3] |= 1<<(j&7)
+        return(sorted(masks.items()))
+
+    def write_nem_input_files(self, organisms, index_file, dat_file, nei_file):
+        """
+            Write the .index, .dat and .nei NEM files restricted to organisms (same content as the files written from the graph)
+            :param organisms: the organisms to use
+            :param index_file: the opened .index file
+            :param dat_file: the opened .dat file
+            :param nei_file: the opened .nei file (the header line must already be written)
+            :type OrderedSet:
+            :type file:
+            :type file:
+            :type file:
+            :return: the number of families written
+            :rtype: int
+        """
+        columns   = self.columns(organisms)
+        positions = [(j>>3, 1<<(j&7)) for j in columns]
+        masks     = self.__row_masks(columns)
+        selected  = set(columns)
+        index_fam = {}
+        for i in range(self.nb_families):
+            row = i*self.row_size
+            if any([self.presence[row+byte] & mask for byte, mask in masks]):
+                dat_file.write("\t".join(["1" if self.presence[row+byte] & bit else "0" for byte, bit in positions])+"\n")
+                index_fam[i] = len(index_fam)+1
+                index_file.write(str(index_fam[i])+"\t"+self.family(i)+"\n")
+        for i, index in index_fam.items():
+            row_fam        = []
+            row_dist_score = []
+            for pos in range(self.adj_ptr[i], self.adj_ptr[i+1]):
+                neighbor = self.adj_idx[pos]
+                if neighbor not in index_fam:
+                    continue
+                edge     = self.adj_edge[pos]
+                coverage = sum([self.cov_count[c] for c in range(self.cov_ptr[edge], self.cov_ptr[edge+1]) if self.cov_org[c] in selected])
+                if coverage==0:
+                    continue
+                row_fam.append(str(index_fam[neighbor]))
+                row_dist_score.append(str(coverage))
+            nei_file.write("\t".join([str(index),str(len(row_fam))]+row_fam+row_dist_score)+"\n")
+        return(len(index_fam))
+
+################ CLASS WorkQueue ################
+class WorkQueue:
+    """
+        Queue of NEM runs stored in a directory shared by several machines (a shared filesystem supporting atomic renames, e.g. NFS): 
+        a coordinator writes the NEM input files and the parameters of each task, worker processes (see work) claim the tasks, run NEM and write the results that the coordinator collects.
+            * tasks/ID/ contains the NEM input files and the parameters (task.pkl) of the task ID
+            * pending/ID marks a task waiting for a worker, a worker claims it by renaming it in claimed/ID (only one rename can succeed)
+            * results/ID.pkl contains the result of run_partitioning (or the exception raised)
+            * stop tells the workers to exit
+        A task claimed since more than timeout seconds (measured by the coordinator, so that the clocks of the machines do not matter) is considered lost and put back in pending/ for another worker.
+    """
+    TASK_FILE = "task.pkl"
+    STOP_FILE = "stop"
+
+    def __init__(self, directory, timeout = 3600, poll_interval = 1):
+        """
+            :param directory: a str containing the path of the queue directory (created if required)
+            :param timeout: a number of seconds after which a claimed task without result is given to another worker
+            :param poll_interval: a number of seconds between two scans of the directory
+            :type str:
+            :type float:
+            :type float:
+        """
+        self.directory     = os.path.abspath(directory)
+        self.timeout       = timeout
+        self.poll_interval = poll_interval
+        for sub_directory in ("tasks", "pending", "claimed", "results"):
+            os.makedirs(os.path.join(self.directory, sub_directory), exist_ok = True)
+        self.submitted = {}# task -> time at which the coordinator saw it claimed (None while pending)
+
+    def __getstate__(self):# the tasks submitted by a process are only collected by this process
+        state = self.__dict__.copy()
+        state["submitted"] = {}
+        return(state)
+
+    def __path(self, *names):
+        return(os.path.join(self.directory, *names))
+
+    def new_task(self):
+        """
+            :return: a tuple containing the identifier of a new task and the directory where its NEM input files must be written before calling submit
+            :rtype: tuple
+        """
+        task = uuid.uuid4().hex
+        os.makedirs(self.__path("tasks", task))
+        return((task, self.__path("tasks", task)))
+
+    def submit(self, task, nb_org, beta, free_dispersion, seed = None):
+        """
+            Make a task available to the workers (see run_partitioning for the parameters)
+        """
+        with open(self.__path("tasks", task, WorkQueue.TASK_FILE+".tmp"),"wb") as task_file:
+            pickle.dump({"nb_org":nb_org, "beta":beta, "free_dispersion":free_dispersion, "seed":seed}, task_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(self.__path("tasks", task, WorkQueue.TASK_FILE+".tmp"), self.__path("tasks", task, WorkQueue.TASK_FILE))
+        open(self.__path("pending", task),"w").close()
+        self.submitted[task] = None
+
+    def results(self):
+        """
+            Collect the results of the tasks submitted by this process which are finished (their files are removed) and give the lost tasks to other workers
+            :return: a list of tuples (task, result of run_partitioning)
+            :rtype: list
+            :raise: the exception raised by a worker running one of the tasks
+        """
+        finished = []
+        now = time()
+        for task, claimed_since in list(self.submitted.items()):
+            result_path = self.__path("results", task+".pkl")
+            if os.path.isfile(result_path):
+                with open(result_path,"rb") as result_file:
+                    result = pickle.load(result_file)
+                self.cancel([task])
+                if isinstance(result, Exception):
+                    raise result
+                finished.append((task, result))
+            elif os.path.exists(self.__path("claimed", task)):
+                if claimed_since is None:
+                    self.submitted[task] = now
+                elif now-claimed_since > self.timeout:
+                    try:
+                        os.rename(self.__path("claimed", task), self.__path("pending", task))
+                        logging.getLogger().warning("No result for the task "+task+" claimed since "+str(round(now-claimed_since))+" s, it is given to another worker")
+                    except FileNotFoundError:
+                        pass
+                    self.submitted[task] = None
+        return(finished)
+
+    def cancel(self, tasks):
+        """
+            Remove tasks submitted by this process from the queue (a worker running one of them drops its result)
+            :param tasks: a list of task identifiers
+            :type list:
+        """
+        for task in tasks:
+            for path in (self.__path("pending", task), self.__path("claimed", task), self.__path("results", task+".pkl")):
+                if os.path.lexists(path):
+                    os.remove(path)
+            shutil.rmtree(self.__path("tasks", task), ignore_errors = True)
+            self.submitted.pop(task, None)
+
+    def claim(self):
+        """
+            Claim the oldest pending task
+            :return: a tuple containing the identifier of the task, the directory of its NEM input files and its parameters or None if no task is pending
+            :rtype: tuple
+        """
+        pending = []
+        for task in os.listdir(self.__path("pending")):
+            try:
+                pending.append((os.stat(self.__path("pending", task)).st_mtime, task))
+            except FileNotFoundError:# claimed by another worker meanwhile
+                pass
+        for _, task in sorted(pending):
+            try:
+                os.rename(self.__path("pending", task), self.__path("claimed", task))
+            except FileNotFoundError:
+                continue
+            try:
+                with open(self.__path("tasks", task, WorkQueue.TASK_FILE),"rb") as task_file:
+                    parameters = pickle.load(task_file)
+            except (FileNotFoundError, EOFError):# cancelled meanwhile
+                continue
+            return((task, self.__path("tasks", task), parameters))
+        return(None)
+
+    def complete(self, task, result):
+        """
+            Write the result of a task claimed by this process (dropped if the task was cancelled)
+            :param task: a str identifying the task
+            :param result: the result of run_partitioning or the exception raised by it
+            :type str:
+            :type tuple:
+        """
+        if not os.path.isdir(self.__path("tasks", task)):
+            return
+        tmp_path = self.__path("results", task+".pkl."+socket.gethostname()+"_"+str(os.getpid()))
+        with open(tmp_path,"wb") as result_file:
+            pickle.dump(result, result_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.__path("results", task+".pkl"))
+
+    def start(self):
+        """ Remove the stop mark left by a previous coordinator (the workers started before are already gone) """
+        if os.path.exists(self.__path(WorkQueue.STOP_FILE)):
+            os.remove(self.__path(WorkQueue.STOP_FILE))
+
+    def stop(self):
+        """ Tell the workers to exit once their current task is finished """
+        open(self.__path(WorkQueue.STOP_FILE),"w").close()
+
+    def is_stopped(self):
+        return(os.path.exists(self.__path(WorkQueue.STOP_FILE)))
+
+    def work(self, idle_timeout = None):
+        """
+            Run the tasks of the queue one by one until the queue is stopped (or has no pending task during idle_timeout seconds)
+            Each task is run in its own subdirectory of the task directory so that a task given to several workers (after a timeout) is not corrupted
+            :param idle_timeout: a number of seconds or None to wait for tasks until the queue is stopped
+            :type float:
+            :return: the number of tasks run
+            :rtype: int
+        """
+        worker  = socket.gethostname()+"_"+str(os.getpid())
+        nb_done = 0
+        idle_since = time()
+        while not self.is_stopped():
+            claimed = self.claim()
+            if claimed is None:
+                if idle_timeout is not None and time()-idle_since > idle_timeout:
+                    break
+                sleep(self.poll_interval)
+                continue
+            (task, task_dir_path, parameters) = claimed
+            logging.getLogger().debug("Running the task "+task)
+            run_dir_path = task_dir_path+"/"+worker+"/"
+            try:
+                link_nem_input_files(task_dir_path, run_dir_path)
+                result = run_partitioning(run_dir_path, **parameters)
+            except Exception as e:
+                if not os.path.isdir(task_dir_path):# cancelled while running
+                    continue
+                logging.getLogger().error("The task "+task+" failed: "+repr(e))
+                result = e
+            self.complete(task, result)
+            nb_done += 1
+            idle_since = time()
+        return(nb_done)
+
+################ FUNCTION degree_two_chains ################
+def degree_two_chains(graph):
+    """
+        Find the maximal unbranched paths of a graph: chains of consecutive nodes having exactly two distinct neighbors (cycles made only of such nodes are returned as a chain)
+        :param graph: an undirected networkx graph
+        :type nx.Graph:
+        :return: a list of chains, each one being the list of its nodes in the order of the path
+        :rtype: list
+    """
+    def is_inner(node):
+        neighbors = set(graph.neighbors(node))
+        return(len(neighbors) == 2 and node not in neighbors)
+
+    visited = set()
+    chains  = []
+    for node in graph.nodes():
+        if node in visited or not is_inner(node):
+            continue
+        visited.add(node)
+        chain = deque([node])
+        for direction, current in enumerate(graph.neighbors(node)):
+            previous = node
+            while current not in visited and is_inner(current):
+                visited.add(current)
+                if direction == 0:
+                    chain.append(current)
+                else:
+                    chain.appendleft(current)
+                (a, b) = graph.neighbors(current)
+                (previous, current) = (current, a if b == previous else b)
+        chains.append(list(chain))
+    return(chains)
+
+################ FUNCTION coarsen_graph ################
+def coarsen_graph(graph):
+    """
+        Coarsen a graph for the multilevel layout: each maximal chain of degree-2 nodes becomes a node and the nodes having a single neighbor are merged with it 
+        :param graph: an undirected networkx graph
+        :type nx.Graph:
+        :return: a tuple (coarse graph having integer nodes and weighted edges, list giving for each coarse node a tuple (ordered list of the nodes of its chain or its node, list of merged leaves))
+        :rtype: tuple
+    """
+    group   = {}
+    members = []
+    for chain in degree_two_chains(graph):
+        for node in chain:
+            group[node] = len(members)
+        members.append((chain, []))
+    for node in graph.nodes():
+        if node not in group and graph.degree(node) != 1:
+            group[node] = len(members)
+            members.append(([node], []))
+    for node in graph.nodes():
+        if node not in group:# leaf
+            neighbor = next(iter(graph.neighbors(node)))
+            if neighbor not in group:# isolated pair of leaves
+                group[neighbor] = len(members)
+                members.append(([neighbor], []))
+            group[node] = group[neighbor]
+            members[group[node]][1].append(node)
+
+    coarse = nx.Graph()
+    coarse.add_nodes_from(range(len(members)))
+    for u, v, data in graph.edges(data=True):
+        (gu, gv) = (group[u], group[v])
+        if gu != gv:
+            if coarse.has_edge(gu, gv):
+                coarse[gu][gv]["weight"] += data.get("weight", 1.0)
+            else:
+                coarse.add_edge(gu, gv, weight = data.get("weight", 1.0))
+    return((coarse, members))
+
+################ FUNCTION multilevel_layout ################
+def multilevel_layout(graph, forceatlas2, iterations = 500, refinement_iterations = 50, min_reduction = 0.1):
+    """
+        Multilevel ForceAtlas2 layout: the graph is coarsened (see coarsen_graph) while each level reduces the number of nodes by at least min_reduction, 
+        the coarsest graph is laid out using iterations iterations and the positions are then interpolated and refined (refinement_iterations iterations) on each finer level
+        :param graph: a networkx graph
+        :param forceatlas2: a configured ForceAtlas2 object
+        :param iterations: an int specifying the number of iterations used to lay out the coarsest graph
+        :param refinement_iterations: an int specifying the number of iterations used to refine each finer level
+        :param min_reduction: a float specifying the minimal reduction of the number of nodes required to add a coarser level
+        :type nx.Graph:
+        :type ForceAtlas2:
+        :type int:
+        :type int:
+        :type float:
+        :return: a dict having the nodes as keys and a tuple (x,y) as value
+        :rtype: dict
+    """
+    levels   = [graph.to_undirected() if graph.is_directed() else graph]
+    mappings = []
+    while levels[-1].number_of_nodes() > 2:
+        (coarse, members) = coarsen_graph(levels[-1])
+        if coarse.number_of_nodes() > (1-min_reduction)*levels[-1].number_of_nodes():
+            break
+        levels.append(coarse)
+        mappings.append(members)
+    logging.getLogger().info("Multilevel layout: "+" > ".join([str(level.number_of_nodes()) for level in levels])+" nodes")
+
+    positions = forceatlas2.forceatlas2_networkx_layout(levels[-1], pos=None, iterations=iterations)
+    for level in reversed(range(len(mappings))):
+        fine     = levels[level]
+        group    = dict([(node, coarse_node) for coarse_node, (chain, leaves) in enumerate(mappings[level]) for node in chain+leaves])
+        spread   = layout_spread(positions)
+        expanded = {}
+        for coarse_node, (chain, leaves) in enumerate(mappings[level]):
+            center = positions[coarse_node]
+            if len(chain) > 1:
+                # the chain is spread on the segment joining the middles of its links toward its anchors
+                ends = []
+                for end, inner in ((chain[0], chain[1]), (chain[-1], chain[-2])):
+                    outside = [group[neighbor] for neighbor in fine.neighbors(end) if neighbor != inner and group[neighbor] != coarse_node]
+                    if len(outside) > 0:
+                        ends.append(tuple((c+a)/2 for c, a in zip(center, positions[outside[0]])))
+                    else:
+                        ends.append(None)
+                if ends[0] is None and ends[1] is None:
+                    ends[0] = jitter(center, spread)
+                if ends[0] is None:
+                    ends[0] = tuple(2*c-e for c, e in zip(center, ends[1]))
+                if ends[1] is None:
+                    ends[1] = tuple(2*c-e for c, e in zip(center, ends[0]))
+                for rank, node in enumerate(chain):
+                    ratio = (rank+0.5)/len(chain)
+                    expanded[node] = jitter(tuple(e0+(e1-e0)*ratio for e0, e1 in zip(ends[0], ends[1])), spread/100)
+            else:
+                expanded[chain[0]] = center
+            for leaf in leaves:
+                expanded[leaf] = jitter(center, spread/10)
+        positions = forceatlas2.forceatlas2_networkx_layout(fine, pos=expanded, iterations=refinement_iterations)
+    return(positions)
+
+################ FUNCTION layout_spread ################
+def layout_spread(positions):
+    """
+        Return the typical distance between nodes of a layout (the side of the bounding box divided by the square root of the number of nodes)
+        :param positions: a dict having the nodes as keys and a tuple (x,y) as value
+        :type dict:
+        :return: the typical distance
+        :rtype: float
+    """
+    if len(positions) == 0:
+        return(1.0)
+    xs = [x for x, y in positions.values()]
+    ys = [y for x, y in positions.values()]
+    side = max(max(xs)-min(xs), max(ys)-min(ys))
+    return(side/math.sqrt(len(positions)) if side > 0 else 1.0)
+
+################ FUNCTION jitter ################
+def jitter(position, distance):
+    """
+        Return a position randomly drawn around a position
+        :param position: a tuple (x,y)
+        :param distance: a float specifying the maximum shift along each axis
+        :type tuple:
+        :type float:
+        :return: the new position
+        :rtype: tuple
+    """
+    return(tuple(coordinate+uniform(-distance, distance) for coordinate in position))
+
+################ FUNCTION place_around_anchors ################
+def place_around_anchors(graph, positions):
+    """
+        Complete a layout: the nodes without position are placed near the barycenter of their neighbors already placed (the placement propagates from the placed nodes), 
+        the nodes unconnected to any placed node are randomly placed
+        :param graph: a networkx graph
+        :param positions: a dict having the nodes as keys and a tuple (x,y) as value
+        :type nx.Graph:
+        :type dict:
+        :return: a new dict having all the nodes of the graph as keys and a tuple (x,y) as value
+        :rtype: dict
+    """
+    placed = dict([(node, tuple(pos_x_y)) for node, pos_x_y in positions.items() if node in graph])
+    spread = layout_spread(placed)
+    frontier = set([neighbor for node in placed for neighbor in nx.all_neighbors(graph, node) if neighbor not in placed])
+    while len(frontier) > 0:
+        new_positions = {}
+        for node in frontier:
+            anchors = [placed[neighbor] for neighbor in nx.all_neighbors(graph, node) if neighbor in placed]
+            new_positions[node] = jitter((sum([x for x, y in anchors])/len(anchors), sum([y for x, y in anchors])/len(anchors)), spread/10)
+        placed.update(new_positions)
+        frontier = set([neighbor for node in new_positions for neighbor in nx.all_neighbors(graph, node) if neighbor not in placed])
+    if len(placed) < graph.number_of_nodes():
+        xs = [x for x, y in placed.values()] or [0.0]
+        ys = [y for x, y in placed.values()] or [0.0]
+        for node in graph.nodes():
+            if node not in placed:
+                placed[node] = (uniform(min(xs)-spread, max(xs)+spread), uniform(min(ys)-spread, max(ys)+spread))
+    return(placed)
+
+################ FUNCTION read_layout_positions ################
+def read_layout_positions(positions_file_path):
+    """
+        Read positions written by write_layout_positions
+        :param positions_file_path: a str containing the path of the file
+        :type str:
+        :return: a dict having the nodes as keys and a tuple (x,y) as value
+        :rtype: dict
+    """
+    positions = {}
+    with open(positions_file_path) as positions_file:
+        for line in positions_file:
+            elements = line.rstrip("\n").split("\t")
+            if len(elements) == 3:
+                positions[elements[0]] = (float(elements[1]), float(elements[2]))
+    return(positions)
+
+################ FUNCTION write_layout_positions ################
+def write_layout_positions(positions_file_path, positions):
+    """
+        Write the positions of a layout (one node per line: node, x, y separated by tabulations) to be reused by a next run
+        :param positions_file_path: a str containing the path of the file
+        :param positions: a dict having the nodes as keys and a tuple (x,y) as value
+        :type str:
+        :type dict:
+    """
+    with open(positions_file_path,"w") as positions_file:
+        for node, (x, y) in positions.items():
+            positions_file.write(str(node)+"\t"+repr(float(x))+"\t"+repr(float(y))+"\n")
+
+################ FUNCTION init_projection_worker ################
+PROJECTION_PARTITIONS = ["persistent","shell","cloud","undefined","core_exact","accessory"]
+projection_table      = None
+
+def projection_table_from(families):
+    """
+        Pack the family -> (partition, partition_exact, number of persistent neighbors, number of shell neighbors, number of cloud neighbors) table into arrays
+        (only the index of the families is a dict, so that the forked workers reading the table do not duplicate it through the reference counts)
+        :param families: a dict having the families as keys and the tuple as value
+        :type dict:
+        :return: a tuple (dict family -> row, array of partition codes, array of exact partition codes, array of neighbor counts (3 by row))
+        :rtype: tuple
+    """
+    index            = {}
+    partitions       = array("B")
+    partitions_exact = array("B")
+    neighbors        = array("I")
+    for row, (family, (partition, partition_exact, nb_persistent, nb_shell, nb_cloud)) in enumerate(families.items()):
+        index[family] = row
+        partitions.append(PROJECTION_PARTITIONS.index(partition))
+        partitions_exact.append(PROJECTION_PARTITIONS.index(partition_exact))
+        neighbors.extend((nb_persistent, nb_shell, nb_cloud))
+    return((index, partitions, partitions_exact, neighbors))
+
+def init_projection_worker(table):
+    """
+        Store in the process the table (see projection_table_from) used by write_organism_projection 
+        :param table: the packed table
+        :type tuple:
+    """
+    global projection_table
+    projection_table = table
+
+################ FUNCTION write_organism_projection ################
+def write_organism_projection(args):
+    """
+        Write the projection file of an organism (out_dir/organism.csv, gzipped if compressed) using the table given to init_projection_worker
+        Lines are accumulated and written by blocks of buffer_size lines
+        :param args: a tuple (out_dir, organism, annotations of the organism, compressed, buffer_size)
+        :type tuple:
+        :return: a tuple (organism, dict giving the number of genes of the organism in each partition)
+        :rtype: tuple
+    """
+    (out_dir, organism, annotations, compressed, buffer_size) = args
+    (index, partitions, partitions_exact, neighbors) = projection_table
+    nb_copy = Counter([gene_info[FAMILY] for contig_annot in annotations.values() for gene_info in contig_annot.values()])
+    nb_genes_by_code = [0]*len(PROJECTION_PARTITIONS)
+    nb_genes = 0
+    out_file = gzip.open(out_dir+"/"+organism+".csv.gz","wt") if compressed else open(out_dir+"/"+organism+".csv","w")
+    with out_file:
+        lines = ["gene,contig,coord_start,coord_end,strand,ori,family,nb_copy_in_org,partition,persistent,shell,cloud\n"]
+        for contig, contig_annot in annotations.items():
+            for gene, gene_info in contig_annot.items():
+                row = index.get(gene_info[FAMILY])
+                if row is None:# repeted family
+                    continue
+                code = partitions[row]
+                nb_genes_by_code[code]+=1
+                nb_genes_by_code[partitions_exact[row]]+=1
+                nb_genes+=1
+                lines.append("%s,%s,%d,%d,%s,%s,%s,%d,%s,%d,%d,%d\n" % (gene,
+                                                                         contig,
+                                                                         gene_info[START],
+                                                                         gene_info[END],
+                                                                         gene_info[STRAND],
+                                                                         "T" if (gene_info[NAME].upper() == "DNAA" or gene_info[PRODUCT].upper() == "DNAA") else "F",
+                                                                         gene_info[FAMILY],
+                                                                         nb_copy[gene_info[FAMILY]],
+                                                                         PROJECTION_PARTITIONS[code],
+                                                                         neighbors[3*row],
+                                                                         neighbors[3*row+1],
+                                                                         neighbors[3*row+2]))
+                if len(lines) >= buffer_size:
+                    out_file.write("".join(lines))
+                    lines = []
+        out_file.write("".join(lines))
+    nb_genes_by_partition = defaultdict(int, [(partition, nb) for partition, nb in zip(PROJECTION_PARTITIONS, nb_genes_by_code) if nb > 0])
+    nb_genes_by_partition["pangenome"] = nb_genes
+    return((organism, nb_genes_by_partition))
+
 ################ FUNCTION run_partitioning ################
 """ """
-def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="param_file_default"):
-    
+def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="param_file_default", seed = None, nb_threads = 1):
+    """
+        Run NEM on the input files stored in nem_dir_path and read its results
+        :param seed: an int used to seed the random generator of NEM (None means seeded by the time)
+        :param nb_threads: an int specifying the number of threads used by NEM (if NEM is compiled with OpenMP), more than 1 replaces the sequential update of the families by a parallel update giving the same result whatever the number of threads
+        :return: a tuple containing the partition of each family, the parameters of each class, a dict of criteria ("U","D","L","M" from NEM, the "BIC" and the "ICL", the lower the better for the two last) and the posterior probabilities of the classes for each family
+        :rtype: tuple
+    """
     logging.getLogger().debug("Running NEM...")
     # weighted_degree = sum(list(self.neighbors_graph.degree(weight="weight")).values())/nx.number_of_edges(self.neighbors_graph)
     # logging.getLogger().debug("weighted_degree: "+str(weighted_degree))
@@ -1823,7 +3402,9 @@ def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="p
         model_family   = MODEL,
         proportion     = PROPORTION,
         dispersion     = VARIANCE_MODEL,
-        init_mode      = INIT_PARAM_FILE if init.startswith("param_file") else INIT_RANDOM)
+        init_mode      = INIT_PARAM_FILE if init.startswith("param_file") else INIT_RANDOM,
+        seed           = -1 if seed is None else seed,
+        nb_threads     = nb_threads)
     # arguments_nem = [str.encode(s) for s in ["nem", 
     #                  nem_dir_path+"/nem_file",
     #                  str(Q),
@@ -1888,17 +3469,24 @@ def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="p
     else:
         logging.getLogger().warning("No NEM output file found: "+ nem_dir_path+"/nem_file.uf")
     index_fam = []
+    rows      = []# row of each family in the NEM files (families having the same presence/absence profile share a row if the files are collapsed)
     with open(nem_dir_path+"/nem_file.index","r") as index_nem_file:
         for line in index_nem_file:
-            index_fam.append(line.split("\t")[1].strip())
+            (row, family) = line.split("\t")
+            rows.append(int(row)-1)
+            index_fam.append(family.strip())
     
     partitions_list = ["U"] * len(index_fam)
+    posteriors_list = []
     all_parameters = {}
+    criteria = {}
     try:
         with open(nem_dir_path+"/nem_file.uf","r") as partitions_nem_file, open(nem_dir_path+"/nem_file.mf","r") as parameter_nem_file:
             parameter = parameter_nem_file.readlines()
-            M = float(parameter[2].split()[3]) # M is markov ps-like
-            BIC = -2 * M - (Q * nb_org * 2 + Q - 1) * math.log(len(index_fam))
+            (U, D, L, M) = [float(c) for c in parameter[2].split()[0:4]] # U is the NEM criterion, D Hathaway, L mixture and M is markov ps-like
+            nb_parameters = Q * nb_org + (Q * nb_org if free_dispersion else Q) + Q - 1 # centers, dispersions and proportions
+            BIC = -2 * M + nb_parameters * math.log(len(index_fam))
+            criteria = {"U":U,"D":D,"L":L,"M":M,"BIC":BIC}
             
             sum_mu_k = []
             sum_epsilon_k = []
@@ -1956,8 +3544,13 @@ def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="p
                 if partition[0] != "P" or partition[1] != "S" or partition[2] != "C":
                     raise ValueError("vector mu_k and epsilon_k value in the mf file are not consistent with the initialisation value in the .m file")
 
+            row_partitions = []
+            row_entropies  = []
+            row_posteriors = []
             for i, line in enumerate(partitions_nem_file):
                 elements = [float(el) for el in line.split()]
+                row_posteriors.append(tuple(elements))
+                row_entropies.append(-sum([prob * math.log(prob) for prob in elements if prob > 0]))
                 max_prob = max([float(el) for el in elements])
                 positions_max_prob = [pos for pos, prob in enumerate(elements) if prob == max_prob]
                 logging.getLogger().debug(positions_max_prob)
@@ -1965,11 +3558,15 @@ def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="p
                 
                 if init=="param_file_default":
                     if (len(positions_max_prob)>1):
-                        partitions_list[i]="S"#SHELL in case of doubt (equiprobable partition), gene families is attributed to shell
+                        row_partitions.append("S")#SHELL in case of doubt (equiprobable partition), gene families is attributed to shell
                     else:
-                        partitions_list[i]=partition[positions_max_prob.pop()]
+                        row_partitions.append(partition[positions_max_prob.pop()])
                 else:
-                    partitions_list[i]=positions_max_prob.pop()
+                    row_partitions.append(positions_max_prob.pop())
+            partitions_list = [row_partitions[row] for row in rows]
+            posteriors_list = [row_posteriors[row] for row in rows]
+            entropy = sum([row_entropies[row] for row in rows])
+            criteria["ICL"] = BIC + 2 * entropy # BIC penalized by the fuzziness of the classification
 
             #logging.getLogger().debug(index.keys())
     except IOError:
@@ -1977,6 +3574,424 @@ def run_partitioning(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init="p
     except ValueError:
         ## return the default partitions_list which correspond to undefined
         pass
-    return((dict(zip(index_fam, partitions_list)),all_parameters))
+    return((dict(zip(index_fam, partitions_list)),all_parameters,criteria,dict(zip(index_fam, posteriors_list))))
+
+################ FUNCTION link_nem_input_files ################
+def link_nem_input_files(src_dir_path, dst_dir_path, files = NEM_INPUT_FILES):
+    """
+        Make the NEM input files of src_dir_path available in dst_dir_path without rewriting them (hard links or copies if links are not possible)
+        Each NEM run writes its outputs next to its inputs, so runs sharing the same inputs must be done in different directories
+        :param src_dir_path: a str containing the directory where the input files have been written
+        :param dst_dir_path: a str containing the directory where NEM will be run
+        :param files: a list of the file names to make available (missing files are skipped and removed from dst_dir_path)
+        :type str:
+        :type str:
+        :type list:
+    """
+    if not os.path.exists(dst_dir_path):
+        os.makedirs(dst_dir_path)
+    for file_name in files:
+        src = src_dir_path+"/"+file_name
+        dst = dst_dir_path+"/"+file_name
+        if os.path.lexists(dst):
+            os.remove(dst)
+        if not os.path.isfile(src):
+            continue
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+################ FUNCTION collapse_nem_input_files ################
+def collapse_nem_input_files(src_dir_path, dst_dir_path = None):
+    """
+        Collapse the families having the same presence/absence profile in the NEM input files into a single row weighted by the number of families (nem_file.wei)
+        Without the neighborhood term (beta = 0), the partition of a family only depends on its profile, so NEM gives the same result using only the unique profiles.
+        The .index file keeps a line by family giving the row of its profile (several families share the same row) so that run_partitioning expands the results back to the families.
+        :param src_dir_path: a str containing the directory where the input files have been written
+        :param dst_dir_path: a str containing the directory where the collapsed .dat, .index, .nei, .str and .wei files are written (None to replace the files of src_dir_path)
+        :type str:
+        :type str:
+        :return: the number of unique profiles
+        :rtype: int
+    """
+    dst_dir_path = src_dir_path if dst_dir_path is None else dst_dir_path
+    profiles = OrderedDict()
+    rows     = []
+    with open(src_dir_path+"/nem_file.dat") as dat_file, open(src_dir_path+"/nem_file.index") as index_file:
+        for profile, line in zip(dat_file, index_file):
+            rows.append((profiles.setdefault(profile, len(profiles)), line.split("\t")[1].strip()))
+    with open(src_dir_path+"/nem_file.str") as str_file:
+        nb_org = str_file.readline().split()[2]
+    weights = [0] * len(profiles)
+    for row, family in rows:
+        weights[row]+=1
+
+    if not os.path.exists(dst_dir_path):
+        os.makedirs(dst_dir_path)
+    for file_name in ["nem_file.dat", "nem_file.index", "nem_file.nei", "nem_file.str", "nem_file.wei"]:
+        if os.path.lexists(dst_dir_path+"/"+file_name):
+            os.remove(dst_dir_path+"/"+file_name)# the files can be hard links to the ones of another directory
+    with open(dst_dir_path+"/nem_file.dat", "w") as dat_file:
+        dat_file.write("".join(profiles.keys()))
+    with open(dst_dir_path+"/nem_file.index", "w") as index_file:
+        for row, family in rows:
+            index_file.write(str(row+1)+"\t"+family+"\n")
+    with open(dst_dir_path+"/nem_file.nei", "w") as nei_file:
+        nei_file.write("1\n")
+        for row in range(len(profiles)):
+            nei_file.write(str(row+1)+"\t0\n")
+    with open(dst_dir_path+"/nem_file.wei", "w") as wei_file:
+        wei_file.write("\n".join([str(weight) for weight in weights])+"\n")
+    with open(dst_dir_path+"/nem_file.str", "w") as str_file:
+        str_file.write("S\t"+str(len(profiles))+"\t"+nb_org+"\n")
+    logging.getLogger().debug(str(len(rows))+" families collapsed in "+str(len(profiles))+" unique presence/absence profiles")
+    return(len(profiles))
+
+################ FUNCTION add_gene_to_node ################
+def add_gene_to_node(graph, fam_id, org, gene, name, length, product):
+    """
+        Add a gene to the node of its family (created if required) updating the aggregated attributes of the node (see PPanGGOLiN.__add_gene)
+    """
+    data = graph.nodes.get(fam_id)
+    if data is None:
+        graph.add_node(fam_id)
+        data = graph.nodes[fam_id]
+    if "nb_genes" not in data:
+        data["nb_genes"] = 1
+        data[org]        = set([gene])
+        data["name"]     = set([name])
+        data["product"]  = set([product])
+        data["length"]   = LengthStats([length])
+        return
+    data["nb_genes"] += 1
+    genes = data.get(org)
+    if genes is None:
+        data[org] = set([gene])
+    else:
+        genes.add(gene)
+    data["name"].add(name)
+    data["product"].add(product)
+    data["length"].add(length)
+
+################ FUNCTION add_link_to_edge ################
+def add_link_to_edge(graph, fam_id, fam_id_nei, org, length):
+    """
+        Add a link supported by an organism between two families (the edge is created if required) updating the aggregated attributes of the edge (see PPanGGOLiN.__add_link)
+    """
+    edge = graph.adj[fam_id].get(fam_id_nei) if fam_id in graph else None
+    if edge is None:
+        graph.add_edge(fam_id, fam_id_nei)
+        edge = graph.adj[fam_id][fam_id_nei]
+    count = edge.get(org)
+    if count is None:
+        edge[org]      = 1
+        edge["weight"] = edge.get("weight", 0.0)+1.0
+    else:
+        edge[org]      = count+1
+    lengths = edge.get("length")
+    if lengths is None:
+        edge["length"] = LengthStats([length])
+    else:
+        lengths.add(length)
+
+################ FUNCTION merge_graphs ################
+def merge_graphs(graph, other_graph, organisms):
+    """
+        Add the nodes and the edges of a pangenome graph built from other organisms to a pangenome graph (see add_gene_to_node and add_link_to_edge), the aggregated attributes are merged
+        :param graph: the networkx graph to update
+        :param other_graph: the networkx graph to add (not modified)
+        :param organisms: the organisms of other_graph (they must be absent of graph)
+        :type networkx.Graph:
+        :type networkx.Graph:
+        :type iterable:
+    """
+    organisms = set(organisms)
+    for fam_id, other_data in other_graph.nodes(data=True):
+        data = graph.nodes.get(fam_id)
+        if data is None:
+            graph.add_node(fam_id)
+            data = graph.nodes[fam_id]
+        for key, value in other_data.items():
+            if key == "nb_genes":
+                data[key] = data.get(key, 0)+value
+            elif key == "name" or key == "product":
+                data.setdefault(key, set()).update(value)
+            elif key == "length":
+                data.setdefault(key, LengthStats()).merge(value)
+            elif key in organisms:
+                data[key] = set(value)
+    for fam_id, fam_id_nei, other_edge in other_graph.edges(data=True):
+        edge = graph.adj[fam_id].get(fam_id_nei)
+        if edge is None:
+            graph.add_edge(fam_id, fam_id_nei)
+            edge = graph.adj[fam_id][fam_id_nei]
+        for key, value in other_edge.items():
+            if key == "weight":
+                edge[key] = edge.get(key, 0.0)+value
+            elif key == "length":
+                edge.setdefault(key, LengthStats()).merge(value)
+            elif key in organisms:
+                edge[key] = value
+
+################ FUNCTION read_shard_header ################
+def read_shard_header(shard_file_path):
+    """
+        Read the header of a shard file written by PPanGGOLiN.write_shard
+        :param shard_file_path: a str containing the path of the shard file
+        :type str:
+        :return: a dict giving the organisms of the shard ("organisms"), the size of their circular contigs ("circular_contig_size"), the families removed because highly repeated ("families_repeted") and if the graph is directed ("directed")
+        :rtype: dict
+    """
+    with open(shard_file_path,"rb") as shard_file:
+        try:
+            header = pickle.load(shard_file)
+        except (pickle.UnpicklingError, EOFError):
+            raise ValueError(shard_file_path+" is not a shard file")
+    if not isinstance(header, dict) or header.get("format") != SHARD_FORMAT:
+        raise ValueError(shard_file_path+" is not a shard file of the format "+str(SHARD_FORMAT))
+    return(header)
+
+################ FUNCTION file_hash ################
+def file_hash(file_path, block_size = 2**20):
+    """
+        Return the SHA-1 hash of the content of a file
+        :param file_path: a str containing the path of the file
+        :type str:
+        :rtype: str
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path,"rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            sha1.update(block)
+    return(sha1.hexdigest())
+
+################ FUNCTION count_families_occurences ################
+def count_families_occurences(gff_file_path, families):
+    """
+        Count the number of copies of each family in a gff file without loading its annotations
+        :param gff_file_path: a valid gff file path (see PPanGGOLiN.__load_gff)
+        :param families: a dictionary having the gene as key and the identifier of the associated family as value
+        :type str:
+        :type dict:
+        :return: a Counter having the families as keys and their number of genes as value (the genes absent of families are ignored)
+        :rtype: Counter
+    """
+    occurences = Counter()
+    with read_compressed_or_not(gff_file_path) as gff_file:
+        for line in gff_file:
+            if line.startswith('##',0,2):
+                if line.startswith('FASTA',2,7):
+                    break
+                continue
+            gff_fields = line.split('\t')
+            if len(gff_fields) > GFF_attribute and gff_fields[GFF_feature] == 'CDS':
+                for att in gff_fields[GFF_attribute].strip().split(';'):
+                    (key, _, value) = att.strip().partition('=')
+                    if key.upper() == "ID":
+                        if value in families:
+                            occurences[families[value]]+=1
+                        break
+    return(occurences)
+
+################ FUNCTION derive_seed ################
+def derive_seed(seed, *keys):
+    """
+        Derive a seed from a seed and some keys identifying a task (e.g. "chunk", 12) so that each task has its own random generator whatever the order of execution of the tasks
+        :param seed: an int
+        :param keys: ints or strs identifying the task
+        :type int:
+        :type list:
+        :return: the seed of the task
+        :rtype: int
+    """
+    return(Random("_".join([str(key) for key in (seed,)+keys])).randrange(0, 2**31))
+
+################ FUNCTION subset_probabilities ################
+def subset_probabilities(nb_items, k):
+    """
+        Probabilities that a random subset of k items drawn without replacement among nb_items is included in a given set of m items, for m from 0 to nb_items
+        :param nb_items: an int
+        :param k: an int (size of the subset)
+        :type int:
+        :type int:
+        :return: probabilities: a list of float giving C(m,k)/C(nb_items,k) at the index m
+        :rtype: list
+    """
+    probabilities = [0.0]*(nb_items+1)
+    probabilities[nb_items] = 1.0
+    for m in range(nb_items, k, -1):# C(m-1,k)/C(m,k) = (m-k)/m, computed from the top to avoid overflows
+        probabilities[m-1] = probabilities[m]*(m-k)/m
+    return(probabilities)
+
+################ FUNCTION write_partition_checkpoint ################
+def write_partition_checkpoint(checkpoint_path, signature, cpt_partition, validated, nb_chunks, random_state):
+    """
+        Save the state of a partitioning by chunks (the file is replaced atomically so that a killed run always leaves a readable checkpoint)
+        :param checkpoint_path: a str containing the path of the checkpoint file
+        :param signature: a tuple identifying the parameters of the partitioning (organisms, chunck_size, beta, free_dispersion, seed)
+        :param cpt_partition: a dict having the families as keys and the votes of the chunks for each partition as value
+        :param validated: a set containing the families having a validated partition
+        :param nb_chunks: an int providing the number of chunks already sampled
+        :param random_state: the state of the random generator used to sample the chunks
+        :type str:
+        :type tuple:
+        :type dict:
+        :type set:
+        :type int:
+        :type tuple:
+    """
+    with open(checkpoint_path+".tmp","wb") as checkpoint_file:
+        pickle.dump({"signature"     : signature,
+                     "cpt_partition" : cpt_partition,
+                     "validated"     : validated,
+                     "nb_chunks"     : nb_chunks,
+                     "random_state"  : random_state}, checkpoint_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(checkpoint_path+".tmp", checkpoint_path)
+
+################ FUNCTION read_partition_checkpoint ################
+def read_partition_checkpoint(checkpoint_path, signature):
+    """
+        Read a checkpoint written by write_partition_checkpoint
+        :param checkpoint_path: a str containing the path of the checkpoint file
+        :param signature: a tuple identifying the parameters of the current partitioning
+        :type str:
+        :type tuple:
+        :return: a tuple (cpt_partition, validated, nb_chunks, random_state) or None if there is no checkpoint or if it was written with other parameters
+        :rtype: tuple
+    """
+    if not os.path.isfile(checkpoint_path):
+        logging.getLogger().warning("No checkpoint found in "+checkpoint_path+", the partitioning starts from scratch")
+        return(None)
+    with open(checkpoint_path,"rb") as checkpoint_file:
+        checkpoint = pickle.load(checkpoint_file)
+    if checkpoint["signature"] != signature:
+        logging.getLogger().warning("The checkpoint "+checkpoint_path+" was written with other parameters, the partitioning starts from scratch")
+        return(None)
+    return((checkpoint["cpt_partition"], checkpoint["validated"], checkpoint["nb_chunks"], checkpoint["random_state"]))
+
+################ FUNCTION write_nem_param_file ################
+def write_nem_param_file(param_file_path, parameters, min_value = 0.0001, fixed = False):
+    """
+        Write a NEM parameter file (.m) initializing a fit with the parameters of a previous one (as returned by run_partitioning)
+        :param param_file_path: a str containing the path of the .m file
+        :param parameters: a dict having the classes as keys and a tuple (mu_k, epsilon_k, proportion_k) as value
+        :param min_value: a float used as lower bound of the proportions and the dispersions (NEM refuses null values)
+        :param fixed: a bool specifying if the parameters are kept during all the clustering process (no M-step) instead of only initializing it
+        :type str:
+        :type dict:
+        :type float:
+        :type bool:
+    """
+    classes     = sorted(parameters)
+    proportions = [max(parameters[k][PROPORTION], min_value) for k in classes]
+    proportions = [p/sum(proportions) for p in proportions]
+    with open(param_file_path, "w") as m_file:
+        m_file.write("2 " if fixed else "1 ")# 1 to initialize parameter, 2 to fix them
+        m_file.write(" ".join([str(round(p, 6)) for p in proportions[:-1]])+" ")
+        for k in classes:
+            m_file.write(" ".join(["1" if mu else "0" for mu in parameters[k][MU]])+" ")
+        m_file.write(" ".join([" ".join([str(max(epsilon, min_value)) for epsilon in parameters[k][EPSILON]]) for k in classes]))
+
+################ FUNCTION write_partition_model ################
+def write_partition_model(model_path, model):
+    """
+        Save a fitted partition model (the partition_model attribute of a PPanGGOLiN object) to be applied later using classify
+        :param model_path: a str containing the path of the model file
+        :param model: a dict containing the organisms used, the parameters of each class, beta and free_dispersion
+        :type str:
+        :type dict:
+    """
+    with open(model_path+".tmp","wb") as model_file:
+        pickle.dump(model, model_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(model_path+".tmp", model_path)
+
+################ FUNCTION read_partition_model ################
+def read_partition_model(model_path):
+    """
+        Read a partition model written by write_partition_model
+        :param model_path: a str containing the path of the model file
+        :type str:
+        :return: a dict containing the organisms used, the parameters of each class, beta and free_dispersion
+        :rtype: dict
+    """
+    with open(model_path,"rb") as model_file:
+        return(pickle.load(model_file))
+
+################ FUNCTION run_partitioning_sweep ################
+def run_partitioning_sweep(nem_dir_path, nb_org, beta, free_dispersion, Q_range = (3,), init = "random", nb_starts = 1, seed = None, nb_threads = 1, criterion = "BIC"):
+    """
+        Run several independent seeded NEM fits for each number of classes of Q_range on the same input files (already written once in nem_dir_path) and keep the best one for each number of classes
+        All the fits are executed concurrently, each one in its own subdirectory of nem_dir_path
+        :param Q_range: a list of int specifying the numbers of classes to fit
+        :param nb_starts: an int specifying the number of NEM runs for each number of classes (the seed of each one is derived from seed, the number of classes and its index, see derive_seed)
+        :param seed: an int used to derive the seed of each run (None means a random seed)
+        :param nb_threads: an int specifying the number of runs executed concurrently
+        :param criterion: a str specifying how the best run is chosen: "BIC" or "ICL" (the lowest) or one of the NEM criteria "U","D","L","M" (the highest)
+        :type list:
+        :type int:
+        :type int:
+        :type int:
+        :type str:
+        :return: a dict having the numbers of classes as keys and as value a tuple containing the result of the best run (same as run_partitioning) and a dict reporting the seeds, the criteria and the adjusted Rand index of each run compared to the best one
+        :rtype: dict
+    """
+    if seed is None:
+        seed = randrange(0, 2**31)
+    seeds = dict([(Q, [derive_seed(seed, "start", Q, i) for i in range(nb_starts)]) for Q in Q_range])
+    args = [(nem_dir_path+"/Q"+str(Q)+"_start"+str(i)+"/", nb_org, beta, free_dispersion, Q, init, s) for Q in Q_range for i, s in enumerate(seeds[Q])]
+    for run_args in args:
+        link_nem_input_files(nem_dir_path, run_args[0])
+
+    if nb_threads > 1 and len(args) > 1:
+        with contextlib.closing(Pool(processes = min(nb_threads, len(args)))) as pool:
+            all_results = pool.starmap(run_partitioning, args)
+    else:
+        all_results = [run_partitioning(*run_args) for run_args in args]
+
+    fits = {}
+    for n, Q in enumerate(Q_range):
+        results = all_results[n*nb_starts:(n+1)*nb_starts]
+        scores  = [criterion_score(res[PARTITION_CRITERIA], criterion) for res in results]
+        best    = scores.index(min(scores))
+
+        families    = list(results[best][FAMILIES_PARTITION].keys())
+        best_labels = [results[best][FAMILIES_PARTITION][fam] for fam in families]
+        report = {"seeds"     : seeds[Q],
+                  "best"      : best,
+                  "criterion" : criterion,
+                  "criteria"  : [res[PARTITION_CRITERIA] for res in results],
+                  "ARI"       : [adjusted_rand_index(best_labels, [res[FAMILIES_PARTITION][fam] for fam in families]) for res in results]}
+        if nb_starts > 1:
+            logging.getLogger().info("Q="+str(Q)+", "+str(nb_starts)+" NEM starts: best start is "+str(best)+" (seed="+str(seeds[Q][best])+", "+criterion+"="+str(results[best][PARTITION_CRITERIA].get(criterion))+"), "+
+                                     "mean adjusted Rand index with the best start: "+str(round(mean([ari for i, ari in enumerate(report["ARI"]) if i != best]),4)))
+        fits[Q] = (results[best], report)
+    return(fits)
+
+################ FUNCTION run_partitioning_multistart ################
+def run_partitioning_multistart(nem_dir_path, nb_org, beta, free_dispersion, Q = 3, init = "random", nb_starts = 1, seed = None, nb_threads = 1, criterion = "BIC"):
+    """
+        Run several independent seeded NEM fits on the same input files (already written in nem_dir_path) and keep the best one (see run_partitioning_sweep)
+        :return: the result of the best run (same as run_partitioning) and a dict reporting the seeds, the criteria and the adjusted Rand index of each run compared to the best one
+        :rtype: tuple
+    """
+    return(run_partitioning_sweep(nem_dir_path, nb_org, beta, free_dispersion, [Q], init, nb_starts, seed, nb_threads, criterion)[Q])
+
+################ FUNCTION criterion_score ################
+def criterion_score(criteria, criterion = "BIC"):
+    """
+        Return a score to minimize from the criteria returned by run_partitioning (failed runs get an infinite score)
+        :param criteria: a dict of criteria as returned by run_partitioning
+        :param criterion: a str: "BIC" or "ICL" (to minimize) or one of the NEM criteria "U","D","L","M" (to maximize)
+        :type dict:
+        :type str:
+        :return: the score
+        :rtype: float
+    """
+    if criterion not in criteria:
+        return(float("Inf"))
+    if criterion in ("BIC","ICL"):
+        return(criteria[criterion])
+    return(-criteria[criterion])
 
 ################ END OF FILE ################
\ No newline at end of file
@@ -9,6 +9,20 @@ import math
 from random import sample
 from io import TextIOWrapper
 import mmap
+import importlib.util
+
+""" import a module at its first use (its name is bound to a module object which executes the module when one of its attributes is accessed), used for the heavy modules so that the command line starts quickly"""
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return(module)
+    spec   = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return(module)
 
 """ argument can be a file descriptor (compressed or not) or file path (compressed or not) and return a readable file descriptor"""
 def read_compressed_or_not(file_or_file_path):
@@ -77,6 +91,10 @@ def samplingCombinations(items, sample_ratio, sample_min, sample_max=100, step =
             i+=1
     return samplingCombinationList
 
+"""number of bits set to 1 in a positive integer"""
+def popcount(number):
+    return bin(number).count("1")
+
 """simple arithmetic mean"""
 def mean(numbers):
     return float(sum(numbers)) / max(len(numbers), 1)
@@ -93,6 +111,113 @@ def median(numbers):
         i = n//2
         return (numbers[i - 1] + numbers[i])/2
 
+"""adjusted Rand index between two labelings of the same items (1 means the same partition whatever the names of the labels, about 0 means a random agreement)"""
+def adjusted_rand_index(labels_a, labels_b):
+    n = len(labels_a)
+    if n < 2:
+        return 1.0
+    contingency = defaultdict(int)
+    count_a = defaultdict(int)
+    count_b = defaultdict(int)
+    for a, b in zip(labels_a, labels_b):
+        contingency[(a,b)]+=1
+        count_a[a]+=1
+        count_b[b]+=1
+    sum_comb   = sum([c*(c-1)/2 for c in contingency.values()])
+    sum_comb_a = sum([c*(c-1)/2 for c in count_a.values()])
+    sum_comb_b = sum([c*(c-1)/2 for c in count_b.values()])
+    expected   = sum_comb_a*sum_comb_b/(n*(n-1)/2)
+    maximum    = (sum_comb_a+sum_comb_b)/2
+    if maximum == expected:
+        return 1.0
+    return (sum_comb-expected)/(maximum-expected)
+
+"""streaming statistics of a series of values (count, sum, sum of squares, min, max and a bounded histogram used as quantile sketch) replacing the storage of all the values"""
+class LengthStats:
+    __slots__ = ("count", "sum", "sum_squares", "min", "max", "sketch")
+    SKETCH_SIZE = 64# maximum number of bins of the histogram (exact while the number of distinct values does not exceed it)
+
+    def __init__(self, values = ()):
+        self.count       = 0
+        self.sum         = 0
+        self.sum_squares = 0
+        self.min         = None
+        self.max         = None
+        self.sketch      = {}# value -> number of occurences
+        for value in values:
+            self.add(value)
+
+    def add(self, value, count = 1):
+        self.count       += count
+        self.sum         += value*count
+        self.sum_squares += value*value*count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.sketch[value] = self.sketch.get(value, 0)+count
+        if len(self.sketch) > 2*LengthStats.SKETCH_SIZE:
+            self.compact()
+
+    def merge(self, other):
+        """add the values summarized by another LengthStats"""
+        if other.count == 0:
+            return
+        self.count       += other.count
+        self.sum         += other.sum
+        self.sum_squares += other.sum_squares
+        self.min          = other.min if self.min is None else min(self.min, other.min)
+        self.max          = other.max if self.max is None else max(self.max, other.max)
+        for value, count in other.sketch.items():
+            self.sketch[value] = self.sketch.get(value, 0)+count
+        if len(self.sketch) > 2*LengthStats.SKETCH_SIZE:
+            self.compact()
+
+    def compact(self):
+        """regroup the consecutive bins of the histogram in SKETCH_SIZE bins having about the same number of values (each group is replaced by its weighted mean)"""
+        target = float(self.count) / LengthStats.SKETCH_SIZE
+        sketch = {}
+        (group_sum, group_count) = (0, 0)
+        for value, count in sorted(self.sketch.items()):
+            group_sum   += value*count
+            group_count += count
+            if group_count >= target:
+                sketch[group_sum/group_count] = sketch.get(group_sum/group_count, 0)+group_count
+                (group_sum, group_count) = (0, 0)
+        if group_count > 0:
+            sketch[group_sum/group_count] = sketch.get(group_sum/group_count, 0)+group_count
+        self.sketch = sketch
+
+    def mean(self):
+        return float(self.sum) / max(self.count, 1)
+
+    def variance(self):
+        if self.count == 0:
+            return(None)
+        return max(float(self.sum_squares) / self.count - self.mean()**2, 0.0)
+
+    def median(self):
+        """median of the values (exact while the histogram was not compacted), the mean of the two middle values if the number of values is even"""
+        if self.count == 0:
+            return(None)
+        (low, high) = ((self.count-1)//2, self.count//2)
+        (low_value, high_value) = (None, None)
+        seen = 0
+        for value, count in sorted(self.sketch.items()):
+            if low_value is None and seen+count > low:
+                low_value = value
+            if seen+count > high:
+                high_value = value
+                break
+            seen += count
+        return (low_value+high_value)/2
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return "LengthStats(count="+str(self.count)+", min="+str(self.min)+", max="+str(self.max)+", mean="+str(self.mean())+")"
+
 def standard_deviation(lst, population=True):
     """Calculates the standard deviation for a list of numbers.
     from https://codeselfstudy.com/blogs/how-to-calculate-standard-deviation-in-python"""
@@ -23,8 +23,34 @@ NEM_dir_path = name+"/NEM/"
 def read(fname):
     return open(os.path.join(os.path.dirname(__file__), fname)).read()
 
+def openmp_flags():
+    """ return the compiler and linker flags enabling OpenMP in NEM if the compiler supports them (empty if not or if the environment variable PPANGGOLIN_NO_OPENMP is set, NEM is then sequential)"""
+    if os.environ.get("PPANGGOLIN_NO_OPENMP"):
+        return([])
+    import tempfile, shutil
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import CompileError, LinkError
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        test_file = os.path.join(tmp_dir, "test_openmp.c")
+        with open(test_file, "w") as test:
+            test.write("#include <omp.h>\nint main(void){ return omp_get_max_threads() > 0 ? 0 : 1; }\n")
+        objects = compiler.compile([test_file], output_dir = tmp_dir, extra_postargs = ["-fopenmp"])
+        compiler.link_executable(objects, os.path.join(tmp_dir, "test_openmp"), extra_postargs = ["-fopenmp"])
+    except (CompileError, LinkError):
+        print("OpenMP is not supported by the compiler, NEM will be sequential")
+        return([])
+    finally:
+        shutil.rmtree(tmp_dir)
+    return(["-fopenmp"])
+
 if __name__ == "__main__":
 
+    OPENMP_FLAGS = openmp_flags()
+
     setup(
         name = name,
         version = read("VERSION").rstrip(),
@@ -51,7 +77,7 @@ if __name__ == "__main__":
             'console_scripts': [
             name+' = '+name+'.command_line:__main__'
           ]},
-        install_requires= ['cython', 'ordered-set', 'bidict', 'networkx >= 2.0', 'fa2', 'tqdm', 'python-highcharts','futures;python_version=="2.7"'],
+        install_requires= ['cython', 'ordered-set', 'networkx >= 2.0', 'fa2', 'tqdm', 'python-highcharts','futures;python_version=="2.7"'],
         ext_modules = cythonize([Extension(name = "nem",sources =[NEM_dir_path+'nem.pyx',
                                                                   NEM_dir_path+'nem_exe.c',
                                                                   NEM_dir_path+'nem_alg.c',
@@ -61,4 +87,6 @@ if __name__ == "__main__":
                                                                   NEM_dir_path+'lib_io.c',
                                                                   NEM_dir_path+'nem_hlp.c',
                                                                   NEM_dir_path+'genmemo.c'],
-                                                        include_dirs=[NEM_dir_path])]))
\ No newline at end of file
+                                                        include_dirs=[NEM_dir_path],
+                                                        extra_compile_args=OPENMP_FLAGS,
+                                                        extra_link_args=OPENMP_FLAGS)]))
\ No newline at end of file